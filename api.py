@@ -0,0 +1,300 @@
+"""
+ブラウザを使わずに見積もり・予約を行うHTTP JSON API（ASGIアプリ）
+任意のASGIサーバーで起動する。予約キューのジャーナルはプロセス毎に別のファイルを使うので、画面（app.py）や複数のワーカーと同じDBを使ってよい
+    uvicorn api:app
+- POST /quote         {"category": "SUV", "budget": 5000000, "hour": 2, "age": 5, "limit": 20, "offset": 0}
+- POST /quotes        {"profiles": [見積もり条件, ...]}  複数の条件をまとめて見積もる
+- POST /reservations  {"name", "email", "prefecture", "grade_id", "color_ids", "interior_ids", "exterior_ids"}
+- GET  /health        カタログのバージョン
+- GET  /metrics       リクエスト数・処理時間・キャッシュ・予約キューの統計（予約キューは予約を受け付けるまではnull）
+"""
+import asyncio
+import json
+import queue
+import time
+from collections import OrderedDict
+
+from data_manager.data_manager import DataManager
+from page_manager.stage_profiler import LatencyHistogram
+from domain_context.db_config import DB_NAME
+from domain_context.default_values import AGE_RANGE, HOUR_RANGE
+from domain_context.api_config import (
+    API_CACHE_SIZE,
+    API_DEFAULT_LIMIT,
+    API_MAX_LIMIT,
+    API_MAX_BATCH,
+    API_MAX_BODY_BYTES,
+    API_RETRY_AFTER_SECONDS,
+)
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message, headers=()) -> None:
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.headers = list(headers)
+
+
+class QuoteService(DataManager):
+    """
+    プロセス共有のカタログから見積もりを計算するクラス
+    - 結果はカタログのバージョンと検索条件をキーにLRUでキャッシュするので、カタログを読み直すと自然に無効になる
+    - 同じ条件の見積もりが同時に来た場合は1回だけ計算し、結果を共有する（シングルフライト）
+    """
+
+    def __init__(self, dbname=DB_NAME, cache_size=API_CACHE_SIZE) -> None:
+        super().__init__()
+        self.dbname = dbname
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._in_flight = {}
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.coalesced = 0
+
+    def parse_profile(self, body):
+        """
+        見積もり条件を検証して (category, budget, hour, age, limit, offset) にする。不正な場合はHTTPError(400)
+        """
+        if not isinstance(body, dict):
+            raise HTTPError(400, "quote profile must be a JSON object")
+        category = body.get("category")
+        if not isinstance(category, str):
+            raise HTTPError(400, "category must be a string")
+        budget = self._int_field(body, "budget", 0, None)
+        hour = self._int_field(body, "hour", *HOUR_RANGE)
+        age = self._int_field(body, "age", *AGE_RANGE)
+        limit = self._int_field(body, "limit", 1, API_MAX_LIMIT, API_DEFAULT_LIMIT)
+        offset = self._int_field(body, "offset", 0, None, 0)
+        return category, budget, hour, age, limit, offset
+
+    def _int_field(self, body, name, minimum, maximum, default=None):
+        value = body.get(name, default)
+        if isinstance(value, bool) or not isinstance(value, int):
+            raise HTTPError(400, f"{name} must be an integer")
+        if maximum is not None and not minimum <= value <= maximum:
+            raise HTTPError(400, f"{name} must be between {minimum} and {maximum}")
+        if value < minimum:
+            raise HTTPError(400, f"{name} must be at least {minimum}")
+        return value
+
+    async def quote(self, profile):
+        catalog = self.get_catalog()
+        key = (catalog.version, *profile)
+        cached = self._cache.get(key)
+        if cached is not None:
+            self._cache.move_to_end(key)
+            self.cache_hits += 1
+            return cached
+        in_flight = self._in_flight.get(key)
+        if in_flight is not None:
+            self.coalesced += 1
+            return await asyncio.shield(in_flight)
+
+        self.cache_misses += 1
+        future = asyncio.get_running_loop().run_in_executor(None, self._search, catalog, *profile)
+        self._in_flight[key] = future
+        try:
+            result = await future
+        finally:
+            del self._in_flight[key]
+        self._cache[key] = result
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return result
+
+    def _search(self, catalog, category, budget, hour, age, limit, offset):
+        df = self.search_grades(
+            catalog.df_models, category, catalog.df_grades, budget, age, hour, limit=limit, offset=offset
+        )
+        grades = []
+        if df is not None:
+            for row in df.itertuples(index=False):
+                grades.append(
+                    {
+                        "grade_id": int(row.grade_id),
+                        "name": row.name_desc,
+                        "image_url": row.image_url,
+                        "monthly_real_cost": int(row.MonthlyRealCost),
+                        "monthly_total_cost": int(row.MonthlyTotalCost),
+                        "resale_value": int(row.ResaleValue),
+                        "rank": int(row.rank),
+                    }
+                )
+        return {"catalog_version": catalog.version, "count": len(grades), "grades": grades}
+
+    def reserve(self, body):
+        """
+        予約を書き込みキューに積んで受付番号を返す。グレードのベースはカタログから引く
+        """
+        if not isinstance(body, dict):
+            raise HTTPError(400, "reservation must be a JSON object")
+        for name in ("name", "email", "prefecture"):
+            if not isinstance(body.get(name), str) or not body[name]:
+                raise HTTPError(400, f"{name} must be a non-empty string")
+        grade_id = self._int_field(body, "grade_id", 1, None)
+        option_ids = {}
+        for name in ("color_ids", "interior_ids", "exterior_ids"):
+            ids = body.get(name, [])
+            if not isinstance(ids, list) or not all(isinstance(i, int) and not isinstance(i, bool) for i in ids):
+                raise HTTPError(400, f"{name} must be a list of integers")
+            # 画面と同じく、オプションを選ばなかった場合はNoneを1件登録する
+            option_ids[name] = ids or [None]
+
+        df_grades = self.get_catalog().df_grades
+        grade_lookup = self.get_grade_lookup(df_grades)
+        if grade_id not in grade_lookup:
+            raise HTTPError(404, f"grade {grade_id} was not found")
+        base_id = df_grades["base_id"].iloc[grade_lookup.position(grade_id)]
+        # 外装・内装は画面と同じく、そのグレードで選択可能なものだけを受け付ける
+        for name, kind in (("exterior_ids", "exterior"), ("interior_ids", "interior")):
+            available = self.get_option_repository().ids(kind, grade_id)
+            unavailable = [i for i in option_ids[name] if i is not None and i not in available]
+            if unavailable:
+                raise HTTPError(400, f"{name} {unavailable} are not available for grade {grade_id}")
+        try:
+            reservation_id = self.enqueue_user_customization(
+                name=body["name"],
+                email=body["email"],
+                prefecture=body["prefecture"],
+                baseid=base_id,
+                colorids=option_ids["color_ids"],
+                interiorids=option_ids["interior_ids"],
+                exteriorids=option_ids["exterior_ids"],
+            )
+        except queue.Full:
+            raise HTTPError(503, "reservation queue is full", [(b"retry-after", str(API_RETRY_AFTER_SECONDS).encode())])
+        return {"reservation_id": reservation_id}
+
+    def cache_stats(self):
+        total = self.cache_hits + self.cache_misses
+        return {
+            "size": len(self._cache),
+            "hits": self.cache_hits,
+            "misses": self.cache_misses,
+            "coalesced": self.coalesced,
+            "hit_rate": self.cache_hits / total if total else 0.0,
+        }
+
+
+class QuoteAPI:
+    """
+    QuoteServiceをHTTP JSONで公開するASGIアプリ
+    """
+
+    def __init__(self, service=None) -> None:
+        self.service = service if service is not None else QuoteService()
+        self.routes = {
+            ("POST", "/quote"): self.quote,
+            ("POST", "/quotes"): self.quotes,
+            ("POST", "/reservations"): self.reservations,
+            ("GET", "/health"): self.health,
+            ("GET", "/metrics"): self.metrics,
+        }
+        self.latencies = {}
+        self.responses = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+        start = time.perf_counter()
+        path = scope["path"]
+        headers = [(b"content-type", b"application/json")]
+        try:
+            handler = self.routes.get((scope["method"], path))
+            if handler is None:
+                if any(route_path == path for _, route_path in self.routes):
+                    raise HTTPError(405, f"method {scope['method']} is not allowed")
+                raise HTTPError(404, f"{path} was not found")
+            status, payload = await handler(receive)
+        except HTTPError as e:
+            status, payload = e.status, {"error": e.message}
+            headers += e.headers
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
+        self._record(path, status, time.perf_counter() - start)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                # 最初のリクエストを待たずにカタログを読み込んでおく
+                await asyncio.get_running_loop().run_in_executor(None, self.service.get_catalog)
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.service.close_reservation_queue()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    def _record(self, path, status, seconds):
+        route = path if any(route_path == path for _, route_path in self.routes) else "other"
+        if route not in self.latencies:
+            self.latencies[route] = LatencyHistogram()
+        self.latencies[route].record(seconds)
+        key = f"{route} {status}"
+        self.responses[key] = self.responses.get(key, 0) + 1
+
+    async def _read_json(self, receive):
+        chunks = []
+        size = 0
+        more_body = True
+        while more_body:
+            message = await receive()
+            chunk = message.get("body", b"")
+            size += len(chunk)
+            if size > API_MAX_BODY_BYTES:
+                raise HTTPError(413, "request body is too large")
+            chunks.append(chunk)
+            more_body = message.get("more_body", False)
+        try:
+            return json.loads(b"".join(chunks) or b"null")
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            raise HTTPError(400, "request body must be JSON")
+
+    async def quote(self, receive):
+        profile = self.service.parse_profile(await self._read_json(receive))
+        return 200, await self.service.quote(profile)
+
+    async def quotes(self, receive):
+        body = await self._read_json(receive)
+        profiles = body.get("profiles") if isinstance(body, dict) else None
+        if not isinstance(profiles, list) or not 0 < len(profiles) <= API_MAX_BATCH:
+            raise HTTPError(400, f"profiles must be a list of 1 to {API_MAX_BATCH} quote profiles")
+        parsed = [self.service.parse_profile(profile) for profile in profiles]
+        results = await asyncio.gather(*(self.service.quote(profile) for profile in parsed))
+        return 200, {"results": results}
+
+    async def reservations(self, receive):
+        body = await self._read_json(receive)
+        # ジャーナルへの追記（fsync）でイベントループを止めないようにスレッドで行う
+        return 202, await asyncio.get_running_loop().run_in_executor(None, self.service.reserve, body)
+
+    async def health(self, receive):
+        catalog = self.service.get_catalog()
+        return 200, {"status": "ok", "catalog_version": catalog.version}
+
+    async def metrics(self, receive):
+        catalog = self.service.get_catalog()
+        return 200, {
+            "catalog_version": catalog.version,
+            "catalog_memory": catalog.memory_report,
+            "responses": dict(sorted(self.responses.items())),
+            "latency_ms": {
+                route: {
+                    key: value * 1000 if key in ("total", "mean", "p50", "p95", "p99", "max") else value
+                    for key, value in histogram.summary().items()
+                }
+                for route, histogram in sorted(self.latencies.items())
+            },
+            "cache": self.service.cache_stats(),
+            "option_cache": self.service.get_option_repository().stats(),
+            "reservation_queue": self.service.reservation_queue_metrics(),
+        }
+
+
+app = QuoteAPI()
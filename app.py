@@ -1,6 +1,8 @@
 from page_manager.page import UserInputDisplay, SearchResultDisplay, ResultComparison, BookAddOptions
 from session_manager.user_session import UserSession
+from page_manager.base_page import StageTimingPanel
 from domain_context.default_values import DEFAULT_VALUES
+from domain_context.profile_config import STAGE_TIMING_PANEL
 
 user_session = UserSession()
 user_session.set_default_values(DEFAULT_VALUES)
@@ -11,4 +13,7 @@ if user_session.user_request_ready():
 
 if user_session.user_choice_ready():
     ResultComparison().run()
-    BookAddOptions().run()
\ No newline at end of file
+    BookAddOptions().run()
+
+if STAGE_TIMING_PANEL:
+    StageTimingPanel().run()
@@ -0,0 +1,263 @@
+"""
+顧客プロファイル（カテゴリー・年間予算・1日の乗車時間・使用年数）の一覧に対して、予算に合うグレードをまとめて見積もるCLI
+入力はCSVまたはJSONLで、1行ずつ読みながらチャンク毎にプロセスプールで計算し、結果を順番どおりに書き出す
+カタログは各ワーカープロセスの起動時に1回だけ読み込む
+    python batch_quote.py profiles.csv --output quotes.jsonl
+    python batch_quote.py profiles.jsonl --output quotes.csv --limit 3 --workers 8
+入力の列: category, budget, hour, age（idなどその他の列はそのまま出力に引き継ぐ。CSV出力ではCSV入力のヘッダーにある列とidだけを引き継ぐ）
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from data_manager.data_manager import DataManager
+from data_manager.cost_engine import CostEngine, BudgetIndex
+from domain_context.db_config import DB_NAME
+from domain_context.default_values import AGE_RANGE, HOUR_RANGE
+
+PROFILE_FIELDS = ("category", "budget", "hour", "age")
+MATCH_FIELDS = ("match_rank", "grade_id", "name", "monthly_real_cost", "monthly_total_cost", "resale_value")
+# CSV出力で入力から引き継ぐ列。CSV入力の場合はヘッダーのその他の列も引き継ぐ
+EXTRA_FIELDS = ("id",)
+DEFAULT_LIMIT = 5  # 1プロファイルあたりに出力するグレード数
+DEFAULT_CHUNK_SIZE = 500  # 1回にワーカーへ渡すプロファイル数
+
+# ワーカープロセス毎に1回だけ作るCatalogQuoter
+_worker = {}
+
+
+class CatalogQuoter:
+    """
+    カタログから見積もりを行うクラス。DataManager.search_gradesと同じBudgetIndex・CostEngineで検索し、
+    プロファイル毎にデータフレームを作らずに配列から直接結果を組み立てる
+    """
+
+    def __init__(self, catalog) -> None:
+        df_grades = catalog.df_grades
+        self.budget_index = df_grades.get_derived(BudgetIndex, catalog.df_models)
+        self.cost_engine = df_grades.get_derived(CostEngine)
+        self.grade_ids = df_grades["grade_id"].to_numpy()
+        self.names = df_grades["name_desc"].to_numpy()
+
+    def quote(self, category, budget, hour, age, limit):
+        positions = self.budget_index.search(category, budget / 12, age, hour, limit=limit)
+        costs = self.cost_engine.costs(age, hour)
+        return [
+            {
+                "match_rank": match_rank,
+                "grade_id": int(grade_id),
+                "name": name,
+                "monthly_real_cost": int(real_cost),
+                "monthly_total_cost": int(total_cost),
+                "resale_value": int(resale_value),
+            }
+            for match_rank, (grade_id, name, real_cost, total_cost, resale_value) in enumerate(
+                zip(
+                    self.grade_ids[positions],
+                    self.names[positions],
+                    costs["MonthlyRealCost"][positions],
+                    costs["MonthlyTotalCost"][positions],
+                    costs["ResaleValue"][positions],
+                ),
+                start=1,
+            )
+        ]
+
+
+def _init_worker(dbname):
+    data_manager = DataManager()
+    data_manager.dbname = dbname
+    _worker["quoter"] = CatalogQuoter(data_manager.get_catalog())
+
+
+def read_profiles(path, input_format=None):
+    """
+    CSVまたはJSONLのプロファイルを1行ずつ辞書で返す。形式は拡張子から判定する
+    JSONLの不正な行とオブジェクト以外の行は{"input": 行の内容}にして返し、見積もり時にその行だけをエラーにする
+    """
+    input_format = input_format or _format_from_path(path)
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        if input_format == "csv":
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    profile = json.loads(line)
+                except json.JSONDecodeError:
+                    profile = line.rstrip("\r\n")
+                yield profile if isinstance(profile, dict) else {"input": profile}
+
+
+def read_fieldnames(path, input_format=None):
+    """
+    CSV出力で入力から引き継ぐ列。CSVはヘッダーのプロファイル以外の列、JSONLは先に列が分からないのでEXTRA_FIELDS
+    """
+    input_format = input_format or _format_from_path(path)
+    if input_format != "csv":
+        return EXTRA_FIELDS
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        fieldnames = csv.DictReader(f).fieldnames or []
+    return tuple(name for name in fieldnames if name not in PROFILE_FIELDS)
+
+
+def _format_from_path(path):
+    return "csv" if os.path.splitext(path)[1].lower() == ".csv" else "jsonl"
+
+
+def chunked(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def parse_profile(profile):
+    """
+    プロファイルの値を検証して (category, budget, hour, age) にする。CSVの文字列も整数に変換する
+    """
+    try:
+        category = str(profile["category"])
+        budget, hour, age = (int(profile[name]) for name in ("budget", "hour", "age"))
+    except (KeyError, TypeError, ValueError):
+        raise ValueError(f"profile must have {', '.join(PROFILE_FIELDS)} as integers")
+    if budget < 0:
+        raise ValueError("budget must be at least 0")
+    if not HOUR_RANGE[0] <= hour <= HOUR_RANGE[1]:
+        raise ValueError(f"hour must be between {HOUR_RANGE[0]} and {HOUR_RANGE[1]}")
+    if not AGE_RANGE[0] <= age <= AGE_RANGE[1]:
+        raise ValueError(f"age must be between {AGE_RANGE[0]} and {AGE_RANGE[1]}")
+    return category, budget, hour, age
+
+
+def quote_chunk(profiles, limit):
+    """
+    ワーカープロセスでチャンク内のプロファイルを見積もる。戻り値はプロファイル毎の
+    {"profile": 入力, "matches": [グレード], "error": エラーメッセージまたはNone}
+    """
+    quoter = _worker["quoter"]
+    results = []
+    for profile in profiles:
+        if not isinstance(profile, dict):
+            profile = {"input": profile}
+        try:
+            category, budget, hour, age = parse_profile(profile)
+        except ValueError as e:
+            results.append({"profile": profile, "matches": [], "error": str(e)})
+            continue
+        matches = quoter.quote(category, budget, hour, age, limit)
+        results.append({"profile": profile, "matches": matches, "error": None})
+    return results
+
+
+def quote_profiles(profiles, dbname=DB_NAME, workers=None, chunk_size=DEFAULT_CHUNK_SIZE, limit=DEFAULT_LIMIT):
+    """
+    プロファイルのイテラブルをチャンク毎にプロセスプールで見積もり、入力の順番どおりに結果を返すジェネレーター
+    同時に計算するチャンクはワーカー数の2倍までにして、入力を先読みしすぎないようにする
+    """
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(dbname,)
+    ) as executor:
+        in_flight = deque()
+        for chunk in chunked(profiles, chunk_size):
+            in_flight.append(executor.submit(quote_chunk, chunk, limit))
+            if len(in_flight) >= workers * 2:
+                yield from in_flight.popleft().result()
+        while in_flight:
+            yield from in_flight.popleft().result()
+
+
+class QuoteWriter:
+    """
+    見積もり結果を書き出すクラス
+    - jsonl: 1プロファイル1行で、入力の列に"matches"と"error"を追加する
+    - csv: 1グレード1行で、入力の列にグレードの列を追加する。該当なし・エラーのプロファイルも1行出力する。
+      列は行の内容によらず extra_fields, プロファイルの列, input, グレードの列, error で固定する
+    """
+
+    def __init__(self, f, output_format, extra_fields=EXTRA_FIELDS) -> None:
+        self.f = f
+        self.output_format = output_format
+        self.fieldnames = list(
+            dict.fromkeys(tuple(extra_fields) + PROFILE_FIELDS + ("input",) + MATCH_FIELDS + ("error",))
+        )
+        self._csv_writer = None
+
+    def write(self, result):
+        profile = result["profile"]
+        if self.output_format == "jsonl":
+            record = dict(profile, matches=result["matches"], error=result["error"])
+            self.f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            return
+        if self._csv_writer is None:
+            self._csv_writer = csv.DictWriter(self.f, fieldnames=self.fieldnames, extrasaction="ignore")
+            self._csv_writer.writeheader()
+        for match in result["matches"] or [{}]:
+            self._csv_writer.writerow(dict(profile, **match, error=result["error"] or ""))
+
+
+def positive_int(value):
+    """
+    1以上の整数だけを受け付けるargparseの型
+    """
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1: {value}")
+    return number
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="顧客プロファイルの一括見積もり")
+    parser.add_argument("input", help="プロファイルのCSVまたはJSONLファイル")
+    parser.add_argument("--output", default=None, help="出力ファイル（.csvまたは.jsonl）。省略した場合は標準出力にJSONLで出力する")
+    parser.add_argument("--input-format", choices=("csv", "jsonl"), default=None)
+    parser.add_argument("--output-format", choices=("csv", "jsonl"), default=None)
+    parser.add_argument("--db", default=DB_NAME)
+    parser.add_argument("--workers", type=positive_int, default=None, help="ワーカープロセス数。省略した場合はCPU数")
+    parser.add_argument("--chunk-size", type=positive_int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--limit", type=positive_int, default=DEFAULT_LIMIT, help="1プロファイルあたりに出力するグレード数")
+    args = parser.parse_args(argv)
+
+    output_format = args.output_format or (_format_from_path(args.output) if args.output else "jsonl")
+    output = open(args.output, "w", encoding="utf-8", newline="") if args.output else sys.stdout
+    profiles = matched = errors = 0
+    start = time.perf_counter()
+    try:
+        writer = QuoteWriter(output, output_format, read_fieldnames(args.input, args.input_format))
+        for result in quote_profiles(
+            read_profiles(args.input, args.input_format),
+            dbname=args.db,
+            workers=args.workers,
+            chunk_size=args.chunk_size,
+            limit=args.limit,
+        ):
+            writer.write(result)
+            profiles += 1
+            matched += bool(result["matches"])
+            errors += result["error"] is not None
+    finally:
+        if args.output:
+            output.close()
+    seconds = time.perf_counter() - start
+    # 結果を標準出力に書く場合があるので、集計は標準エラー出力に出す
+    print(
+        f"{profiles} profiles ({matched} matched, {errors} errors) in {seconds:.2f}s "
+        f"({profiles / seconds if seconds else 0:.0f} profiles/sec)",
+        file=sys.stderr,
+    )
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
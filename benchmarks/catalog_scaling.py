@@ -0,0 +1,54 @@
+# 複製するときに外部キーのずれを補正する列。{テーブル名: {列名: 参照先のテーブル名}}
+FOREIGN_KEYS = {
+    "CarGrades": {"ModelID": "CarModels"},
+    "Bases": {"GradeID": "CarGrades"},
+    "GradeExteriors": {"GradeID": "CarGrades", "ExteriorID": "Exteriors"},
+    "GradeInteriors": {"GradeID": "CarGrades"},
+}
+# 複製するテーブル。カテゴリ・エンジン・色・内装はすべてのモデルで共通なので複製しない
+REPLICATED_TABLES = {"CarModels", "CarGrades", "Bases", "Exteriors", "GradeExteriors", "GradeInteriors"}
+# 複製したことが分かるように名前に連番を付ける列
+NAME_COLUMNS = {"CarModels": "ModelName"}
+
+
+def replicate_seed_data(tables, factor):
+    """
+    DataManager._read_seed_dataが返す初期データを、車種・グレード・外装をfactor倍に複製した初期データに変換する
+    IDは挿入順に自動採番されるので、複製した行の外部キーは複製元のテーブルの行数×複製番号だけずらす
+    - tables: (テーブル名, (列名, 行のイテラブル))のイテラブル
+    """
+    row_counts = {}
+    for table, (columns, rows) in tables:
+        rows = list(rows)
+        row_counts[table] = len(rows)
+        if table not in REPLICATED_TABLES or factor == 1:
+            yield table, (columns, rows)
+            continue
+        yield table, (columns, _replicate_rows(table, list(columns), rows, factor, row_counts))
+
+
+def _replicate_rows(table, columns, rows, factor, row_counts):
+    foreign_keys = FOREIGN_KEYS.get(table, {})
+    # 複製1回あたりの外部キーのずれ。参照先の複製前の行数
+    offsets = [row_counts[foreign_keys[name]] if name in foreign_keys else 0 for name in columns]
+    name_index = columns.index(NAME_COLUMNS[table]) if table in NAME_COLUMNS else None
+    for copy in range(factor):
+        for row in rows:
+            if copy == 0:
+                yield tuple(row)
+                continue
+            values = [
+                value + offset * copy if offset and value is not None else value
+                for value, offset in zip(row, offsets)
+            ]
+            if name_index is not None:
+                values[name_index] = f"{values[name_index]} #{copy + 1}"
+            yield tuple(values)
+
+
+def count_rows(tables):
+    """
+    初期データのテーブル毎の行数。複製結果の確認用
+    """
+    return {table: sum(1 for _ in rows) for table, (_, rows) in tables}
+
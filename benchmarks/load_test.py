@@ -0,0 +1,454 @@
+"""
+1つのstreamlitプロセスが何セッションまで同時に捌けるかを測る負荷試験
+headlessで起動したapp.pyに対して、ブラウザの代わりにwebsocketでN人分のセッションを同時に接続し、
+UserInputDisplay → SearchResultDisplay → ResultComparison → BookAddOptions の流れを操作する
+    python -m benchmarks.load_test                          # 既定のセッション数で試験
+    python -m benchmarks.load_test --users 32 --iterations 5
+    python -m benchmarks.load_test --url http://localhost:8501 --pid 1234   # 起動済みのサーバーに対して試験
+予約はDBのコピーに書き込むので、既定のDB（car_customize.db）は変更しない
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+import pyarrow as pa
+from tornado.websocket import websocket_connect
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+from page_manager.stage_profiler import LatencyHistogram
+from domain_context.db_config import DB_NAME
+from domain_context.profile_config import (
+    LOAD_TEST_ITERATIONS,
+    LOAD_TEST_PORT,
+    LOAD_TEST_TIMEOUT,
+    LOAD_TEST_USERS,
+)
+
+# 操作するウィジェットのラベル（page_manager/page.pyと合わせる）
+CATEGORY_LABEL = "カテゴリー"
+BUDGET_LABEL = "年間希望予算を入力ください?"
+NAME_LABEL = "氏名"
+EMAIL_LABEL = "メールアドレス"
+BOOK_LABEL = "この内容でディーラーを予約する"
+# 予算は検索結果が出やすい範囲から選ぶ
+BUDGET_RANGE = (3000000, 10000000)
+BUDGET_STEP = 100000
+# 比較するグレード数の上限
+MAX_CHOSEN_ROWS = 3
+# 1回の操作の流れで計測する段階
+STEPS = ("initial", "category", "budget", "choose", "form", "book")
+# サーバーのRSSを記録する間隔[秒]
+RSS_SAMPLE_SECONDS = 0.1
+
+
+def selectbox_state(widget_id, index):
+    return WidgetState(id=widget_id, int_value=index)
+
+
+def slider_state(widget_id, value):
+    state = WidgetState(id=widget_id)
+    state.double_array_value.data.append(value)
+    return state
+
+
+def text_input_state(widget_id, value):
+    return WidgetState(id=widget_id, string_value=value)
+
+
+def button_state(widget_id):
+    return WidgetState(id=widget_id, trigger_value=True)
+
+
+def data_editor_state(widget_id, checked_rows, column="check"):
+    """
+    data_editorで指定した行のチェックを入れたときの状態。ブラウザが送るのと同じJSON形式にする
+    """
+    edited_rows = {str(row): {column: True} for row in checked_rows}
+    return WidgetState(
+        id=widget_id,
+        string_value=json.dumps(
+            {"edited_rows": edited_rows, "added_rows": [], "deleted_rows": []}
+        ),
+    )
+
+
+def read_arrow_table(data):
+    """
+    st.dataframe / st.data_editorで送られるArrowのバイト列を読み込む
+    """
+    with pa.ipc.open_stream(data) as reader:
+        return reader.read_all()
+
+
+class RerunResult:
+    """
+    1回の再実行でサーバーから送られた要素
+    - widgets: {(要素の種類, ラベル): 要素}。data_editorは("data_editor", "")
+    - exceptions: 画面に表示された例外のメッセージ
+    """
+
+    def __init__(self) -> None:
+        self.widgets = {}
+        self.exceptions = []
+        self.status = None
+
+    def add_element(self, element):
+        kind = element.WhichOneof("type")
+        if kind == "exception":
+            self.exceptions.append(element.exception.message)
+        elif kind == "arrow_data_frame" and element.arrow_data_frame.id:
+            self.widgets[("data_editor", "")] = element.arrow_data_frame
+        elif kind in ("selectbox", "slider", "text_input", "button", "radio"):
+            widget = getattr(element, kind)
+            self.widgets[(kind, widget.label)] = widget
+
+    def widget(self, kind, label=""):
+        return self.widgets.get((kind, label))
+
+
+class StreamlitSession:
+    """
+    ブラウザの代わりにwebsocketでstreamlitサーバーと通信する1セッション
+    ウィジェットの値はブラウザと同様にクライアント側で保持し、再実行の度にまとめて送る
+    """
+
+    def __init__(self, url, timeout=LOAD_TEST_TIMEOUT) -> None:
+        self.ws_url = url.replace("http", "ws", 1).rstrip("/") + "/_stcore/stream"
+        self.timeout = timeout
+        self.widget_states = {}
+        self.connection = None
+
+    async def connect(self):
+        self.connection = await websocket_connect(self.ws_url, subprotocols=["streamlit"])
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def set_widget_state(self, state):
+        self.widget_states[state.id] = state
+
+    async def rerun(self):
+        """
+        現在のウィジェットの値で再実行し、スクリプトが最後まで実行されるまで待つ。戻り値は(RerunResult, 秒)
+        """
+        message = BackMsg()
+        message.rerun_script.widget_states.widgets.extend(self.widget_states.values())
+        start = time.perf_counter()
+        await self.connection.write_message(message.SerializeToString(), binary=True)
+        # ボタンは押した回の再実行でだけTrueになる
+        self.widget_states = {
+            widget_id: state
+            for widget_id, state in self.widget_states.items()
+            if not state.trigger_value
+        }
+        result = await asyncio.wait_for(self._read_until_finished(), self.timeout)
+        return result, time.perf_counter() - start
+
+    async def _read_until_finished(self):
+        result = RerunResult()
+        while True:
+            data = await self.connection.read_message()
+            if data is None:
+                raise ConnectionError("websocket was closed by the server")
+            message = ForwardMsg()
+            message.ParseFromString(data)
+            kind = message.WhichOneof("type")
+            if kind == "delta" and message.delta.WhichOneof("type") == "new_element":
+                result.add_element(message.delta.new_element)
+            elif kind == "script_finished":
+                if message.script_finished == ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                    result = RerunResult()
+                    continue
+                result.status = ForwardMsg.ScriptFinishedStatus.Name(message.script_finished)
+                return result
+
+
+class LoadTestStats:
+    """
+    全セッションの計測結果を段階毎に集計するクラス
+    """
+
+    def __init__(self) -> None:
+        self.histograms = {step: LatencyHistogram() for step in STEPS}
+        self.reruns = 0
+        self.errors = []
+        self.completed_flows = 0
+        self.no_result_flows = 0
+
+    def record(self, step, seconds, result):
+        self.histograms[step].record(seconds)
+        self.reruns += 1
+        self.errors.extend(f"{step}: {message}" for message in result.exceptions)
+
+    def report(self, wall_seconds, users, rss=None):
+        """
+        集計結果の辞書。処理時間はミリ秒
+        - rss: {"start_kb", "warm_kb", "peak_kb", "end_kb"}。サーバーのRSSが取れない場合はNone
+        """
+        report = {
+            "users": users,
+            "wall_seconds": wall_seconds,
+            "reruns": self.reruns,
+            "throughput_reruns_per_second": self.reruns / wall_seconds if wall_seconds else 0.0,
+            "completed_flows": self.completed_flows,
+            "no_result_flows": self.no_result_flows,
+            "errors": self.errors,
+            "steps": {
+                step: {
+                    key: value * 1000 if key in ("total", "mean", "p50", "p95", "p99", "max") else value
+                    for key, value in histogram.summary().items()
+                }
+                for step, histogram in self.histograms.items()
+                if histogram.count
+            },
+            "rss": rss,
+        }
+        if rss is not None and users:
+            # 起動直後のセッション（カタログの読み込みを含む）を除いた、1セッションあたりの増分
+            report["rss_per_session_kb"] = (rss["end_kb"] - rss["warm_kb"]) / users
+        return report
+
+
+async def user_flow(url, stats, rng, iterations, sessions):
+    """
+    1人のユーザーが入力から予約までをiterations回繰り返す。毎回新しいセッションで接続する。
+    最後のセッションはRSSを測るまで開いたままにしてsessionsに追加する
+    """
+    for i in range(iterations):
+        session = StreamlitSession(url)
+        await session.connect()
+        await walk_booking_flow(session, stats, rng)
+        if i == iterations - 1:
+            sessions.append(session)
+        else:
+            session.close()
+
+
+async def walk_booking_flow(session, stats, rng):
+    result, seconds = await session.rerun()
+    stats.record("initial", seconds, result)
+
+    category = result.widget("selectbox", CATEGORY_LABEL)
+    session.set_widget_state(selectbox_state(category.id, rng.randrange(len(category.options))))
+    result, seconds = await session.rerun()
+    stats.record("category", seconds, result)
+
+    budget = result.widget("slider", BUDGET_LABEL)
+    low, high = BUDGET_RANGE
+    value = float(rng.randrange(low, high + 1, BUDGET_STEP))
+    session.set_widget_state(slider_state(budget.id, value))
+    result, seconds = await session.rerun()
+    stats.record("budget", seconds, result)
+
+    editor = result.widget("data_editor")
+    if editor is None:
+        stats.no_result_flows += 1
+        return
+    row_count = read_arrow_table(editor.data).num_rows
+    checked_rows = rng.sample(range(row_count), min(MAX_CHOSEN_ROWS, row_count))
+    session.set_widget_state(data_editor_state(editor.id, checked_rows))
+    result, seconds = await session.rerun()
+    stats.record("choose", seconds, result)
+
+    name = result.widget("text_input", NAME_LABEL)
+    email = result.widget("text_input", EMAIL_LABEL)
+    session.set_widget_state(text_input_state(name.id, "load test"))
+    session.set_widget_state(text_input_state(email.id, "load-test@example.com"))
+    result, seconds = await session.rerun()
+    stats.record("form", seconds, result)
+
+    book = result.widget("button", BOOK_LABEL)
+    session.set_widget_state(button_state(book.id))
+    result, seconds = await session.rerun()
+    stats.record("book", seconds, result)
+    stats.completed_flows += 1
+
+
+def read_rss_kb(pid):
+    """
+    プロセスの常駐メモリ[KB]。/procが無い環境ではNone
+    """
+    try:
+        with open(f"/proc/{pid}/status", "r", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+async def sample_peak_rss(pid, peak, stop):
+    while not stop.is_set():
+        rss = read_rss_kb(pid)
+        if rss is not None:
+            peak["kb"] = max(peak["kb"], rss)
+        await asyncio.sleep(RSS_SAMPLE_SECONDS)
+
+
+async def run_load_test(url, users, iterations, pid=None, seed=0):
+    """
+    1セッションで暖機（カタログの読み込みなど）してから、users人が同時にiterations回ずつ操作する
+    """
+    rng = random.Random(seed)
+    rss = {"start_kb": read_rss_kb(pid)} if pid else None
+
+    warmup = StreamlitSession(url)
+    await warmup.connect()
+    await walk_booking_flow(warmup, LoadTestStats(), rng)
+    warmup.close()
+
+    stats = LoadTestStats()
+    sessions = []
+    peak = {"kb": 0}
+    stop = asyncio.Event()
+    sampler = None
+    if rss is not None:
+        rss["warm_kb"] = read_rss_kb(pid)
+        sampler = asyncio.ensure_future(sample_peak_rss(pid, peak, stop))
+
+    start = time.perf_counter()
+    try:
+        await asyncio.gather(
+            *(
+                user_flow(url, stats, random.Random(rng.random()), iterations, sessions)
+                for _ in range(users)
+            )
+        )
+        wall_seconds = time.perf_counter() - start
+        if rss is not None:
+            rss["end_kb"] = read_rss_kb(pid)
+    finally:
+        stop.set()
+        if sampler is not None:
+            await sampler
+        for session in sessions:
+            session.close()
+    if rss is not None:
+        rss["peak_kb"] = max(peak["kb"], rss["end_kb"])
+        if None in rss.values():
+            rss = None
+    return stats.report(wall_seconds, users, rss)
+
+
+def copy_database(source, destination):
+    """
+    DBファイルをコピーする。WALモードでまだDBファイル本体に書き戻されていないコミット済みの内容も含めるため、
+    ファイルのコピーではなくsqlite3のバックアップAPIを使う
+    """
+    source_conn = sqlite3.connect(source)
+    destination_conn = sqlite3.connect(destination)
+    try:
+        source_conn.backup(destination_conn)
+    finally:
+        destination_conn.close()
+        source_conn.close()
+
+
+def start_server(port, db_path):
+    """
+    負荷試験用にapp.pyをheadlessで起動する。DB_NAMEはCAR_CUSTOMIZE_DBで指定したコピーを使う
+    """
+    env = dict(
+        os.environ,
+        CAR_CUSTOMIZE_DB=db_path,
+        # 大きなメッセージを参照だけで送るキャッシュを無効にして、常に要素の中身を受け取る
+        STREAMLIT_GLOBAL_MIN_CACHED_MESSAGE_SIZE=str(2**62),
+    )
+    return subprocess.Popen(
+        [
+            sys.executable, "-m", "streamlit", "run", "app.py",
+            "--server.headless", "true",
+            "--server.port", str(port),
+            "--server.fileWatcherType", "none",
+            "--browser.gatherUsageStats", "false",
+        ],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+def wait_for_server(url, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(url.rstrip("/") + "/_stcore/health", timeout=1) as response:
+                if response.status == 200:
+                    return
+        except OSError:
+            time.sleep(0.2)
+    raise TimeoutError(f"streamlit server at {url} did not become healthy in {timeout} seconds")
+
+
+def print_report(report):
+    print(
+        f"users {report['users']}  reruns {report['reruns']}  wall {report['wall_seconds']:.2f} s  "
+        f"throughput {report['throughput_reruns_per_second']:.1f} reruns/s  "
+        f"flows {report['completed_flows']} (no result {report['no_result_flows']})"
+    )
+    for step, summary in report["steps"].items():
+        print(
+            f"{step:10s} n {summary['count']:5d}  p50 {summary['p50']:9.1f} ms  "
+            f"p95 {summary['p95']:9.1f} ms  p99 {summary['p99']:9.1f} ms  max {summary['max']:9.1f} ms"
+        )
+    if report["rss"] is not None:
+        rss = report["rss"]
+        print(
+            f"RSS start {rss['start_kb'] / 1024:.1f} MB  warm {rss['warm_kb'] / 1024:.1f} MB  "
+            f"peak {rss['peak_kb'] / 1024:.1f} MB  end {rss['end_kb'] / 1024:.1f} MB  "
+            f"per session {report['rss_per_session_kb'] / 1024:.2f} MB"
+        )
+    for error in report["errors"]:
+        print(f"ERROR {error}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="app.pyの同時セッション負荷試験")
+    parser.add_argument("--users", type=int, default=LOAD_TEST_USERS)
+    parser.add_argument("--iterations", type=int, default=LOAD_TEST_ITERATIONS)
+    parser.add_argument("--port", type=int, default=LOAD_TEST_PORT)
+    parser.add_argument("--url", default=None, help="起動済みのサーバーのURL。省略した場合はサーバーを起動する")
+    parser.add_argument("--pid", type=int, default=None, help="--urlのサーバーのプロセスID（RSSの計測用）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", default=None, help="集計結果を書き出すファイル")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        server = None
+        url, pid = args.url, args.pid
+        if url is None:
+            db_path = os.path.join(workdir, os.path.basename(DB_NAME))
+            if os.path.exists(DB_NAME):
+                copy_database(DB_NAME, db_path)
+            server = start_server(args.port, db_path)
+            url, pid = f"http://localhost:{args.port}", server.pid
+        try:
+            wait_for_server(url, LOAD_TEST_TIMEOUT)
+            report = asyncio.run(run_load_test(url, args.users, args.iterations, pid, args.seed))
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait()
+
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 1 if report["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,261 @@
+"""
+データ・コスト計算の主要な処理の時間をカタログサイズ毎に計測し、ベースラインと比較するベンチマーク
+    python -m benchmarks.run_benchmarks                     # 計測してベースラインと比較。劣化があれば終了コード1
+    python -m benchmarks.run_benchmarks --update-baseline   # 計測結果をベースラインとして保存
+    python -m benchmarks.run_benchmarks --scales 1 10 100 --threshold 0.3
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+from streamlit import logger as streamlit_logger
+
+from benchmarks.catalog_scaling import replicate_seed_data
+from benchmarks.synthetic_catalog import SyntheticCatalog
+from data_manager.data_manager import DataManager
+from data_manager.base_db_manager import remove_sqlite_files
+from page_manager.page import ResultComparison
+from session_manager.user_session import UserSession
+from domain_context.default_values import DEFAULT_VALUES
+from domain_context.profile_config import (
+    BENCHMARK_BASELINE_PATH,
+    BENCHMARK_REPEAT,
+    BENCHMARK_SCALES,
+    BENCHMARK_SOURCE,
+    BENCHMARK_THRESHOLD,
+)
+
+# 計測で使う入力値
+AGE = 10
+HOUR = 2
+USER_BUDGET = 3000000
+CHOSEN_GRADE_COUNT = 5
+
+
+class BenchmarkDataManager(DataManager):
+    """
+    scale倍の規模のカタログのDBを、指定したパスに構築するDataManager
+    - source: "synthetic"の場合はSyntheticCatalogで生成したデータ、"replicate"の場合は初期データを複製したデータを使う
+    """
+
+    def __init__(self, dbname, scale, source=BENCHMARK_SOURCE) -> None:
+        super().__init__()
+        self.dbname = dbname
+        self.scale = scale
+        self.source = source
+
+    def _read_seed_data(self):
+        if self.source == "synthetic":
+            return SyntheticCatalog(scale=self.scale).tables()
+        return replicate_seed_data(super()._read_seed_data(), self.scale)
+
+
+class CatalogBenchmark:
+    """
+    1つのカタログサイズについて、各処理を1回実行する関数を用意するクラス。
+    準備（DBの構築やコスト計算の前処理など）は計測の対象外にする
+    """
+
+    def __init__(self, scale, workdir, source=BENCHMARK_SOURCE) -> None:
+        self.scale = scale
+        self.data_manager = BenchmarkDataManager(
+            os.path.join(workdir, f"catalog_x{scale}.db"), scale, source
+        )
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.data_manager.init_DB()
+        self.catalog = self.data_manager.reload_catalog()
+        self.category = self.catalog.df_models["category_name"].iloc[0]
+        self.df_grades_with_cost = self.data_manager.calculate_costs(
+            AGE, HOUR, self.catalog.df_grades
+        ).sort_values("MonthlyRealCost", kind="stable")
+        self.chosen_grades = [
+            int(grade_id)
+            for grade_id in self.catalog.df_grades["grade_id"].iloc[:CHOSEN_GRADE_COUNT]
+        ]
+
+    def cases(self):
+        """
+        {処理名: (準備関数, 計測する関数)}
+        """
+        return {
+            "init_DB": (self._remove_db, self._init_db),
+            "load_data_from_DB": (None, self.data_manager.load_data_from_DB),
+            "load_catalog": (None, self.data_manager.reload_catalog),
+            "calculate_costs": (
+                None,
+                lambda: self.data_manager.calculate_costs(AGE, HOUR, self.catalog.df_grades),
+            ),
+            "search_car_meet_customer_needs": (
+                None,
+                lambda: self.data_manager.search_car_meet_customer_needs(
+                    self.catalog.df_models, self.category, self.df_grades_with_cost, USER_BUDGET
+                ),
+            ),
+            "search_grades": (
+                None,
+                lambda: self.data_manager.search_grades(
+                    self.catalog.df_models,
+                    self.category,
+                    self.catalog.df_grades,
+                    USER_BUDGET,
+                    AGE,
+                    HOUR,
+                ),
+            ),
+            "ResultComparison.preprocess": (
+                self._prepare_session,
+                self._result_comparison_preprocess,
+            ),
+            "insert_user_customization": (None, self._insert_user_customization),
+        }
+
+    def _remove_db(self):
+        # WALなどのファイルも消して、規模毎に空の状態から構築する
+        remove_sqlite_files(self.data_manager.dbname)
+
+    def _init_db(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.data_manager.init_DB()
+
+    def _prepare_session(self):
+        user_session = UserSession()
+        user_session.set_default_values(DEFAULT_VALUES)
+        user_session.set_values(self.catalog.session_values())
+        user_session.set_values(
+            {
+                "age": AGE,
+                "hour": HOUR,
+                "chosen_grades": self.chosen_grades,
+                "chosen_index": list(range(len(self.chosen_grades))),
+            }
+        )
+
+    def _result_comparison_preprocess(self):
+        ResultComparison().preprocess()
+
+    def _insert_user_customization(self):
+        self.data_manager.insert_user_customization(
+            name="benchmark",
+            email="benchmark@example.com",
+            prefecture="東京都",
+            baseid=1,
+            colorids=[1],
+            interiorids=[1],
+            exteriorids=[1, 2, 3],
+        )
+
+
+def measure(setup, run, repeat):
+    """
+    1回空実行してから、run()をrepeat回実行した時間[秒]の統計を返す。setupは毎回run()の前に実行し、時間に含めない
+    """
+    samples = []
+    for i in range(repeat + 1):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        run()
+        if i > 0:
+            samples.append(time.perf_counter() - start)
+    return {
+        "median": statistics.median(samples),
+        "min": min(samples),
+        "max": max(samples),
+        "repeat": repeat,
+    }
+
+
+def run_benchmarks(scales, repeat, cases=None, source=BENCHMARK_SOURCE):
+    """
+    カタログサイズ毎にすべての処理を計測する。戻り値は{"処理名[xサイズ]": 統計}
+    - cases: 計測する処理名のリスト。Noneの場合はすべて
+    - source: カタログの作り方（BenchmarkDataManagerを参照）
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        for scale in scales:
+            benchmark = CatalogBenchmark(scale, workdir, source)
+            for name, (setup, run) in benchmark.cases().items():
+                if cases is not None and name not in cases:
+                    continue
+                results[f"{name}[x{scale}]"] = measure(setup, run, repeat)
+            benchmark.data_manager._get_db_manager().close()
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    ベースラインと比較して、中央値がthreshold（0.2なら20%）を超えて遅くなった処理を返す。
+    戻り値は[(処理名, ベースラインの中央値, 今回の中央値)]
+    """
+    regressions = []
+    for name, stats in results.items():
+        base = baseline.get(name)
+        if base is not None and stats["median"] > base["median"] * (1 + threshold):
+            regressions.append((name, base["median"], stats["median"]))
+    return regressions
+
+
+def load_baseline(path):
+    if not os.path.isfile(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)["results"]
+
+
+def save_baseline(path, results):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "created_at": time.time(),
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "results": results,
+            },
+            f,
+            ensure_ascii=False,
+            indent=2,
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="データ・コスト計算のベンチマーク")
+    parser.add_argument("--scales", type=int, nargs="+", default=list(BENCHMARK_SCALES))
+    parser.add_argument("--repeat", type=int, default=BENCHMARK_REPEAT)
+    parser.add_argument("--cases", nargs="+", default=None, help="計測する処理名")
+    parser.add_argument("--source", choices=("synthetic", "replicate"), default=BENCHMARK_SOURCE)
+    parser.add_argument("--baseline", default=BENCHMARK_BASELINE_PATH)
+    parser.add_argument("--threshold", type=float, default=BENCHMARK_THRESHOLD)
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args(argv)
+
+    # ページ要素をstreamlitの実行環境の外で使うときの警告を抑制する
+    streamlit_logger.set_log_level("error")
+
+    results = run_benchmarks(args.scales, args.repeat, args.cases, args.source)
+    baseline = load_baseline(args.baseline)
+    for name, stats in results.items():
+        base = baseline.get(name) if baseline else None
+        ratio = f"{stats['median'] / base['median']:.2f}x" if base else "-"
+        print(f"{name:50s} median {stats['median'] * 1000:10.3f} ms  min {stats['min'] * 1000:10.3f} ms  vs baseline {ratio}")
+
+    if args.update_baseline or baseline is None:
+        save_baseline(args.baseline, results)
+        print(f"baseline was written to {args.baseline}")
+        return 0
+
+    regressions = compare(results, baseline, args.threshold)
+    for name, base, current in regressions:
+        print(f"REGRESSION {name}: {base * 1000:.3f} ms -> {current * 1000:.3f} ms")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,360 @@
+"""
+create_db.sqlのスキーマに沿った合成カタログを、初期データ（db_sample.json）の10倍・100倍・1000倍といった規模で生成する
+    python -m benchmarks.synthetic_catalog --scale 100 --sqlite catalog_x100.db
+    python -m benchmarks.synthetic_catalog --scale 1000 --arrow catalog_x1000
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import time
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.ipc as ipc
+
+from data_manager.data_manager import DataManager, SEED_TABLES
+from data_manager.snapshot import MANIFEST_FILE
+
+# 1回に生成する行数。生成中に保持する行はこの行数まで
+CHUNK_SIZE = 50_000
+
+# 分布のパラメータは初期データ（scale=1）の実測値に合わせている
+CATEGORIES = ["コンパクト", "ミニバン", "セダン", "ワゴン", "SUV", "スポーツ", "GR/GR SPORT", "軽自動車"]
+CATEGORY_WEIGHTS = [4, 5, 4, 1, 10, 4, 6, 1]  # カテゴリ毎の車種数
+MODELS_PER_SCALE = 35
+GRADES_PER_MODEL = (6.66, 31.5)  # 1を引いた車種毎のグレード数の平均・分散（負の二項分布）
+ENGINES = ["ハイブリッド", "ガソリン", "FCV", "PHV", "ディーゼル", "EVシステム"]
+ENGINE_WEIGHTS = [130, 110, 2, 10, 12, 4]
+ENGINE_FUEL_EFFICIENCY = [13.5, 12.8, 18.9, 16.4, 15.3, 16.4]  # エンジン毎の燃費[km/L]の平均
+FUEL_PRICE = 160  # FuelCostPerKilo = FUEL_PRICE / FuelEfficiency
+BASE_PRICE = (3_400_000, 0.35, 1_500_000, 15_000_000)  # 車両価格の中央値・対数標準偏差・下限・上限
+MONTHLY_COST_RATE = 0.01  # 維持費・保険料・駐車場代は車両価格の1%
+PRICE_DROP_RATE = (0.023, 0.003, 0.01, 0.03)  # 月あたりの値下がり率の平均・標準偏差・下限・上限
+EXTERIORS_PER_GRADE = (40, 17, 8, 97)  # グレード毎の外装数の平均・標準偏差・下限・上限
+EXTERIOR_COST = (27_500, 1.2, 0.03)  # 外装の追加費用の中央値・対数標準偏差・値引き（負の費用）になる割合
+INTERIORS_PER_GRADE = 6
+OPTIONS_PER_SCALE = 6  # 色・内装の種類数。車種とは独立なので規模の平方根に比例させる
+
+GRADE_NAMES = ["X", "G", "Z", "S", "U", "GR SPORT", "Z Raffine", "Premium", "Executive", "HYBRID G", "HYBRID Z", "Elegance"]
+DISPLACEMENTS = ["1.0L", "1.5L", "1.8L", "2.0L", "2.5L", "3.5L"]
+TRANSMISSIONS = ["CVT", "6AT", "8AT", "10AT", "6MT"]
+DRIVES = ["2WD　FF", "4WD", "2WD　FR", "E-Four"]
+SEATS = [2, 4, 5, 7, 8]
+KANA = list("アイウエオカキクケコサシスセソタチツテトナニヌネノハヒフヘホマミムメモヤユヨラリルレロワン")
+EXTERIOR_ITEMS = [
+    "LEDヘッドランプ", "LEDフロントフォグランプ", "アルミホイール", "スペアタイヤ", "ルーフレール", "サンルーフ",
+    "パノラマルーフ", "バックドアガーニッシュ", "フロントスポイラー", "サイドマッドガード", "リヤスポイラー",
+    "ドアミラーカバー", "ナンバーフレーム", "ボディコーティング", "ウインドウフィルム", "寒冷地仕様",
+]
+EXTERIOR_VARIANTS = ["", "（メッキ）", "（ブラック）", "（18インチ）", "（17インチ）", "（切削光輝）", "（LED）"]
+INTERIOR_ITEMS = [
+    "デジタルインナーミラー", "フロアマット（ラグジュアリータイプ）", "フロアマット（ベーシックタイプ）",
+    "ラゲージトレイ", "シートカバー", "ステアリングカバー", "インテリアイルミネーション", "シートヒーター",
+]
+COLOR_NAMES = [
+    "プラチナホワイトパールマイカ", "ブラック", "シルバーメタリック", "エモーショナルレッド", "ダークブルーマイカ",
+    "グレーメタリック", "アーバンカーキ", "センシュアルレッドマイカ", "プレシャスメタル", "ホワイトパールクリスタルシャイン",
+]
+COLOR_COST = [0, 33000, 55000]
+OPTION_COST = [0, 11000, 22000, 33000, 55000, 80000]
+
+
+class SyntheticCatalog:
+    """
+    初期データをscale倍にした規模の合成カタログ。テーブル・列の構成はDataManager._read_seed_dataと同じで、
+    そのままSQliteManager.bulk_loadやArrowのスナップショットに渡せる
+    行はテーブル毎にCHUNK_SIZE行ずつ生成してジェネレータで返すため、数百万行でも全行をメモリに載せない。
+    保持するのは車種毎のグレード数など、外部キーを決めるための整数配列だけ
+    同じseedからは何度でも同じデータを生成する
+    """
+
+    def __init__(self, scale=1, seed=0, chunk_size=CHUNK_SIZE) -> None:
+        self.scale = scale
+        self.seed = seed
+        self.chunk_size = chunk_size
+        rng = np.random.default_rng([seed, 0])
+
+        n_models = max(1, round(MODELS_PER_SCALE * scale))
+        self.model_categories = rng.choice(
+            len(CATEGORIES), n_models, p=self._normalize(CATEGORY_WEIGHTS)
+        ) + 1
+        mean, var = GRADES_PER_MODEL
+        p = mean / var
+        self.grades_per_model = 1 + rng.negative_binomial(mean * p / (1 - p), p, n_models)
+        n_grades = int(self.grades_per_model.sum())
+        mean, std, low, high = EXTERIORS_PER_GRADE
+        self.exteriors_per_grade = np.clip(
+            rng.normal(mean, std, n_grades).round(), low, high
+        ).astype(np.int64)
+        # 人気順位は全グレードの並べ替え
+        self.grade_ranks = rng.permutation(n_grades).astype(np.int32) + 1
+        self.n_options = max(OPTIONS_PER_SCALE, round(OPTIONS_PER_SCALE * scale**0.5))
+
+    @staticmethod
+    def _normalize(weights):
+        weights = np.asarray(weights, dtype=float)
+        return weights / weights.sum()
+
+    def row_counts(self) -> dict:
+        """
+        テーブル毎に生成する行数
+        """
+        n_grades = len(self.grade_ranks)
+        n_exteriors = int(self.exteriors_per_grade.sum())
+        return {
+            "CarCategories": len(CATEGORIES),
+            "CarModels": len(self.model_categories),
+            "CarGrades": n_grades,
+            "Engines": len(ENGINES),
+            "Bases": n_grades,
+            "Colors": self.n_options,
+            "Exteriors": n_exteriors,
+            "GradeExteriors": n_exteriors,
+            "Interiors": self.n_options,
+            "GradeInteriors": n_grades * min(INTERIORS_PER_GRADE, self.n_options),
+        }
+
+    def tables(self):
+        """
+        (テーブル名, (列名, 行のイテラブル))をSEED_TABLESの順（参照される側から順）に返す
+        """
+        for index, table in enumerate(SEED_TABLES):
+            yield table, getattr(self, f"_{table}")(np.random.default_rng([self.seed, index + 1]))
+
+    def _chunks(self, total):
+        for start in range(0, total, self.chunk_size):
+            yield start, min(start + self.chunk_size, total)
+
+    def _CarCategories(self, rng):
+        return ("CategoryName",), [(name,) for name in CATEGORIES]
+
+    def _CarModels(self, rng):
+        def rows():
+            for start, stop in self._chunks(len(self.model_categories)):
+                lengths = rng.integers(2, 6, stop - start)
+                kana = rng.choice(KANA, (stop - start, 5))
+                for i, length, chars, category in zip(
+                    range(start, stop), lengths, kana, self.model_categories[start:stop].tolist()
+                ):
+                    yield (
+                        "".join(chars[:length]),
+                        category,
+                        f"https://example.com/synthetic/models/{i + 1}.png",
+                    )
+
+        return ("ModelName", "CategoryID", "ImageURL"), rows()
+
+    def _CarGrades(self, rng):
+        model_ids = np.repeat(np.arange(1, len(self.grades_per_model) + 1), self.grades_per_model)
+
+        def rows():
+            for start, stop in self._chunks(len(model_ids)):
+                size = stop - start
+                engines = self._grade_engines(start, stop)
+                names = rng.choice(GRADE_NAMES, size)
+                displacements = rng.choice(DISPLACEMENTS, size)
+                transmissions = rng.choice(TRANSMISSIONS, size)
+                drives = rng.choice(DRIVES, size)
+                seats = rng.choice(SEATS, size)
+                for values in zip(
+                    names, engines, displacements, transmissions, drives, seats.tolist(),
+                    model_ids[start:stop].tolist(),
+                ):
+                    name, engine, displacement, transmission, drive, seat, model_id = values
+                    description = f"{ENGINES[engine - 1]}／{displacement}／{transmission}／{drive}／定員 {seat}名"
+                    yield str(name), description, model_id
+
+        return ("GradeName", "Description", "ModelID"), rows()
+
+    def _grade_engines(self, start, stop):
+        # CarGradesの説明文とBasesのEngineIDが一致するよう、グレードの位置から決まる乱数で選ぶ
+        rng = np.random.default_rng([self.seed, 100, start])
+        return rng.choice(len(ENGINES), stop - start, p=self._normalize(ENGINE_WEIGHTS)) + 1
+
+    def _Engines(self, rng):
+        return ("EngineType",), [(name,) for name in ENGINES]
+
+    def _Bases(self, rng):
+        columns = (
+            "GradeID", "EngineID", "BasePrice", "Rank", "FuelEfficiency", "FuelCostPerKilo",
+            "MonthlyMainteCost", "MonthlyInsuranceCost", "MonthlyParkingCost", "MonthlyPriceDropRate",
+        )
+        median, sigma, low, high = BASE_PRICE
+        drop_mean, drop_std, drop_low, drop_high = PRICE_DROP_RATE
+
+        def rows():
+            for start, stop in self._chunks(len(self.grade_ranks)):
+                size = stop - start
+                engines = self._grade_engines(start, stop)
+                price = (np.clip(median * rng.lognormal(0, sigma, size), low, high) // 1000 * 1000).astype(np.int64)
+                efficiency = np.clip(
+                    np.asarray(ENGINE_FUEL_EFFICIENCY)[engines - 1] * rng.normal(1, 0.15, size), 5, 40
+                )
+                monthly_cost = price * MONTHLY_COST_RATE
+                drop_rate = np.clip(rng.normal(drop_mean, drop_std, size), drop_low, drop_high)
+                yield from zip(
+                    range(start + 1, stop + 1),
+                    engines.tolist(),
+                    price.tolist(),
+                    self.grade_ranks[start:stop].tolist(),
+                    efficiency.tolist(),
+                    (FUEL_PRICE / efficiency).tolist(),
+                    monthly_cost.tolist(),
+                    monthly_cost.tolist(),
+                    monthly_cost.tolist(),
+                    drop_rate.tolist(),
+                )
+
+        return columns, rows()
+
+    def _Colors(self, rng):
+        return ("ColorName", "ImageURL", "AdditionalCost"), [
+            (
+                COLOR_NAMES[i % len(COLOR_NAMES)] + (f" {i // len(COLOR_NAMES) + 1}" if i >= len(COLOR_NAMES) else ""),
+                f"https://example.com/synthetic/colors/{i + 1}.jpg",
+                int(rng.choice(COLOR_COST)),
+            )
+            for i in range(self.n_options)
+        ]
+
+    def _Exteriors(self, rng):
+        median, sigma, discount_rate = EXTERIOR_COST
+
+        def rows():
+            for start, stop in self._chunks(int(self.exteriors_per_grade.sum())):
+                size = stop - start
+                items = rng.choice(EXTERIOR_ITEMS, size)
+                variants = rng.choice(EXTERIOR_VARIANTS, size)
+                cost = (median * rng.lognormal(0, sigma, size) // 100 * 100).astype(np.int64)
+                cost[rng.random(size) < discount_rate] *= -1
+                for i, item, variant, additional_cost in zip(range(start, stop), items, variants, cost.tolist()):
+                    yield f"{item}{variant}", f"https://example.com/synthetic/ex/{i + 1}.jpg", additional_cost
+
+        return ("Item", "ImageURL", "AdditionalCost"), rows()
+
+    def _GradeExteriors(self, rng):
+        # 外装は初期データと同様にグレード毎に別のIDを持つ。外装IDの連番をグレード毎の外装数で区切る
+        boundaries = np.cumsum(self.exteriors_per_grade)
+
+        def rows():
+            for start, stop in self._chunks(int(boundaries[-1]) if len(boundaries) else 0):
+                exterior_ids = np.arange(start, stop)
+                grade_ids = np.searchsorted(boundaries, exterior_ids, side="right") + 1
+                yield from zip(grade_ids.tolist(), (exterior_ids + 1).tolist())
+
+        return ("GradeID", "ExteriorID"), rows()
+
+    def _Interiors(self, rng):
+        return ("Item", "ImageURL", "AdditionalCost"), [
+            (
+                INTERIOR_ITEMS[i % len(INTERIOR_ITEMS)] + (f" {i // len(INTERIOR_ITEMS) + 1}" if i >= len(INTERIOR_ITEMS) else ""),
+                f"https://example.com/synthetic/in/{i + 1}.jpg",
+                int(rng.choice(OPTION_COST)),
+            )
+            for i in range(self.n_options)
+        ]
+
+    def _GradeInteriors(self, rng):
+        per_grade = min(INTERIORS_PER_GRADE, self.n_options)
+
+        def rows():
+            for start, stop in self._chunks(len(self.grade_ranks)):
+                # グレード毎に内装の一覧から連続するper_grade件を選ぶ
+                first = rng.integers(0, self.n_options, stop - start)
+                interior_ids = (first[:, None] + np.arange(per_grade)) % self.n_options + 1
+                grade_ids = np.repeat(np.arange(start + 1, stop + 1), per_grade)
+                yield from zip(interior_ids.ravel().tolist(), grade_ids.tolist())
+
+        return ("InteriorID", "GradeID"), rows()
+
+    def write_sqlite(self, path) -> dict:
+        """
+        DataManager.init_DBと同じ手順（テーブル作成 → 一括投入 → インデックス・ビュー作成）でDBを構築する。
+        戻り値はテーブル毎の行数・所要時間
+        """
+        data_manager = SyntheticDataManager(path, self)
+        return data_manager.init_DB()
+
+    def write_arrow(self, path) -> dict:
+        """
+        CatalogSnapshotと同じ形式（テーブル毎のArrow IPCファイル + manifest.json）で書き出す。
+        チャンク毎にレコードバッチとして書き込む。戻り値はテーブル毎の行数
+        """
+        os.makedirs(path, exist_ok=True)
+        row_counts = {}
+        for table, (columns, rows) in self.tables():
+            row_counts[table] = 0
+            writer = None
+            for batch in self._batches(columns, rows):
+                if writer is None:
+                    writer = ipc.new_file(os.path.join(path, f"{table}.arrow"), batch.schema)
+                writer.write_batch(batch)
+                row_counts[table] += batch.num_rows
+            if writer is not None:
+                writer.close()
+        manifest = {"tables": list(row_counts), "row_counts": row_counts, "source_sha256": None}
+        with open(os.path.join(path, MANIFEST_FILE), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        return row_counts
+
+    def _batches(self, columns, rows):
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) == self.chunk_size:
+                yield self._batch(columns, chunk)
+                chunk = []
+        if chunk:
+            yield self._batch(columns, chunk)
+
+    def _batch(self, columns, chunk):
+        return pa.RecordBatch.from_arrays(
+            [pa.array(values) for values in zip(*chunk)], names=list(columns)
+        )
+
+
+class SyntheticDataManager(DataManager):
+    """
+    初期データの代わりに合成カタログからDBを構築するDataManager
+    """
+
+    def __init__(self, dbname, catalog) -> None:
+        super().__init__()
+        self.dbname = dbname
+        self.synthetic_catalog = catalog
+
+    def _read_seed_data(self):
+        return self.synthetic_catalog.tables()
+
+    def init_DB(self):
+        # テーブル毎の投入結果の出力は呼び出し元で表示する
+        with contextlib.redirect_stdout(io.StringIO()):
+            super().init_DB()
+        return self.synthetic_catalog.row_counts()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="合成カタログの生成")
+    parser.add_argument("--scale", type=float, default=10, help="初期データの何倍の規模にするか")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--sqlite", help="書き出すDBファイル")
+    parser.add_argument("--arrow", help="Arrow IPCファイルを書き出すディレクトリ")
+    args = parser.parse_args(argv)
+
+    catalog = SyntheticCatalog(scale=args.scale, seed=args.seed)
+    start = time.perf_counter()
+    if args.sqlite:
+        row_counts = catalog.write_sqlite(args.sqlite)
+    elif args.arrow:
+        row_counts = catalog.write_arrow(args.arrow)
+    else:
+        parser.error("--sqlite か --arrow を指定してください")
+    for table, count in row_counts.items():
+        print(f"{table}: {count} rows")
+    print(f"done in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
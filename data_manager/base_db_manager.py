@@ -1,5 +1,18 @@
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler
+import asyncio
+import atexit
+import functools
+import json
+import logging
+import os
+import pathlib
 import sqlite3
+import threading
+import time
+import weakref
 import pandas as pd
 
 class BaseDBManager(ABC):
@@ -18,69 +31,614 @@ class BaseDBManager(ABC):
     def insert_data(self, data):
         pass
 
+class SQliteConnectionPool:
+    """
+    SQLiteの接続プール。DBファイルと設定の組み合わせ毎に1つだけ生成し、SQliteManagerのインスタンス間で共有する
+    - 読み込み用の接続は使用中のスレッドが専有し、使用後は最大size本までプールに戻して再利用する
+    - 書き込み用の接続は1本だけ保持し、ロックで直列化する
+    - pragmasは接続を開いたときに1回だけ適用する
+    - journal_mode（WALなど）はDBファイルに保存される設定なので、書き込み用の接続を開いたときにだけ適用する。
+      読み込み用の接続を開く前に適用しておき、WALでは書き込み中も読み込みが止まらないようにする
+    - read_only_readersがTrueの場合、読み込み用の接続はmode=roのURIで開き、誤って書き込めないようにする
+    - DBファイルが削除・置換された場合は古い接続を破棄して開き直す
+    """
+
+    _pools = {}
+    _pools_lock = threading.Lock()
+
+    def __init__(self, path: str, size: int, pragmas: dict,
+                 journal_mode: str | None = None, read_only_readers: bool = False) -> None:
+        self.path = path
+        self.size = size
+        self.pragmas = pragmas
+        self.journal_mode = journal_mode
+        self.read_only_readers = read_only_readers
+        self._journal_mode_file = None  # journal_modeを適用したDBファイルの識別子
+        self._idle = []  # (接続, 接続時のファイル識別子)
+        self._idle_lock = threading.Lock()
+        self._writer = None
+        self._writer_lock = threading.RLock()
+        self.profiler = None  # SQliteManager.enable_profilerで設定するQueryProfiler
+        # 読み込み用・書き込み用の接続の貸し出しで同時に更新されるので、統計はこのロック内で更新・参照する
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+
+    @classmethod
+    def get_pool(cls, path: str, size: int, pragmas: dict,
+                 journal_mode: str | None = None, read_only_readers: bool = False):
+        """
+        共有プールを取得する。存在しない場合は生成して登録する
+        """
+        key = (os.path.abspath(path), size, tuple(sorted(pragmas.items())), journal_mode, read_only_readers)
+        with cls._pools_lock:
+            pool = cls._pools.get(key)
+            if pool is None:
+                pool = cls(path, size, dict(pragmas), journal_mode, read_only_readers)
+                cls._pools[key] = pool
+            return pool
+
+    @classmethod
+    def discard(cls, pool):
+        """
+        プールの接続を閉じて登録を解除する。構築途中の一時ファイルなど、以後使わないDBのプールに使う
+        """
+        with cls._pools_lock:
+            for key, registered in list(cls._pools.items()):
+                if registered is pool:
+                    del cls._pools[key]
+        pool.close()
+
+    @classmethod
+    def close_all(cls, path: str | None = None):
+        """
+        登録済みのすべてのプールの接続を閉じる。pathを指定した場合はそのDBファイルのプールだけを閉じる
+        """
+        with cls._pools_lock:
+            pools = [
+                pool for key, pool in cls._pools.items()
+                if path is None or key[0] == os.path.abspath(path)
+            ]
+        for pool in pools:
+            pool.close()
+
+    def _file_id(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_dev, stat.st_ino)
+
+    def _connect(self, read_only: bool = False):
+        if read_only:
+            uri = f"{pathlib.Path(os.path.abspath(self.path)).as_uri()}?mode=ro"
+            conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        else:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+        for key, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {key}={value}")
+        file_id = self._file_id()
+        if not read_only and self.journal_mode is not None:
+            conn.execute(f"PRAGMA journal_mode={self.journal_mode}")
+            self._journal_mode_file = file_id
+        return conn, file_id
+
+    def _ensure_journal_mode(self, file_id):
+        """
+        読み込み用の接続を開く前に、書き込み用の接続でjournal_modeを適用しておく
+        """
+        if self.journal_mode is None or file_id is None or self._journal_mode_file == file_id:
+            return
+        with self.writer():
+            pass
+
+    @contextmanager
+    def reader(self):
+        """
+        読み込み用の接続を借りる。プールに空きがなければ新しく開く
+        """
+        conn, file_id = None, None
+        current_id = self._file_id()
+        with self._idle_lock:
+            while self._idle:
+                conn, file_id = self._idle.pop()
+                if file_id == current_id:
+                    self._count(hits=1)
+                    break
+                self._count(stale=1)
+                conn.close()
+                conn = None
+            else:
+                self._count(misses=1)
+        if conn is None:
+            self._ensure_journal_mode(current_id)
+            conn, file_id = self._connect(read_only=self.read_only_readers)
+        try:
+            yield conn
+        finally:
+            # 暗黙に始まったトランザクションが残っていると、WALでは古いスナップショットを読み続けるので終了させる
+            if conn.in_transaction:
+                conn.rollback()
+            with self._idle_lock:
+                if len(self._idle) < self.size:
+                    self._idle.append((conn, file_id))
+                    conn = None
+            if conn is not None:
+                conn.close()
+
+    @contextmanager
+    def writer(self):
+        """
+        書き込み用の接続を専有する。書き込みはこの接続1本に直列化される
+        """
+        with self._writer_lock:
+            if self._writer is not None and self._writer[1] != self._file_id():
+                self._count(stale=1)
+                self._writer[0].close()
+                self._writer = None
+            if self._writer is None:
+                self._count(misses=1)
+                self._writer = self._connect()
+            else:
+                self._count(hits=1)
+            yield self._writer[0]
+
+    def _count(self, hits=0, misses=0, stale=0):
+        with self._stats_lock:
+            self.hits += hits
+            self.misses += misses
+            self.stale += stale
+
+    def stats(self) -> dict:
+        """
+        プールのヒット・ミスなどの統計情報
+        """
+        with self._stats_lock:
+            hits, misses, stale = self.hits, self.misses, self.stale
+        total = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "stale": stale,
+            "hit_rate": hits / total if total else 0.0,
+            "idle": len(self._idle),
+            "size": self.size,
+            "journal_mode": self.journal_mode,
+            "read_only_readers": self.read_only_readers,
+        }
+
+    def close(self):
+        """
+        プールが保持している接続をすべて閉じる
+        """
+        with self._idle_lock:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            conn.close()
+        with self._writer_lock:
+            if self._writer is not None:
+                self._writer[0].close()
+                self._writer = None
+
+
+atexit.register(SQliteConnectionPool.close_all)
+
+# DBファイルと一緒に作られるWAL・共有メモリ・ロールバックジャーナルのファイル
+SQLITE_SIDE_FILE_SUFFIXES = ("-wal", "-shm", "-journal")
+
+
+def remove_sqlite_files(path: str):
+    """
+    DBファイルをWALなどのファイルと一緒に削除する。先にこのDBファイルのプールの接続を閉じる。
+    古いWALが残っていると、同じ名前で作り直したDBに別のDBのWALとして適用されてしまうため、必ずまとめて削除する
+    """
+    SQliteConnectionPool.close_all(path)
+    for file_path in (path, *(path + suffix for suffix in SQLITE_SIDE_FILE_SUFFIXES)):
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
+
+class QueryProfiler:
+    """
+    SQL毎の実行回数・合計/最大時間・返した（変更した）行数を集計するクラス。
+    slow_seconds以上かかったSQLは、EXPLAIN QUERY PLANの結果と一緒にローテーションするログファイルにjson形式で書き出す
+    - log_path: スロークエリのログファイル。Noneの場合はログに書き出さず集計だけ行う
+    - max_bytes, backup_count: ログファイルの最大サイズと、ローテーションで残す世代数
+    """
+
+    def __init__(self, slow_seconds: float = 0.05, log_path: str | None = None,
+                 max_bytes: int = 1_000_000, backup_count: int = 3) -> None:
+        self.slow_seconds = slow_seconds
+        self.log_path = log_path
+        self._stats = {}
+        self._lock = threading.Lock()
+        self.logger = None
+        if log_path is not None:
+            self.logger = logging.getLogger(f"{__name__}.slow_query.{os.path.abspath(log_path)}")
+            self.logger.setLevel(logging.INFO)
+            self.logger.propagate = False
+            if not self.logger.handlers:
+                self.logger.addHandler(
+                    RotatingFileHandler(log_path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8")
+                )
+
+    def call(self, conn, sql: str, params, run, count_rows=len):
+        """
+        run()を実行して時間と行数を記録し、run()の戻り値を返す
+        - count_rows: run()の戻り値から行数を求める関数
+        """
+        start = time.perf_counter()
+        result = run()
+        self.record(conn, sql, params, time.perf_counter() - start, count_rows(result))
+        return result
+
+    def record(self, conn, sql: str, params, seconds: float, rows: int):
+        key = " ".join(sql.split())
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = {
+                    "count": 0, "total": 0.0, "max": 0.0, "rows": 0, "slow": 0, "full_scan": False
+                }
+            stats["count"] += 1
+            stats["total"] += seconds
+            stats["max"] = max(stats["max"], seconds)
+            stats["rows"] += max(rows, 0)
+        if seconds < self.slow_seconds:
+            return
+
+        plan = self._explain(conn, sql, params)
+        full_scan = any(
+            detail.startswith("SCAN") and detail != "SCAN CONSTANT ROW" for detail in plan
+        )
+        with self._lock:
+            stats["slow"] += 1
+            stats["full_scan"] = stats["full_scan"] or full_scan
+        if self.logger is not None:
+            self.logger.info(json.dumps(
+                {"at": time.time(), "seconds": seconds, "rows": rows, "sql": key,
+                 "full_scan": full_scan, "plan": plan},
+                ensure_ascii=False,
+            ))
+
+    def _explain(self, conn, sql: str, params) -> list:
+        """
+        EXPLAIN QUERY PLANの各行の説明。複数文のスクリプトなど、実行計画を取得できない場合は空のリスト
+        """
+        try:
+            rows = conn.execute(f"EXPLAIN QUERY PLAN {sql}", params or ()).fetchall()
+        except (sqlite3.Error, ValueError):
+            return []
+        return [row[-1] for row in rows]
+
+    def stats(self) -> dict:
+        """
+        {SQL: {"count", "total", "mean", "max", "rows", "slow", "full_scan"}}の形で集計結果を返す。合計時間の長い順に並べる
+        """
+        with self._lock:
+            items = [(sql, dict(stats)) for sql, stats in self._stats.items()]
+        items.sort(key=lambda item: item[1]["total"], reverse=True)
+        for _, stats in items:
+            stats["mean"] = stats["total"] / stats["count"]
+        return dict(items)
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+class UnitOfWork:
+    """
+    1つのトランザクション内で行う書き込みの単位。SQliteManager.transaction()から取得する
+    """
+
+    def __init__(self, conn: sqlite3.Connection, profiler: QueryProfiler | None = None) -> None:
+        self.conn = conn
+        self.profiler = profiler
+
+    def _call(self, sql, params, run):
+        if self.profiler is None:
+            return run()
+        return self.profiler.call(self.conn, sql, params, run, lambda cursor: cursor.rowcount)
+
+    def insert_record(self, table, record) -> int:
+        """
+        1レコードを挿入してIDを取得する
+        """
+        keys = record.keys()
+        columns = ', '.join(keys)
+        placeholders = ', '.join(['?'] * len(keys))
+        values = tuple(record[key] for key in keys)
+        sql = f"INSERT INTO {table} ({columns}) VALUES ({placeholders})"
+        cursor = self._call(sql, values, lambda: self.conn.execute(sql, values))
+        return cursor.lastrowid
+
+    def execute(self, sql, params=()):
+        """
+        1つのSQLを実行する
+        """
+        return self._call(sql, params, lambda: self.conn.execute(sql, params))
+
+    def insert_many(self, table, columns, rows):
+        """
+        同じ列構成の複数レコードをexecutemanyでまとめて挿入する
+        """
+        if not rows:
+            return
+        placeholders = ', '.join(['?'] * len(columns))
+        sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})"
+        self._call(sql, rows[0], lambda: self.conn.executemany(sql, rows))
+
+
 class SQliteManager(BaseDBManager):
+    """
+    sqlite3を操作するクラス。接続は同じDBファイルを扱うインスタンス間でプールを共有する
+    - pool_size: プールに保持する読み込み用接続の最大数
+    - pragmas: 接続を開いたときに適用するPRAGMA（busy_timeout, mmap_size, cache_sizeなど）
+    - journal_mode: DBファイルに適用するジャーナルモード。Noneの場合は変更しない
+    - read_only_readers: 読み込み用の接続を読み込み専用で開くか
+    """
+
+    pool_size = 4
+    pragmas = {}
+    journal_mode = None
+    read_only_readers = False
+
+    def __init__(self, path: str, pool_size: int | None = None, pragmas: dict | None = None,
+                 journal_mode: str | None = None, read_only_readers: bool | None = None) -> None:
+        super().__init__(path)
+        self.pool = SQliteConnectionPool.get_pool(
+            path,
+            pool_size if pool_size is not None else self.pool_size,
+            pragmas if pragmas is not None else self.pragmas,
+            journal_mode if journal_mode is not None else self.journal_mode,
+            read_only_readers if read_only_readers is not None else self.read_only_readers,
+        )
+
+    @contextmanager
+    def _write(self):
+        """
+        書き込み用の接続でコミットまで行う。例外時はロールバックする
+        """
+        with self.pool.writer() as conn:
+            try:
+                yield conn
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+    @contextmanager
+    def transaction(self):
+        """
+        複数の書き込みを1つのトランザクションにまとめるUnitOfWorkを返す。
+        ブロックを抜けたときに1回だけコミットし、例外時はすべてロールバックする
+        """
+        with self._write() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            yield UnitOfWork(conn, self.pool.profiler)
+
+    def bulk_load(self, tables, post_load_sql: str | None = None, journal_mode: str = "WAL") -> dict:
+        """
+        DB構築時の一括投入。ジャーナルをメモリ上に置き、同期書き込みを止めた状態で、すべてのテーブルを1つのトランザクションで挿入する。
+        投入後にpost_load_sql（インデックス作成など）を実行し、最後にjournal_modeへ切り替えて同期設定を元に戻す
+        - tables: (テーブル名, (列名, 行のイテラブル))のイテラブル
+        戻り値はテーブル毎の行数・所要時間・行/秒
+        """
+        report = {}
+        with self.pool.writer() as conn:
+            synchronous = conn.execute("PRAGMA synchronous").fetchone()[0]
+            # 失敗時にロールバックできるよう、ジャーナルはOFFではなくMEMORYにする
+            conn.execute("PRAGMA journal_mode=MEMORY")
+            conn.execute("PRAGMA synchronous=OFF")
+            try:
+                conn.execute("BEGIN")
+                conn.execute("PRAGMA defer_foreign_keys=ON")
+                for table, (columns, rows) in tables:
+                    placeholders = ', '.join(['?'] * len(columns))
+                    start = time.perf_counter()
+                    cursor = conn.executemany(
+                        f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})", rows
+                    )
+                    report[table] = self._load_stats(cursor.rowcount, time.perf_counter() - start)
+                conn.commit()
+                if post_load_sql:
+                    start = time.perf_counter()
+                    conn.executescript(post_load_sql)
+                    report["post_load_sql"] = self._load_stats(0, time.perf_counter() - start)
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                conn.execute(f"PRAGMA journal_mode={journal_mode}")
+                conn.execute(f"PRAGMA synchronous={synchronous}")
+        return report
+
+    def _load_stats(self, rows: int, seconds: float) -> dict:
+        return {
+            "rows": rows,
+            "seconds": seconds,
+            "rows_per_sec": rows / seconds if seconds > 0 else 0.0,
+        }
+
+    def enable_profiler(self, slow_seconds: float = 0.05, log_path: str | None = None) -> QueryProfiler:
+        """
+        このDBファイルのプールでSQLの実行時間の集計を開始する。すでに有効な場合は既存のQueryProfilerを返す
+        """
+        if self.pool.profiler is None:
+            self.pool.profiler = QueryProfiler(slow_seconds=slow_seconds, log_path=log_path)
+        return self.pool.profiler
+
+    def disable_profiler(self):
+        self.pool.profiler = None
+
+    def query_stats(self) -> dict:
+        """
+        SQL毎の実行回数・時間などの集計結果。プロファイラが無効な場合は空の辞書
+        """
+        if self.pool.profiler is None:
+            return {}
+        return self.pool.profiler.stats()
+
+    def _call(self, conn, sql: str, params, run, count_rows=len):
+        """
+        run()を実行する。プロファイラが有効な場合は時間と行数を記録する
+        """
+        profiler = self.pool.profiler
+        if profiler is None:
+            return run()
+        return profiler.call(conn, sql, params, run, count_rows)
+
+    def _rowcount(self, cursor) -> int:
+        return cursor.rowcount
+
     def execute(self, sql: str):
-        conn = sqlite3.connect(self.path)
-        cursor = conn.cursor()
-        cursor.execute(sql)
-        conn.commit()
-        conn.close()
+        with self._write() as conn:
+            self._call(conn, sql, (), lambda: conn.execute(sql), self._rowcount)
 
     def execute_script(self, sql: str):
-        conn = sqlite3.connect(self.path)
-        cursor = conn.cursor()
-        cursor.executescript(sql)
-        conn.commit()
-        conn.close()
+        with self._write() as conn:
+            self._call(conn, sql, (), lambda: conn.executescript(sql), self._rowcount)
 
     def execute_many(self, sql: str, value: list):
-        conn = sqlite3.connect(self.path)
-        cursor = conn.cursor()
-        cursor.executemany(sql, value)
-        conn.commit()
-        conn.close()
+        with self._write() as conn:
+            # executemanyは値が複数行なので実行計画は取得しない
+            self._call(conn, sql, None, lambda: conn.executemany(sql, value), self._rowcount)
 
     def insert_data(self, table, data):
         keys = data[0].keys()
-        columns = ', '.join(keys)
-        placeholders = ', '.join(['?'] * len(keys))
         values = [tuple(item[key] for key in keys) for item in data]
-        self.execute_many(f"INSERT INTO {table} ({columns}) VALUES ({placeholders})", values)
+        self.insert_rows(table, keys, values)
+
+    def insert_rows(self, table, columns, rows):
+        """
+        列名と値のタプルのイテラブルからレコードをまとめて挿入する
+        """
+        placeholders = ', '.join(['?'] * len(columns))
+        self.execute_many(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})", rows)
 
     def insert_record(self, table, record)-> int: 
-        conn = sqlite3.connect(self.path)
-        cursor = conn.cursor()
         print(record)
         keys = record.keys()
         columns = ', '.join(keys)
         placeholders = ', '.join(['?'] * len(keys))
         values = tuple(record[key] for key in keys)
-        cursor.execute(f"INSERT INTO {table} ({columns}) VALUES ({placeholders})", values)
-        last_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
+        sql = f"INSERT INTO {table} ({columns}) VALUES ({placeholders})"
+        with self._write() as conn:
+            cursor = self._call(conn, sql, values, lambda: conn.execute(sql, values), self._rowcount)
+            last_id = cursor.lastrowid
         return last_id
 
-    def get_data(self, sql: str) -> tuple:
-        conn = sqlite3.connect(self.path)
-        cursor = conn.cursor()
-        cursor.execute(sql)
-        data = cursor.fetchall()
-        conn.commit()
-        conn.close()
+    def get_data(self, sql: str, params=()) -> tuple:
+        with self.pool.reader() as conn:
+            data = self._call(conn, sql, params, lambda: conn.execute(sql, params).fetchall())
         return data
     
-    def get_df(self, sql: str) -> pd.DataFrame|None:
+    def get_df(self, sql: str, params=None) -> pd.DataFrame|None:
         try:
-            conn = sqlite3.connect(self.path)
-            df = pd.read_sql_query(sql, conn)
+            with self.pool.reader() as conn:
+                df = self._call(conn, sql, params, lambda: pd.read_sql_query(sql, conn, params=params))
         except sqlite3.Error as e:
             print(f"An error occurred: {e}")
             df = None
-        finally:
-            conn.close()
         return df
 
+    def pool_stats(self) -> dict:
+        """
+        接続プールの統計情報
+        """
+        return self.pool.stats()
+
+    def close(self):
+        """
+        このDBファイルのプールが保持している接続を閉じる
+        """
+        self.pool.close()
+
+    def discard(self):
+        """
+        接続を閉じて共有プールの登録を解除する。以後このインスタンスは使わない
+        """
+        SQliteConnectionPool.discard(self.pool)
+
+class AsyncSQliteManager(BaseDBManager):
+    """
+    SQliteManagerの非同期版。内部のSQliteManager（db_manager）の各操作をスレッドプールで実行し、イベントループをブロックしない
+    BaseDBManagerのメソッドはコルーチンとして提供する
+    - max_concurrency: 同時にDBにアクセスする操作の最大数。超えた分はスレッドを使わずにイベントループ上で待つ
+    - その他の引数はSQliteManagerと同じ。接続プールは同じ設定のSQliteManagerと共有する
+    """
+
+    max_concurrency = 4
+
+    def __init__(self, path: str, pool_size: int | None = None, pragmas: dict | None = None,
+                 journal_mode: str | None = None, read_only_readers: bool | None = None,
+                 max_concurrency: int | None = None) -> None:
+        super().__init__(path)
+        self.db_manager = SQliteManager(path, pool_size, pragmas, journal_mode, read_only_readers)
+        self.max_concurrency = max_concurrency if max_concurrency is not None else self.max_concurrency
+        self.executor = ThreadPoolExecutor(
+            max_workers=self.max_concurrency, thread_name_prefix="sqlite"
+        )
+        # asyncio.Semaphoreは最初に使ったイベントループに紐づくので、ループ毎に作る
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    def _semaphore(self):
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        return semaphore
+
+    async def run(self, func, *args, **kwargs):
+        """
+        ブロッキングする関数をスレッドプールで実行して結果を返す
+        """
+        async with self._semaphore():
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+    async def run_in_transaction(self, func):
+        """
+        func(uow)を1つのトランザクションで実行する。例外時はすべてロールバックする
+        """
+        def run():
+            with self.db_manager.transaction() as uow:
+                return func(uow)
+
+        return await self.run(run)
+
+    async def execute(self, sql: str):
+        return await self.run(self.db_manager.execute, sql)
+
+    async def execute_script(self, sql: str):
+        return await self.run(self.db_manager.execute_script, sql)
+
+    async def execute_many(self, sql: str, value: list):
+        return await self.run(self.db_manager.execute_many, sql, value)
+
+    async def insert_data(self, table, data):
+        return await self.run(self.db_manager.insert_data, table, data)
+
+    async def insert_rows(self, table, columns, rows):
+        return await self.run(self.db_manager.insert_rows, table, columns, rows)
+
+    async def insert_record(self, table, record) -> int:
+        return await self.run(self.db_manager.insert_record, table, record)
+
+    async def get_data(self, sql: str, params=()) -> tuple:
+        return await self.run(self.db_manager.get_data, sql, params)
+
+    async def get_df(self, sql: str, params=None) -> pd.DataFrame | None:
+        return await self.run(self.db_manager.get_df, sql, params)
+
+    def close(self):
+        """
+        実行中の操作の完了を待ってスレッドプールを止める。接続プールは共有しているので閉じない
+        """
+        self.executor.shutdown(wait=True)
+
 class BasicDataObject(ABC):
     def __init__(self, data:dict, table_name:str, db:BaseDBManager):
         self.data = data
@@ -0,0 +1,166 @@
+import numpy as np
+
+from domain_context.default_values import AGE_RANGE, HOUR_RANGE
+
+# calculate_costsが追加する列
+COST_COLUMNS = [
+    "FuelCost",
+    "MainteCost",
+    "InsuranceCost",
+    "ResaleValue",
+    "MonthlyTotalCost",
+    "MonthlyRealCost",
+]
+
+
+class CostEngine:
+    """
+    使用年数×乗車時間のすべての組み合わせについて、各種コストを事前計算しておくクラス。
+    DataManager.calculate_costsと同じ計算を グレード×使用年数×乗車時間 の配列で一括して行い、
+    リクエスト時は配列のスライスを返すだけにする。値が収まる場合はint32で保持する
+    """
+
+    def __init__(self, df, age_range=AGE_RANGE, hour_range=HOUR_RANGE):
+        self.age_min, self.age_max = age_range
+        self.hour_min, self.hour_max = hour_range
+
+        # (グレード, 使用年数, 乗車時間)の3次元にブロードキャストする
+        hold_month = (np.arange(self.age_min, self.age_max + 1) * 12)[None, :, None]
+        hour = np.arange(self.hour_min, self.hour_max + 1)[None, None, :]
+        price = self._column(df, "price")
+        fuel_cost_per_kilo = self._column(df, "FuelCostPerKilo")
+        mainte_cost = self._column(df, "MonthlyMainteCost")
+        insurance_cost = self._column(df, "MonthlyInsuranceCost")
+        price_drop_rate = self._column(df, "MonthlyPriceDropRate")
+
+        # 演算順序はcalculate_costsと揃え、丸め結果が一致するようにする
+        fuel = (fuel_cost_per_kilo * hour * 40 * hold_month * 30).astype(int)
+        mainte = (mainte_cost * hold_month).astype(int)
+        insurance = (insurance_cost * hold_month).astype(int)
+        resale = (price * (1 - price_drop_rate) ** hold_month).astype(int)
+        monthly_total = fuel / 30 + mainte_cost + insurance_cost
+        monthly_real = (price - resale + monthly_total * hold_month) / hold_month
+
+        shape = (len(df), self.age_max - self.age_min + 1, self.hour_max - self.hour_min + 1)
+        self.tensors = {
+            name: np.broadcast_to(self._narrow(values), shape)
+            for name, values in zip(
+                COST_COLUMNS,
+                (
+                    fuel,
+                    mainte,
+                    insurance,
+                    resale,
+                    monthly_total.astype(int),
+                    monthly_real.astype(int),
+                ),
+            )
+        }
+        for values in self.tensors.values():
+            values.flags.writeable = False
+
+    def _column(self, df, name):
+        # compact_frameで縮めた整数の列も、計算はint64で行ってオーバーフローさせない
+        values = df[name].to_numpy()
+        if np.issubdtype(values.dtype, np.integer):
+            values = values.astype(np.int64)
+        return values[:, None, None]
+
+    @staticmethod
+    def _narrow(values):
+        """
+        グレード×使用年数×乗車時間の配列は大きいので、値が収まればint32で保持する（int64の半分のメモリ）
+        """
+        values = values.astype(np.int64)
+        info = np.iinfo(np.int32)
+        if values.size == 0 or (info.min <= values.min() and values.max() <= info.max):
+            return values.astype(np.int32)
+        return values
+
+    def nbytes(self):
+        """
+        事前計算した配列のバイト数。使用年数・乗車時間で値が変わらない配列はブロードキャストしているので実体の分だけ数える
+        """
+        return sum(values.base.nbytes if values.base is not None else values.nbytes for values in self.tensors.values())
+
+    def supports(self, age, hour):
+        """
+        事前計算済みの範囲に含まれる組み合わせかどうか
+        """
+        return (
+            int(age) == age
+            and int(hour) == hour
+            and self.age_min <= age <= self.age_max
+            and self.hour_min <= hour <= self.hour_max
+        )
+
+    def costs(self, age, hour):
+        """
+        指定した組み合わせの各種コストを、グレード順の配列（保持している型のビュー）として返す
+        """
+        a = int(age) - self.age_min
+        h = int(hour) - self.hour_min
+        return {name: values[:, a, h] for name, values in self.tensors.items()}
+
+    def frame(self, age, hour, df):
+        """
+        元のデータフレームに、指定した組み合わせのコスト列を追加したデータフレームを返す
+        列の型はcalculate_costsと同じint64にする
+        """
+        df = df.to_dataframe() if hasattr(df, "to_dataframe") else df.copy()
+        for name, values in self.costs(age, hour).items():
+            df[name] = values.astype(np.int64)
+        return df
+
+
+class BudgetIndex:
+    """
+    予算検索用のインデックス。カテゴリ毎に、(使用年数, 乗車時間)の組み合わせ毎のグレードを実質月額の安い順に並べて保持する。
+    予算内のグレードは二分探索で求まる先頭からの連続区間になる
+    """
+
+    def __init__(self, df_grades, df_models):
+        cost_engine = df_grades.get_derived(CostEngine)
+        self.age_min = cost_engine.age_min
+        self.hour_min = cost_engine.hour_min
+        monthly_real_cost = cost_engine.tensors["MonthlyRealCost"]
+        category_of_model = dict(zip(df_models["model_id"], df_models["category_name"]))
+        categories = df_grades["model_id"].map(category_of_model).to_numpy()
+
+        self._index = {}
+        for category in dict.fromkeys(categories):
+            if category is None or category != category:  # モデルが見つからないグレードは除外
+                continue
+            positions = np.flatnonzero(categories == category)
+            # (使用年数, 乗車時間, グレード)の順に並べ替え、最後の軸をコスト順にソートする
+            costs = np.moveaxis(monthly_real_cost[positions], 0, -1)
+            order = np.argsort(costs, axis=-1, kind="stable")
+            self._index[category] = (
+                positions.astype(np.int32)[order],
+                np.take_along_axis(costs, order, axis=-1),
+            )
+
+    def search(self, category, budget, age, hour, limit=None, offset=0):
+        """
+        実質月額がbudget未満のグレードの位置を、安い順に返す
+        """
+        if category not in self._index:
+            return np.empty(0, dtype=np.int32)
+        positions, costs = self._index[category]
+        a, h = self._locate(age, hour)
+        end = int(np.searchsorted(costs[a, h], budget, side="left"))
+        stop = end if limit is None else min(end, offset + limit)
+        return positions[a, h, offset:stop]
+
+    def count(self, category, budget, age, hour):
+        """
+        実質月額がbudget未満のグレードの件数
+        """
+        if category not in self._index:
+            return 0
+        _, costs = self._index[category]
+        a, h = self._locate(age, hour)
+        return int(np.searchsorted(costs[a, h], budget, side="left"))
+
+    def _locate(self, age, hour):
+        return int(age) - self.age_min, int(hour) - self.hour_min
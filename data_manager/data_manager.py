@@ -1,22 +1,79 @@
+import asyncio
+import atexit
 import os
+import itertools
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
 import numpy as np
+import pandas as pd
 import json
+from filelock import FileLock
 
-from data_manager.base_db_manager import SQliteManager
-from domain_context.db_config import DB_NAME, CREATE_TABLES_SQL_PATH, DB_JSON_DATA_PATH
+from data_manager.base_db_manager import SQliteManager, AsyncSQliteManager, remove_sqlite_files
+from data_manager.cost_engine import CostEngine, BudgetIndex
+from data_manager.snapshot import CatalogSnapshot
+from data_manager.reservation_queue import ReservationQueue
+from domain_context.db_config import (
+    DB_NAME,
+    CREATE_TABLES_SQL_PATH,
+    CREATE_INDEXES_SQL_PATH,
+    CREATE_VIEWS_SQL_PATH,
+    DB_JSON_DATA_PATH,
+    DB_SNAPSHOT_PATH,
+    DB_POOL_SIZE,
+    DB_PRAGMAS,
+    DB_JOURNAL_MODE,
+    DB_READ_ONLY_READERS,
+    DB_ASYNC_CONCURRENCY,
+    DB_BUILD_LOCK_TIMEOUT,
+    OPTION_CACHE_SIZE,
+    RESERVATION_JOURNAL_SUFFIX,
+)
+from domain_context.profile_config import (
+    QUERY_PROFILE_ENABLED,
+    SLOW_QUERY_SECONDS,
+    SLOW_QUERY_LOG_PATH,
+)
 
 
 class ImmutableDataFrame:
     """
     イミュータブルなデータオブジェクト。最初にインプットした列は変更不可。後から追加した列は変更可
+    作成時に1回だけ各列をコピーしてNumPy配列を書き込み不可にし、以降はコピーせずにビューを渡す。
+    ビューの値を書き換えようとするとValueErrorになる
     """
 
     def __init__(self, df):
         self._original_columns = df.columns
-        self._dataframe = df.copy()  # ディープコピーして元データを保護
+        self._dataframe = self._read_only_copy(df)  # 1回だけコピーして元データを保護
+        self._derived = {}
+        self._derived_lock = threading.Lock()
+
+    @staticmethod
+    def _read_only_copy(df):
+        columns = {}
+        for name, series in df.items():
+            if isinstance(series.dtype, pd.CategoricalDtype):
+                codes = series.cat.codes.to_numpy().copy()
+                codes.flags.writeable = False
+                columns[name] = pd.Categorical.from_codes(codes, dtype=series.dtype)
+            elif isinstance(series.dtype, np.dtype):
+                values = series.to_numpy(copy=True)
+                values.flags.writeable = False
+                columns[name] = values
+            else:
+                columns[name] = series.array.copy()
+        return pd.DataFrame(columns, index=df.index, columns=df.columns, copy=False)
+
+    def _view(self):
+        # 列の追加・削除やinplace操作が共有データに影響しないよう、データを共有した別のデータフレームを返す
+        return self._dataframe.copy(deep=False)
 
     def __getitem__(self, key):
-        return self._dataframe[key]
+        return self._view()[key]
 
     def __setitem__(self, key, value):
         raise ValueError(
@@ -24,7 +81,7 @@ class ImmutableDataFrame:
         )
 
     def __getattr__(self, attr):
-        return getattr(self._dataframe, attr)
+        return getattr(self._view(), attr)
 
     def __repr__(self):
         return repr(self._dataframe)
@@ -33,7 +90,325 @@ class ImmutableDataFrame:
         return len(self._dataframe)
 
     def to_dataframe(self):
-        return self._dataframe.copy()  # 元データは変更されない
+        """
+        データを共有したデータフレームを返す。列の追加は可能だが、元の列の値は書き換えられない
+        値を書き換える場合は.copy()してから使う
+        """
+        return self._view()
+
+    def get_derived(self, factory, *sources):
+        """
+        このデータフレームから作られる派生データ構造（インデックスなど）を取得する。
+        元データは変更されないので、factory(self, *sources)の結果を1回だけ作ってキャッシュする
+        - sources: 派生データの作成に使う他のImmutableDataFrame
+        """
+        key = (factory, *sources)
+        derived = self._derived.get(key)
+        if derived is None:
+            with self._derived_lock:
+                derived = self._derived.get(key)
+                if derived is None:
+                    derived = factory(self, *sources)
+                    self._derived[key] = derived
+        return derived
+
+
+class GradeLookup:
+    """
+    グレードID・表示名(name_desc)からカタログの行位置を引くためのハッシュインデックス。
+    df_grades.get_derived(GradeLookup)でカタログ読み込み時に1回だけ作る
+    name_descは重複することがあるため、同じ表示名のグレードが複数ある場合は先頭のグレードIDを返す
+    """
+
+    def __init__(self, df_grades):
+        grade_ids = [int(grade_id) for grade_id in df_grades["grade_id"].tolist()]
+        self._positions = {grade_id: position for position, grade_id in enumerate(grade_ids)}
+        self._grade_ids = {}
+        for name_desc, grade_id in zip(df_grades["name_desc"].tolist(), grade_ids):
+            self._grade_ids.setdefault(name_desc, grade_id)
+
+    def __contains__(self, grade_id):
+        return int(grade_id) in self._positions
+
+    def position(self, grade_id):
+        """
+        グレードIDに対応する行位置（df_grades.iloc用）
+        """
+        return self._positions[int(grade_id)]
+
+    def positions(self, grade_ids):
+        """
+        複数のグレードIDに対応する行位置。渡した順番のまま返す
+        """
+        return [self._positions[int(grade_id)] for grade_id in grade_ids]
+
+    def grade_id(self, name_desc):
+        """
+        表示名に対応するグレードID
+        """
+        return self._grade_ids[name_desc]
+
+
+class Catalog:
+    """
+    プロセス全体で共有する読み取り専用のカタログ。全セッションが同じオブジェクトを参照し、セッション側はポインタとバージョンだけを保持する
+    - version: カタログを読み込むたびに採番されるバージョン。セッションはこの値で読み直しの要否を判断する
+    グレード毎のオプション（外装・内装）はカタログに含めず、OptionRepositoryで必要なときに取得する
+    """
+
+    def __init__(self, version, df_models, df_colors, df_grades):
+        self.version = version
+        self.loaded_at = time.time()
+        self.memory_report = {}
+        self.df_models = ImmutableDataFrame(df_models)
+        self.df_colors = ImmutableDataFrame(df_colors)
+        self.df_grades = ImmutableDataFrame(df_grades)
+        # 全セッションで使うコストの事前計算と検索用インデックスはカタログ読み込み時に作っておく
+        self.df_grades.get_derived(CostEngine)
+        self.df_grades.get_derived(BudgetIndex, self.df_models)
+        self.df_grades.get_derived(GradeLookup)
+
+    def session_values(self):
+        """
+        セッションに保存する値。データフレームはコピーせず共有オブジェクトをそのまま渡す
+        """
+        return {
+            "catalog_version": self.version,
+            "df_models": self.df_models,
+            "df_colors": self.df_colors,
+            "df_grades": self.df_grades,
+        }
+
+
+class OptionRepository:
+    """
+    グレード毎のオプション（外装・内装）を必要になったときにDBから取得するクラス。
+    オプション本体は種類毎に1件1行で1回だけ保持し、グレード毎にはオプションの行位置の配列（CSR形式の1グレード分のスライス）だけを
+    パラメータ付きのクエリで取得する。最近使ったグレードの行位置を最大maxsize件までLRUで保持し、プロセス内の全セッションで共有する
+    """
+
+    def __init__(self, db_manager, maxsize=OPTION_CACHE_SIZE):
+        self.db_manager = db_manager
+        self.maxsize = maxsize
+        self._options = {}
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_exteriors(self, grade_id):
+        """
+        グレードで選択可能な外装の一覧
+        """
+        return self.get("exterior", grade_id)
+
+    def get_interiors(self, grade_id):
+        """
+        グレードで選択可能な内装の一覧
+        """
+        return self.get("interior", grade_id)
+
+    def get(self, kind, grade_id):
+        """
+        グレードで選択可能なオプションの一覧
+        - kind: "exterior"（外装）または"interior"（内装）
+        """
+        options, _, _, _ = self._get_option_table(kind)
+        return options.iloc[self.positions(kind, grade_id)]
+
+    def ids(self, kind, grade_id):
+        """
+        グレードで選択可能なオプションのID
+        """
+        _, option_ids, _, _ = self._get_option_table(kind)
+        return option_ids[self.positions(kind, grade_id)]
+
+    def positions(self, kind, grade_id):
+        """
+        グレードで選択可能なオプションのオプション本体内の行位置（オプションID順）。登録が無いグレードは空の配列
+        """
+        key = (kind, int(grade_id))
+        with self._lock:
+            positions = self._cache.get(key)
+            if positions is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return positions
+            self.misses += 1
+
+        _, _, sorted_ids, id_order = self._get_option_table(kind)
+        _, _, grade_sql = OPTION_SQL[kind]
+        grade_option_ids = np.sort(np.asarray(
+            [row[0] for row in self.db_manager.get_data(grade_sql, params=key[1:])], dtype=np.int64
+        ))
+        # オプションIDを行位置に変換する。オプション本体に無いIDはJOINと同様に除外する
+        located = np.searchsorted(sorted_ids, grade_option_ids)
+        found = located < len(sorted_ids)
+        found[found] = sorted_ids[located[found]] == grade_option_ids[found]
+        positions = id_order[located[found]].astype(np.int32)
+        positions.flags.writeable = False
+        with self._lock:
+            self._cache[key] = positions
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)
+                self.evictions += 1
+        return positions
+
+    def _get_option_table(self, kind):
+        """
+        (オプション本体, オプションID, 昇順に並べたオプションID, その並び順)。初回のみDBから読み込む
+        """
+        table = self._options.get(kind)
+        if table is None:
+            options_sql, id_column, _ = OPTION_SQL[kind]
+            df_options, _ = compact_frame(self.db_manager.get_df(options_sql))
+            option_ids = df_options[id_column].to_numpy().astype(np.int64)
+            id_order = np.argsort(option_ids, kind="stable")
+            sorted_ids = option_ids[id_order]
+            for values in (option_ids, id_order, sorted_ids):
+                values.flags.writeable = False
+            table = (ImmutableDataFrame(df_options), option_ids, sorted_ids, id_order)
+            with self._lock:
+                table = self._options.setdefault(kind, table)
+        return table
+
+    def clear(self):
+        with self._lock:
+            self._options.clear()
+            self._cache.clear()
+
+    def stats(self):
+        """
+        キャッシュのヒット率などの統計情報
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / total if total else 0.0,
+                "size": len(self._cache),
+                "maxsize": self.maxsize,
+            }
+
+
+# 初期データを挿入するテーブル。IDが自動採番されるので、参照される側から順に挿入する
+SEED_TABLES = [
+    "CarCategories",
+    "CarModels",
+    "CarGrades",
+    "Engines",
+    "Bases",
+    "Colors",
+    "Exteriors",
+    "GradeExteriors",
+    "Interiors",
+    "GradeInteriors",
+]
+
+# 検索結果として返す列
+SEARCH_RESULT_COLUMNS = [
+    "grade_id",
+    "image_url",
+    "name_desc",
+    "MonthlyRealCost",
+    "MonthlyTotalCost",
+    "ResaleValue",
+    "rank",
+]
+
+# カタログ・オプション（外装・内装）の一覧を取得するSQL
+MODELS_SQL = """
+                                        SELECT ModelID as model_id, CategoryName as category_name, ModelName as model_name, ImageURL as img_url from CarModels
+                                        JOIN CarCategories ON CarCategories.CategoryID == CarModels.CategoryID
+                                        """
+COLORS_SQL = """
+                                        SELECT ColorID as color_id, ColorName as name, AdditionalCost as price, ImageURL as img_url from Colors
+                                        """
+GRADES_SQL = """
+                                        SELECT * from GradeCatalog
+                                        """
+EXTERIOR_OPTIONS_SQL = """
+                        SELECT Exteriors.ExteriorID as exterior_id, GradeExteriors.GradeID as grade_id, 
+                        ModelID as model_id, Item as name, AdditionalCost as price, ImageURL as img_url 
+                        from Exteriors JOIN GradeExteriors ON Exteriors.ExteriorID == GradeExteriors.ExteriorID
+                        JOIN CarGrades ON GradeExteriors.GradeID == CarGrades.GradeID
+                        """
+INTERIOR_OPTIONS_SQL = """
+                        SELECT Interiors.InteriorID as interior_id, GradeInteriors.GradeID as grade_id, 
+                        ModelID as model_id, Item as name, AdditionalCost as price, ImageURL as img_url 
+                        from Interiors JOIN GradeInteriors ON Interiors.InteriorID == GradeInteriors.InteriorID
+                        JOIN CarGrades ON GradeInteriors.GradeID == CarGrades.GradeID
+                        """
+# OptionRepositoryで使う、オプション本体を取得するSQL・IDの列と、グレードで選択可能なオプションのIDを取得するSQL
+OPTION_SQL = {
+    "exterior": (
+        "SELECT ExteriorID as exterior_id, Item as name, AdditionalCost as price, ImageURL as img_url from Exteriors",
+        "exterior_id",
+        "SELECT ExteriorID from GradeExteriors WHERE GradeID = ?",
+    ),
+    "interior": (
+        "SELECT InteriorID as interior_id, Item as name, AdditionalCost as price, ImageURL as img_url from Interiors",
+        "interior_id",
+        "SELECT InteriorID from GradeInteriors WHERE GradeID = ?",
+    ),
+}
+
+# create_db.sqlの文から作成するテーブル名を取り出す
+CREATE_TABLE_PATTERN = re.compile(r"CREATE TABLE (\w+)")
+
+# 重複の多い文字列列とみなす、ユニーク値の数/行数の上限
+CATEGORY_RATIO = 0.5
+
+
+def compact_frame(df, category_ratio=CATEGORY_RATIO):
+    """
+    データフレームのメモリ使用量を減らす。重複の多い文字列の列はカテゴリ型（コード+ユニーク値）に、
+    整数の列は値が収まる最小の型に変換する。浮動小数点の列はコスト計算の結果が変わらないようにfloat64のまま残す
+    縮めた整数の列は保持用なので、コスト計算などの演算ではint64に戻してから使う
+    戻り値は(変換後のデータフレーム, {"before": 変換前のバイト数, "after": 変換後のバイト数})
+    """
+    compacted_df = df.copy()
+    for name in compacted_df.columns:
+        series = compacted_df[name]
+        if series.dtype == object:
+            if len(series) and series.nunique() <= len(series) * category_ratio:
+                compacted = series.astype("category")
+            else:
+                continue
+        elif pd.api.types.is_integer_dtype(series.dtype):
+            compacted = pd.to_numeric(series, downcast="integer")
+        else:
+            continue
+        # 行数が少ないとカテゴリ型の方が大きくなることがあるので、小さくなる場合だけ置き換える
+        if compacted.memory_usage(deep=True) < series.memory_usage(deep=True):
+            compacted_df[name] = compacted
+    # 文字列はハッシュ計算時にUTF-8表現がキャッシュされサイズが変わるため、変換前後とも変換後に計測する
+    before = int(df.memory_usage(deep=True).sum())
+    after = int(compacted_df.memory_usage(deep=True).sum())
+    return compacted_df, {"before": before, "after": after}
+
+
+# プロセス共有のカタログとオプション。DBファイル毎に1つだけ保持する
+_catalogs = {}
+_option_repositories = {}
+_catalog_lock = threading.Lock()
+_catalog_versions = itertools.count(1)
+# プロセス共有の非同期DBアクセス（スレッドプール）。DBファイル毎に1つだけ保持する
+_async_db_managers = {}
+# プロセス共有の予約の書き込みキュー。DBファイル毎に1つだけ保持し、終了時に残りを書き込む
+_reservation_queues = {}
+
+
+def _close_reservation_queues():
+    for reservation_queue in list(_reservation_queues.values()):
+        reservation_queue.close()
+
+
+atexit.register(_close_reservation_queues)
 
 
 class DataManager:
@@ -44,84 +419,238 @@ class DataManager:
     def __init__(self) -> None:
         self.dbname = DB_NAME
         self.create_tables_sql_path = CREATE_TABLES_SQL_PATH
+        self.create_indexes_sql_path = CREATE_INDEXES_SQL_PATH
+        self.create_views_sql_path = CREATE_VIEWS_SQL_PATH
         self.db_json_data_path = DB_JSON_DATA_PATH
+        self.db_snapshot_path = DB_SNAPSHOT_PATH
 
     def init_DB(self):
         """
-        DBが存在しない場合、jsonファイルからDBを構築する
+        DBが存在しない場合、初期データからDBを構築する。スナップショットがあればjsonよりも優先して使う
+        既存のDBにcreate_db.sqlのテーブルやインデックス・ビューが無い場合は追加する
+        構築はファイルロックを取って一時ファイルに行い、完了後にDBファイルへアトミックに置き換える。
+        同時に呼ばれた場合は先に構築を始めた1つだけが構築し、他はロックを待って完成したDBを使う
         """
-        _db_manager = SQliteManager(self.dbname)
+        if self._catalog_schema_ready():
+            return
+        with FileLock(self.dbname + ".lock", timeout=DB_BUILD_LOCK_TIMEOUT):
+            # ロックを待つ間に他のプロセス・スレッドが構築を終えていれば何もしない
+            if not os.path.isfile(self.dbname):
+                self._build_DB()
+            elif not self._catalog_schema_ready():
+                self._get_db_manager().execute_script(
+                    "\n".join(self._missing_tables_sql()) + self._read_catalog_schema_sql()
+                )
 
+    def _catalog_schema_ready(self):
         if not os.path.isfile(self.dbname):
+            return False
+        return bool(
+            self._get_db_manager().get_data(
+                "SELECT name FROM sqlite_master WHERE type = 'view' AND name = 'GradeCatalog'"
+            )
+        ) and not self._missing_tables_sql()
+
+    def _missing_tables_sql(self):
+        """
+        create_db.sqlのテーブルのうち、既存のDBに無いもの（後から追加したテーブル）を作成するSQL
+        """
+        with open(self.create_tables_sql_path, "r", encoding="utf-8") as f:
+            statements = [statement.strip() for statement in f.read().split(";") if statement.strip()]
+        tables = {
+            row[0] for row in self._get_db_manager().get_data("SELECT name FROM sqlite_master WHERE type = 'table'")
+        }
+        return [
+            statement + ";"
+            for statement in statements
+            if CREATE_TABLE_PATTERN.search(statement).group(1) not in tables
+        ]
+
+    def _build_DB(self):
+        """
+        DBファイルと同じディレクトリの一時ファイルに構築し、os.replaceでDBファイルに置き換える。
+        構築途中のファイルをDBファイルとして読まれることは無い。失敗した場合は一時ファイルを削除する
+        """
+        directory, filename = os.path.split(os.path.abspath(self.dbname))
+        fd, tmp_path = tempfile.mkstemp(prefix=f"{filename}.", suffix=".tmp", dir=directory)
+        os.close(fd)
+        _tmp_manager = SQliteManager(tmp_path, pool_size=1, pragmas=DB_PRAGMAS)
+        try:
             with open(self.create_tables_sql_path, "r", encoding="utf-8") as f:
                 create_tables_sql = f.read()
 
-            _db_manager.execute_script(create_tables_sql)
+            _tmp_manager.execute_script(create_tables_sql)
 
-            with open(self.db_json_data_path, "r", encoding="utf-8") as f:
-                data = json.load(f)
+            # 初期データを1つのトランザクションで一括投入し、インデックスとビューは投入後に作成する
+            report = _tmp_manager.bulk_load(
+                self._read_seed_data(), post_load_sql=self._read_catalog_schema_sql()
+            )
+            # 置き換える前に接続を閉じて、WALの内容をDBファイル本体に書き戻す
+            _tmp_manager.discard()
+            os.replace(tmp_path, self.dbname)
+        except BaseException:
+            _tmp_manager.discard()
+            remove_sqlite_files(tmp_path)
+            raise
+        for table, stats in report.items():
+            print(
+                f"{table}: {stats['rows']} rows in {stats['seconds']:.3f}s "
+                f"({stats['rows_per_sec']:.0f} rows/sec)"
+            )
 
-            # jsonファイルからデータをDBへ挿入
-            _db_manager.insert_data("CarCategories", data["CarCategories"])
-            _db_manager.insert_data("CarModels", data["CarModels"])
-            _db_manager.insert_data("CarGrades", data["CarGrades"])
-            _db_manager.insert_data("Engines", data["Engines"])
-            _db_manager.insert_data("Bases", data["Bases"])
-            _db_manager.insert_data("Colors", data["Colors"])
-            _db_manager.insert_data("Exteriors", data["Exteriors"])
-            _db_manager.insert_data("GradeExteriors", data["GradeExteriors"])
-            _db_manager.insert_data("Interiors", data["Interiors"])
-            _db_manager.insert_data("GradeInteriors", data["GradeInteriors"])
+    def _read_catalog_schema_sql(self):
+        """
+        データ投入後に作成するインデックスとビューのSQL
+        """
+        sql = []
+        for path in (self.create_indexes_sql_path, self.create_views_sql_path):
+            with open(path, "r", encoding="utf-8") as f:
+                sql.append(f.read())
+        return "\n".join(sql)
+
+    def _read_seed_data(self):
+        """
+        初期データをテーブル毎に(テーブル名, (列名, 行のイテラブル))の形で順に返す
+        """
+        snapshot = CatalogSnapshot(self.db_snapshot_path)
+        if snapshot.is_valid(self.db_json_data_path):
+            for table in SEED_TABLES:
+                yield table, snapshot.iter_rows(table)
+            return
+
+        with open(self.db_json_data_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        for table in SEED_TABLES:
+            keys = list(data[table][0].keys())
+            yield table, (keys, [tuple(item[key] for key in keys) for item in data[table]])
+
+    def get_catalog(self):
+        """
+        プロセス共有のカタログを取得する。初回のみDBの初期化と読み込みを行い、以降は同じオブジェクトを返す
+        """
+        catalog = _catalogs.get(self.dbname)
+        if catalog is None:
+            with _catalog_lock:
+                catalog = _catalogs.get(self.dbname)
+                if catalog is None:
+                    catalog = self._load_catalog()
+        return catalog
+
+    def reload_catalog(self):
+        """
+        DBからカタログを読み直してバージョンを更新する。各セッションは次の再実行時に新しいカタログを参照する
+        """
+        with _catalog_lock:
+            return self._load_catalog()
 
-    def load_data_from_DB(self):
+    def _load_catalog(self):
+        self.init_DB()
+        df_models, _, _, df_colors, df_grades = self.load_data_from_DB(include_options=False)
+        catalog = Catalog(next(_catalog_versions), df_models, df_colors, df_grades)
+        catalog.memory_report = self.memory_report
+        if catalog.memory_report:
+            before = sum(report["before"] for report in catalog.memory_report.values())
+            after = sum(report["after"] for report in catalog.memory_report.values())
+            print(f"catalog {catalog.version} loaded: {before / 1e6:.2f}MB -> {after / 1e6:.2f}MB after compaction")
+        _catalogs[self.dbname] = catalog
+        if self.dbname in _option_repositories:
+            _option_repositories[self.dbname].clear()
+        return catalog
+
+    def get_grade_lookup(self, df_grades):
+        """
+        グレードID・表示名から行位置を引くGradeLookupを取得する。ImmutableDataFrameの場合は作成済みのものを使う
+        """
+        if isinstance(df_grades, ImmutableDataFrame):
+            return df_grades.get_derived(GradeLookup)
+        return GradeLookup(df_grades)
+
+    def get_option_repository(self):
+        """
+        プロセス共有のOptionRepositoryを取得する
+        """
+        repository = _option_repositories.get(self.dbname)
+        if repository is None:
+            with _catalog_lock:
+                repository = _option_repositories.setdefault(
+                    self.dbname, OptionRepository(self._get_db_manager())
+                )
+        return repository
+
+    def load_data_from_DB(self, include_options=True, compact=True):
         """
         DBからデータを読み込み
+        - include_options: Falseの場合、全グレード分のオプション（外装・内装）は読み込まずにNoneを返す。
+          オプションはOptionRepositoryでグレード毎に取得できる
+        - compact: Trueの場合、compact_frameでメモリ使用量を減らす。変換前後のバイト数はself.memory_reportに記録する
         """
-        _db_manager = SQliteManager(self.dbname)
+        _db_manager = self._get_db_manager()
 
-        df_models = _db_manager.get_df("""
-                                        SELECT ModelID as model_id, CategoryName as category_name, ModelName as model_name, ImageURL as img_url from CarModels
-                                        JOIN CarCategories ON CarCategories.CategoryID == CarModels.CategoryID
-                                        """)
-        df_parts = _db_manager.get_df("""
-                                        SELECT Exteriors.ExteriorID as exterior_id, GradeExteriors.GradeID as grade_id, 
-                                        ModelID as model_id, Item as name, AdditionalCost as price, ImageURL as img_url 
-                                        from Exteriors JOIN GradeExteriors ON Exteriors.ExteriorID == GradeExteriors.ExteriorID
-                                        JOIN CarGrades ON GradeExteriors.GradeID == CarGrades.GradeID
-                                        """)
-        df_parts["option_grade_id"] = range(len(df_parts))  # ユニークid付与
-        df_parts_interior = _db_manager.get_df("""
-                                        SELECT Interiors.InteriorID as interior_id, GradeInteriors.GradeID as grade_id, 
-                                        ModelID as model_id, Item as name, AdditionalCost as price, ImageURL as img_url 
-                                        from Interiors JOIN GradeInteriors ON Interiors.InteriorID == GradeInteriors.InteriorID
-                                        JOIN CarGrades ON GradeInteriors.GradeID == CarGrades.GradeID
-                                        """)
-        df_parts_interior["option_grade_id"] = range(
-            len(df_parts_interior)
-        )  # ユニークid付与
-        df_colors = _db_manager.get_df("""
-                                        SELECT ColorID as color_id, ColorName as name, AdditionalCost as price, ImageURL as img_url from Colors
-                                        """)
+        df_models = _db_manager.get_df(MODELS_SQL)
+        df_parts, df_parts_interior = None, None
+        if include_options:
+            df_parts = _db_manager.get_df(EXTERIOR_OPTIONS_SQL)
+            df_parts_interior = _db_manager.get_df(INTERIOR_OPTIONS_SQL)
+        df_colors = _db_manager.get_df(COLORS_SQL)
+        df_grades = _db_manager.get_df(GRADES_SQL)
+        return self._prepare_frames(
+            df_models, df_parts, df_parts_interior, df_colors, df_grades, compact
+        )
+
+    async def load_data_from_DB_async(self, include_options=True, compact=True):
+        """
+        load_data_from_DBの非同期版。各テーブルの読み込みを同時に行い、結果はload_data_from_DBと同じ
+        """
+        _db_manager = self._get_async_db_manager()
+        sqls = [MODELS_SQL, COLORS_SQL, GRADES_SQL]
+        if include_options:
+            sqls += [EXTERIOR_OPTIONS_SQL, INTERIOR_OPTIONS_SQL]
+        df_models, df_colors, df_grades, *options = await asyncio.gather(
+            *(_db_manager.get_df(sql) for sql in sqls)
+        )
+        df_parts, df_parts_interior = options if options else (None, None)
+        # メモリ削減の変換もイベントループをブロックしないようにスレッドで行う
+        return await _db_manager.run(
+            self._prepare_frames, df_models, df_parts, df_parts_interior, df_colors, df_grades, compact
+        )
+
+    def _prepare_frames(self, df_models, df_parts, df_parts_interior, df_colors, df_grades, compact):
+        if df_parts is not None:
+            df_parts["option_grade_id"] = range(len(df_parts))  # ユニークid付与
+        if df_parts_interior is not None:
+            df_parts_interior["option_grade_id"] = range(
+                len(df_parts_interior)
+            )  # ユニークid付与
         df_colors["option_grade_id"] = range(len(df_colors))  # ユニークid付
-        df_grades = _db_manager.get_df("""
-                                        SELECT BasePrice as price, ImageURL as image_url, ModelName as model_name, CarModels.ModelID as model_id, 
-                                        CarGrades.GradeID as grade_id, GradeName as grade_name, Description as grade_desc, Rank as rank, Bases.BaseId as base_id,
-                                        FuelEfficiency, FuelCostPerKilo, MonthlyMainteCost, MonthlyInsuranceCost, MonthlyParkingCost, MonthlyPriceDropRate
-                                        from CarGrades JOIN Bases ON CarGrades.GradeID == Bases.GradeID
-                                        JOIN CarModels ON CarModels.ModelID == CarGrades.ModelID
-                                        """)
-        # nameだけではユニークにならないので、説明文も追加する
-        df_grades["name_desc"] = np.vectorize(
-            lambda model_name, grade_name, desc: f"{model_name} - {grade_name} ({desc})"
-        )(df_grades["model_name"], df_grades["grade_name"], df_grades["grade_desc"])
-        return df_models, df_parts, df_parts_interior, df_colors, df_grades
+        frames = {
+            "df_models": df_models,
+            "df_parts": df_parts,
+            "df_parts_interior": df_parts_interior,
+            "df_colors": df_colors,
+            "df_grades": df_grades,
+        }
+        if compact:
+            self.memory_report = {}
+            for name, df in frames.items():
+                if df is not None:
+                    frames[name], self.memory_report[name] = compact_frame(df)
+        return tuple(frames.values())
 
     def calculate_costs(self, age, hour, df):
         """
         各種コストを計算するメソッド
+        ImmutableDataFrameが渡された場合は、事前計算したコストから該当する組み合わせを取り出して返す
         """
+        if isinstance(df, ImmutableDataFrame):
+            cost_engine = df.get_derived(CostEngine)
+            if cost_engine.supports(age, hour):
+                return cost_engine.frame(age, hour, df)
+            df = df.to_dataframe()
+
         # コストと売却価格
         hold_month = age * 12
+        # compact_frameでint32などに縮めた価格も、計算はint64で行ってオーバーフローさせない
+        price = df["price"].astype(np.int64)
 
         df["FuelCost"] = (df["FuelCostPerKilo"] * hour * 40 * hold_month * 30).astype(
             int
@@ -129,13 +658,13 @@ class DataManager:
         df["MainteCost"] = (df["MonthlyMainteCost"] * hold_month).astype(int)
         df["InsuranceCost"] = (df["MonthlyInsuranceCost"] * hold_month).astype(int)
         df["ResaleValue"] = (
-            df["price"] * (1 - df["MonthlyPriceDropRate"]) ** (hold_month)
+            price * (1 - df["MonthlyPriceDropRate"]) ** (hold_month)
         ).astype(int)
         df["MonthlyTotalCost"] = (
             df["FuelCost"] / 30 + df["MonthlyMainteCost"] + df["MonthlyInsuranceCost"]
         )
         df["MonthlyRealCost"] = (
-            df["price"]
+            price
             - df["ResaleValue"]
             + df["MonthlyTotalCost"] * hold_month
         ) / hold_month
@@ -144,12 +673,102 @@ class DataManager:
 
         return df
 
+    def build_lifecycle_cost_tables(self, df_grades_with_cost, index, age):
+        """
+        グレード×経過年数のライフサイクルコストを、グラフ描画用の縦持ちデータフレームとして作成する
+        - df_grades_with_cost: calculate_costsでコストを計算したグレード
+        - index: グラフの凡例に表示するグレードの番号
+        - age: 使用年数。最終年にのみ売却額を反映する
+        戻り値は(累計出費の推移, 単年出費の推移, 費用項目毎の累計出費)
+        """
+        df = df_grades_with_cost.assign(index=index)
+        labels = (
+            df["index"].astype(str) + ". " + df["name_desc"].str[:10] + "..."
+        ).to_numpy()
+        years = np.arange(1, age + 1)
+        is_sale_year = years == age  # 売却年にのみリセールバリューを反映する
+        price = df["price"].to_numpy().astype(np.int64)[:, None]
+        resale_value = df["ResaleValue"].to_numpy()[:, None]
+        annual_cost = df["MonthlyTotalCost"].to_numpy()[:, None] * 12
+
+        df_cumulative = pd.DataFrame(
+            {
+                "経過年数": np.tile(years, len(df)),
+                "グレード": np.repeat(labels, age),
+                "累計出費": (
+                    price - resale_value * is_sale_year + years * annual_cost
+                ).ravel(),
+            }
+        )
+        df_annual = pd.DataFrame(
+            {
+                "経過年数": np.tile(years, len(df)),
+                "グレード": np.repeat(labels, age),
+                "単年出費": (annual_cost - resale_value * is_sale_year).ravel(),
+            }
+        )
+        cost_items = {
+            "初期費用": df["price"].astype(np.int64),
+            "メンテコスト": df["MainteCost"],
+            "保険料": df["InsuranceCost"],
+            "燃料費": df["FuelCost"],
+            "売却益": -df["ResaleValue"],
+        }
+        df_cost_items = pd.DataFrame(
+            {
+                "グレード": np.repeat(labels, len(cost_items)),
+                "費用項目": np.tile(list(cost_items), len(df)),
+                "累計出費": np.column_stack(
+                    [values.to_numpy() for values in cost_items.values()]
+                ).ravel(),
+            }
+        )
+        return df_cumulative, df_annual, df_cost_items
+
+    def search_grades(
+        self, df_models, car_category, df_grades, user_budget, age, hour, limit=None, offset=0
+    ):
+        """
+        使用年数・乗車時間から計算したコストが予算に合うグレードを、実質月額の安い順に検索する
+        ImmutableDataFrameが渡された場合は、カテゴリ毎にコスト順で並べたインデックスを二分探索する
+        - limit, offset: 上位何件を返すか、何件目から返すか（ページング用）
+        """
+        if not (
+            isinstance(df_grades, ImmutableDataFrame)
+            and isinstance(df_models, ImmutableDataFrame)
+            and df_grades.get_derived(CostEngine).supports(age, hour)
+        ):
+            df_grades_with_cost = self.calculate_costs(age, hour, df_grades)
+            return self.search_car_meet_customer_needs(
+                df_models,
+                car_category,
+                df_grades_with_cost.sort_values("MonthlyRealCost", kind="stable"),
+                user_budget,
+                limit=limit,
+                offset=offset,
+            )
+
+        try:
+            budget = int(user_budget) / 12
+        except ValueError:
+            return None
+        positions = df_grades.get_derived(BudgetIndex, df_models).search(
+            car_category, budget, age, hour, limit=limit, offset=offset
+        )
+        costs = df_grades.get_derived(CostEngine).costs(age, hour)
+        df_search_result = df_grades.iloc[positions].reindex(columns=SEARCH_RESULT_COLUMNS)
+        for name in ("MonthlyRealCost", "MonthlyTotalCost", "ResaleValue"):
+            df_search_result[name] = costs[name][positions].astype(np.int64)
+        df_search_result["check"] = False
+        return df_search_result
+
     def search_car_meet_customer_needs(
-        self, df_models, car_category, df_grades_with_cost, user_budget
+        self, df_models, car_category, df_grades_with_cost, user_budget, limit=None, offset=0
     ):
         """
         ユーザーの要望に合う車両を検索する関数
         入力が正しく、かつデータが存在していればTrueを返す
+        - limit, offset: 上位何件を返すか、何件目から返すか（ページング用）
         """
         target_model_id = df_models[df_models["category_name"] == car_category][
             "model_id"
@@ -159,16 +778,10 @@ class DataManager:
                 df_grades_with_cost["model_id"].isin(target_model_id)
                 & (df_grades_with_cost["MonthlyRealCost"] < int(user_budget) / 12)
             ]
-            df_search_result = df_search_result.reindex(
-                columns=[
-                    "image_url",
-                    "name_desc",
-                    "MonthlyRealCost",
-                    "MonthlyTotalCost",
-                    "ResaleValue",
-                    "rank",
-                ]
-            )
+            if limit is not None or offset:
+                stop = None if limit is None else offset + limit
+                df_search_result = df_search_result.iloc[offset:stop]
+            df_search_result = df_search_result.reindex(columns=SEARCH_RESULT_COLUMNS)
             df_search_result["check"] = False
             return df_search_result
         except ValueError:
@@ -177,30 +790,160 @@ class DataManager:
     def insert_user_customization(
         self, name, email, prefecture, baseid, colorids, interiorids, exteriorids
     ):
-        _db_manager = SQliteManager(self.dbname)
+        """
+        ユーザーとカスタマイズ内容を1つのトランザクションでまとめて登録する。途中で失敗した場合は何も登録されない
+        """
+        _db_manager = self._get_db_manager()
+        with _db_manager.transaction() as uow:
+            return self._write_user_customization(
+                uow, name, email, prefecture, baseid, colorids, interiorids, exteriorids
+            )
+
+    async def insert_user_customization_async(
+        self, name, email, prefecture, baseid, colorids, interiorids, exteriorids
+    ):
+        """
+        insert_user_customizationの非同期版。1つのトランザクションでまとめて登録し、カスタマイズIDを返す
+        """
+        return await self._get_async_db_manager().run_in_transaction(
+            lambda uow: self._write_user_customization(
+                uow, name, email, prefecture, baseid, colorids, interiorids, exteriorids
+            )
+        )
+
+    def enqueue_user_customization(
+        self, name, email, prefecture, baseid, colorids, interiorids, exteriorids
+    ):
+        """
+        ユーザーとカスタマイズ内容を予約の書き込みキューに積む。DBへの書き込みは待たずに受付番号（連番）を返す
+        キューが一杯で空きを待ちきれない場合はqueue.Fullを送出する
+        """
+        record = {
+            "name": name,
+            "email": email,
+            "prefecture": prefecture,
+            # ジャーナルにjsonで書き出すので、numpyの整数はintにする
+            "baseid": self._to_int(baseid),
+            "colorids": [self._to_int(colorid) for colorid in colorids],
+            "interiorids": [self._to_int(interiorid) for interiorid in interiorids],
+            "exteriorids": [self._to_int(exteriorid) for exteriorid in exteriorids],
+        }
+        return self.get_reservation_queue().put(record)
+
+    def get_reservation_queue(self):
+        """
+        プロセス共有のReservationQueueを取得する。初回のみ書き込みスレッドを起動する
+        """
+        reservation_queue = _reservation_queues.get(self.dbname)
+        if reservation_queue is None:
+            with _catalog_lock:
+                reservation_queue = _reservation_queues.get(self.dbname)
+                if reservation_queue is None:
+                    # ページ要素のインスタンスを書き込みスレッドが保持しないよう、書き込み用のDataManagerを作る
+                    writer = DataManager()
+                    writer.dbname = self.dbname
+                    # 予約の連番を記録するテーブルが無い既存のDBは、ここで追加する
+                    writer.init_DB()
+                    reservation_queue = ReservationQueue(
+                        writer._get_db_manager(),
+                        writer._write_reservation,
+                        journal_path=self.dbname + RESERVATION_JOURNAL_SUFFIX,
+                    ).start()
+                    _reservation_queues[self.dbname] = reservation_queue
+        return reservation_queue
+
+    def reservation_queue_metrics(self):
+        """
+        ReservationQueueのメトリクス。キューがまだ無い場合は書き込みスレッドを起動せずにNoneを返す
+        """
+        reservation_queue = _reservation_queues.get(self.dbname)
+        return reservation_queue.metrics() if reservation_queue is not None else None
+
+    def close_reservation_queue(self):
+        """
+        キューに残っている予約を書き込んでから書き込みスレッドを止める
+        """
+        with _catalog_lock:
+            reservation_queue = _reservation_queues.pop(self.dbname, None)
+        if reservation_queue is not None:
+            reservation_queue.close()
+
+    def _write_reservation(self, uow, record):
+        return self._write_user_customization(uow, **record)
 
-        user_id = _db_manager.insert_record(
+    def _write_user_customization(
+        self, uow, name, email, prefecture, baseid, colorids, interiorids, exteriorids
+    ):
+        user_id = uow.insert_record(
             "Users", {"username": name, "email": email, "place": prefecture}
         )
-        customization_id = _db_manager.insert_record(
+        customization_id = uow.insert_record(
             "Customizations",
             {"userid": self._to_int(user_id), "baseid": self._to_int(baseid)},
         )
-        for colorid in colorids:
-            _db_manager.insert_record(
-                "ColorCustomizations",
-                {"customizationid": customization_id, "colorid": colorid},
-            )
-        for interiorid in interiorids:
-            _db_manager.insert_record(
-                "InteriorCustomizations",
-                {"customizationid": customization_id, "interiorid": interiorid},
-            )
-        for exteriorid in exteriorids:
-            _db_manager.insert_record(
-                "ExteriorCustomizations",
-                {"customizationid": customization_id, "exteriorid": exteriorid},
+        uow.insert_many(
+            "ColorCustomizations",
+            ("customizationid", "colorid"),
+            [(customization_id, self._to_int(colorid)) for colorid in colorids],
+        )
+        uow.insert_many(
+            "InteriorCustomizations",
+            ("customizationid", "interiorid"),
+            [(customization_id, self._to_int(interiorid)) for interiorid in interiorids],
+        )
+        uow.insert_many(
+            "ExteriorCustomizations",
+            ("customizationid", "exteriorid"),
+            [(customization_id, self._to_int(exteriorid)) for exteriorid in exteriorids],
+        )
+        return customization_id
+
+    def _get_db_manager(self):
+        """
+        このアプリの設定で接続プールを共有するSQliteManagerを取得する
+        """
+        _db_manager = SQliteManager(
+            self.dbname,
+            pool_size=DB_POOL_SIZE,
+            pragmas=DB_PRAGMAS,
+            journal_mode=DB_JOURNAL_MODE,
+            read_only_readers=DB_READ_ONLY_READERS,
+        )
+        if QUERY_PROFILE_ENABLED:
+            _db_manager.enable_profiler(
+                slow_seconds=SLOW_QUERY_SECONDS, log_path=SLOW_QUERY_LOG_PATH
             )
+        return _db_manager
+
+    def _get_async_db_manager(self):
+        """
+        このアプリの設定のAsyncSQliteManagerを取得する。スレッドプールはDBファイル毎にプロセスで共有する
+        """
+        _db_manager = _async_db_managers.get(self.dbname)
+        if _db_manager is None:
+            with _catalog_lock:
+                _db_manager = _async_db_managers.get(self.dbname)
+                if _db_manager is None:
+                    _db_manager = AsyncSQliteManager(
+                        self.dbname,
+                        pool_size=DB_POOL_SIZE,
+                        pragmas=DB_PRAGMAS,
+                        journal_mode=DB_JOURNAL_MODE,
+                        read_only_readers=DB_READ_ONLY_READERS,
+                        max_concurrency=DB_ASYNC_CONCURRENCY,
+                    )
+                    if QUERY_PROFILE_ENABLED:
+                        _db_manager.db_manager.enable_profiler(
+                            slow_seconds=SLOW_QUERY_SECONDS, log_path=SLOW_QUERY_LOG_PATH
+                        )
+                    _async_db_managers[self.dbname] = _db_manager
+        return _db_manager
+
+    def get_query_stats(self):
+        """
+        SQL毎の実行回数・時間などの集計結果。QUERY_PROFILE=1で起動していない場合は空の辞書
+        """
+        return self._get_db_manager().query_stats()
 
     def _to_int(self, var):
         if var is not None:
@@ -0,0 +1,387 @@
+import itertools
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import deque
+
+from filelock import FileLock, Timeout
+
+from domain_context.db_config import (
+    RESERVATION_QUEUE_SIZE,
+    RESERVATION_BATCH_SIZE,
+    RESERVATION_LINGER_SECONDS,
+    RESERVATION_PUT_TIMEOUT,
+    RESERVATION_RETRY_SECONDS,
+    RESERVATION_RETRY_MAX_SECONDS,
+    RESERVATION_JOURNAL_FSYNC,
+)
+
+# レコードの内容が原因で、書き込み直しても成功しないエラー（制約違反・値の不正）。このエラーのレコードだけを退避する
+# それ以外（"database is locked"などのsqlite3.OperationalErrorなど）は一時的なエラーとして、バッチごと後で書き込み直す
+RECORD_ERRORS = (
+    sqlite3.IntegrityError,
+    sqlite3.DataError,
+    sqlite3.ProgrammingError,
+    sqlite3.InterfaceError,
+    ValueError,
+    TypeError,
+    KeyError,
+)
+
+
+class ReservationQueue:
+    """
+    予約の書き込みを画面の処理から切り離す、書き込み遅延（write-behind）のキュー
+    - put: レコードをジャーナル（jsonl）に追記してからキューに積み、DBへの書き込みを待たずに連番を返す
+    - 書き込みスレッドが最大batch_size件ずつ1つのトランザクションでコミットし（グループコミット）、
+      同じトランザクションでコミット済みの連番をReservationCheckpointsテーブル（create_db.sqlで作成する）に記録する
+    - キューがmaxsize件で一杯のときはputが空きを待ち、put_timeout秒を超えたらqueue.Fullを送出する（バックプレッシャー）
+    - 起動時はジャーナルのうちコミット済みの連番より後のレコードだけを再投入するので、
+      受け付けた予約はプロセスが落ちても失われず、コミット済みの予約が二重に書き込まれることも無い
+    - ジャーナルはプロセス毎に1つ使う。journal_pathがファイルロックで他のプロセスに使われている場合は
+      journal_path.1, journal_path.2, ...のうち空いているものを使い、終了時にロックを解放する
+    - 書き込みに失敗したバッチは1件ずつ書き込み直し、RECORD_ERRORSで失敗したレコードだけをjournal_path.failedに退避する
+    - 一時的なエラー（DBのロックなど）で書き込めなかった場合は未コミットのレコードをキューの先頭に戻し、
+      retry_seconds秒後に書き込み直す。続けて失敗するたびに待つ時間を2倍にする（最大retry_max_seconds秒）
+    - write: write(uow, record)で1レコードをUnitOfWorkに書き込む関数
+    """
+
+    def __init__(
+        self,
+        db_manager,
+        write,
+        journal_path: str,
+        maxsize: int = RESERVATION_QUEUE_SIZE,
+        batch_size: int = RESERVATION_BATCH_SIZE,
+        linger_seconds: float = RESERVATION_LINGER_SECONDS,
+        put_timeout: float = RESERVATION_PUT_TIMEOUT,
+        retry_seconds: float = RESERVATION_RETRY_SECONDS,
+        retry_max_seconds: float = RESERVATION_RETRY_MAX_SECONDS,
+        fsync: bool = RESERVATION_JOURNAL_FSYNC,
+    ) -> None:
+        self.db_manager = db_manager
+        self.write = write
+        self.base_journal_path = journal_path
+        self.journal_path = journal_path  # startで使用するジャーナルに決まる
+        self.failed_path = journal_path + ".failed"
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self.linger_seconds = linger_seconds
+        self.put_timeout = put_timeout
+        self.retry_seconds = retry_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self._consecutive_errors = 0
+        self.fsync = fsync
+        self._pending = deque()  # (連番, レコード)
+        self._in_flight = 0
+        self._reserved = 0  # 空きを確保してジャーナルに書き込み中のput
+        self._cond = threading.Condition()
+        # ジャーナルへの追記と切り詰めを直列化するロック。_condより先に取る
+        self._journal_lock = threading.Lock()
+        self._journal = None
+        self._journal_owner = None  # 他のプロセスが同じジャーナルを使わないためのファイルロック
+        self._thread = None
+        self._closed = False
+        self._next_seq = 1
+        self.committed_seq = 0
+        # メトリクス
+        self.enqueued = 0
+        self.committed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.blocked = 0
+        self.errors = 0
+        self.last_error = None
+        self.max_depth = 0
+        self.batches = 0
+        self.batch_sizes = {}
+        self.commit_seconds_total = 0.0
+        self.commit_seconds_max = 0.0
+
+    def start(self):
+        """
+        ジャーナルを確保して未コミットのレコードを復元し、書き込みスレッドを起動する
+        """
+        with self._cond:
+            if self._thread is None:
+                self._claim_journal()
+                try:
+                    self._recover()
+                    self._journal = open(self.journal_path, "a", encoding="utf-8")
+                except BaseException:
+                    self._journal_owner.release()
+                    raise
+                self._thread = threading.Thread(
+                    target=self._run, name="reservation-writer", daemon=True
+                )
+                self._thread.start()
+        return self
+
+    def _claim_journal(self):
+        """
+        他のプロセス（または同じプロセスの別のキュー）が使っていないジャーナルをファイルロックで確保する
+        """
+        for slot in itertools.count():
+            path = self.base_journal_path if slot == 0 else f"{self.base_journal_path}.{slot}"
+            owner = FileLock(path + ".lock", timeout=0)
+            try:
+                owner.acquire()
+            except Timeout:
+                continue
+            self._journal_owner = owner
+            self.journal_path = path
+            self.failed_path = path + ".failed"
+            return
+
+    @property
+    def journal_name(self) -> str:
+        """
+        ReservationCheckpointsでジャーナルを識別する名前
+        """
+        return os.path.basename(self.journal_path)
+
+    def _recover(self):
+        rows = self.db_manager.get_data(
+            "SELECT CommittedSeq FROM ReservationCheckpoints WHERE Journal = ?", (self.journal_name,)
+        )
+        self.committed_seq = rows[0][0] if rows else 0
+        last_seq = self.committed_seq
+        if os.path.isfile(self.journal_path):
+            with open(self.journal_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # 追記途中で落ちた最後の行は受け付けていない（putが戻っていない）ので捨てる
+                        continue
+                    last_seq = max(last_seq, entry["seq"])
+                    if entry["seq"] > self.committed_seq:
+                        self._pending.append((entry["seq"], entry["record"]))
+        self._next_seq = last_seq + 1
+        if self._pending:
+            print(f"reservation queue: {len(self._pending)} records recovered from {self.journal_path}")
+
+    def _check_running(self):
+        if self._closed or self._thread is None:
+            raise RuntimeError("reservation queue is not running")
+        if not self._thread.is_alive():
+            raise RuntimeError(f"reservation writer has stopped: {self.last_error}")
+
+    def put(self, record: dict) -> int:
+        """
+        レコードをジャーナルに追記してキューに積み、連番を返す。DBへの書き込みは待たない
+        ジャーナルへの書き込み（fsync）の間は他のputだけを待たせ、書き込みスレッドは止めない
+        """
+        deadline = time.monotonic() + self.put_timeout
+        with self._cond:
+            self._check_running()
+            if len(self._pending) + self._reserved >= self.maxsize:
+                self.blocked += 1
+                while len(self._pending) + self._reserved >= self.maxsize:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.rejected += 1
+                        raise queue.Full(f"reservation queue is full ({self.maxsize} records)")
+                    self._cond.wait(remaining)
+                self._check_running()
+            self._reserved += 1
+
+        queued = False
+        try:
+            # 連番の採番からキューに積むまでをジャーナルのロック内で行い、ジャーナルとキューを連番順に保つ
+            with self._journal_lock:
+                with self._cond:
+                    seq = self._next_seq
+                    self._next_seq += 1
+                line = json.dumps({"seq": seq, "record": record}, ensure_ascii=False) + "\n"
+                self._journal.write(line)
+                self._journal.flush()
+                if self.fsync:
+                    os.fsync(self._journal.fileno())
+                with self._cond:
+                    self._reserved -= 1
+                    self._pending.append((seq, record))
+                    queued = True
+                    self.enqueued += 1
+                    self.max_depth = max(self.max_depth, len(self._pending) + self._in_flight)
+                    self._cond.notify_all()
+        except BaseException:
+            with self._cond:
+                if not queued:
+                    self._reserved -= 1
+                    self._cond.notify_all()
+            raise
+        return seq
+
+    def _run(self):
+        while True:
+            with self._cond:
+                # close後もジャーナルに書き込み中のputが残っていれば、積まれるのを待つ
+                while not self._pending and (not self._closed or self._reserved):
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                # 後続のレコードを少しだけ待って、1回のコミットにまとめる
+                if len(self._pending) < self.batch_size and not self._closed:
+                    self._cond.wait_for(
+                        lambda: len(self._pending) >= self.batch_size or self._closed,
+                        self.linger_seconds,
+                    )
+                batch = [self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))]
+                self._in_flight = len(batch)
+                # 空きができたので待っているputを再開させる
+                self._cond.notify_all()
+
+            try:
+                self._commit(batch)
+                self._truncate_journal()
+            except Exception as e:
+                if not self._retry_later(batch, e):
+                    return
+                continue
+
+            with self._cond:
+                self._in_flight = 0
+                self._consecutive_errors = 0
+                self._cond.notify_all()
+
+    def _retry_later(self, batch, error) -> bool:
+        """
+        コミットできなかったレコードをキューの先頭に戻し、retry_seconds秒（続けて失敗した回数に応じて最大retry_max_seconds秒）待つ。
+        close済みの場合は待たずにFalseを返す（レコードはジャーナルに残り、次回起動時に書き込む）
+        """
+        with self._cond:
+            delay = min(self.retry_seconds * 2 ** self._consecutive_errors, self.retry_max_seconds)
+            self._consecutive_errors += 1
+        print(f"reservation writer failed, retrying in {delay}s: {error!r}")
+        with self._cond:
+            self.errors += 1
+            self.last_error = repr(error)
+            self._pending.extendleft(reversed([item for item in batch if item[0] > self.committed_seq]))
+            self._in_flight = 0
+            self._cond.notify_all()
+            if self._closed:
+                return False
+            self._cond.wait_for(lambda: self._closed, delay)
+        return True
+
+    def _commit(self, batch):
+        start = time.perf_counter()
+        try:
+            with self.db_manager.transaction() as uow:
+                for _, record in batch:
+                    self.write(uow, record)
+                self._save_checkpoint(uow, batch[-1][0])
+            self._mark_committed(batch[-1][0], committed=len(batch))
+        except RECORD_ERRORS as e:
+            # レコードが原因で失敗した場合は1件ずつ書き込み直し、失敗したレコードだけを退避する。
+            # 一時的なエラーはそのまま送出し、_retry_laterでバッチごと後で書き込み直す
+            print(f"reservation batch of {len(batch)} failed, retrying one by one: {e}")
+            for seq, record in batch:
+                if seq <= self.committed_seq:
+                    continue
+                try:
+                    with self.db_manager.transaction() as uow:
+                        self.write(uow, record)
+                        self._save_checkpoint(uow, seq)
+                except RECORD_ERRORS as record_error:
+                    self._write_failed(seq, record, record_error)
+                    with self.db_manager.transaction() as uow:
+                        self._save_checkpoint(uow, seq)
+                    self._mark_committed(seq, failed=1)
+                else:
+                    self._mark_committed(seq, committed=1)
+        seconds = time.perf_counter() - start
+        self.batches += 1
+        self.batch_sizes[len(batch)] = self.batch_sizes.get(len(batch), 0) + 1
+        self.commit_seconds_total += seconds
+        self.commit_seconds_max = max(self.commit_seconds_max, seconds)
+
+    def _save_checkpoint(self, uow, seq):
+        uow.execute(
+            "INSERT OR REPLACE INTO ReservationCheckpoints (Journal, CommittedSeq) VALUES (?, ?)",
+            (self.journal_name, seq),
+        )
+
+    def _mark_committed(self, seq, committed=0, failed=0):
+        with self._cond:
+            self.committed_seq = seq
+            self.committed += committed
+            self.failed += failed
+
+    def _truncate_journal(self):
+        """
+        キューに残りが無ければ、すべてコミット済みなのでジャーナルを空にする
+        """
+        with self._journal_lock:
+            with self._cond:
+                if self._pending:
+                    return
+            self._journal.truncate(0)
+
+    def _write_failed(self, seq, record, error):
+        print(f"reservation {seq} could not be written: {error}")
+        with open(self.failed_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"seq": seq, "record": record, "error": str(error)}, ensure_ascii=False) + "\n")
+
+    def depth(self) -> int:
+        """
+        まだコミットされていないレコード数（書き込み中を含む）
+        """
+        with self._cond:
+            return len(self._pending) + self._in_flight
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """
+        受け付けたレコードがすべてコミットされるまで待つ。timeout秒以内に終わればTrue
+        """
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._pending and not self._in_flight, timeout)
+
+    def close(self, timeout: float | None = None):
+        """
+        残りのレコードを書き込んでから書き込みスレッドを止める
+        """
+        with self._cond:
+            if self._thread is None or self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        with self._journal_lock:
+            self._journal.close()
+        if not self._thread.is_alive():
+            self._journal_owner.release()
+
+    def metrics(self) -> dict:
+        """
+        キューの深さ・コミットしたバッチの大きさなどの統計情報
+        """
+        with self._cond:
+            return {
+                "depth": len(self._pending) + self._in_flight,
+                "max_depth": self.max_depth,
+                "enqueued": self.enqueued,
+                "committed": self.committed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "blocked": self.blocked,
+                "errors": self.errors,
+                "last_error": self.last_error,
+                "writer_alive": self._thread is not None and self._thread.is_alive(),
+                "journal": self.journal_path,
+                "batches": self.batches,
+                "mean_batch_size": (
+                    sum(size * count for size, count in self.batch_sizes.items()) / self.batches
+                    if self.batches
+                    else 0.0
+                ),
+                "max_batch_size": max(self.batch_sizes, default=0),
+                "batch_sizes": dict(sorted(self.batch_sizes.items())),
+                "commit_seconds_total": self.commit_seconds_total,
+                "commit_seconds_max": self.commit_seconds_max,
+                "committed_seq": self.committed_seq,
+            }
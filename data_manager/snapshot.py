@@ -0,0 +1,101 @@
+import hashlib
+import itertools
+import json
+import os
+
+import pyarrow as pa
+import pyarrow.ipc as ipc
+
+from domain_context.db_config import DB_JSON_DATA_PATH, DB_SNAPSHOT_PATH
+
+MANIFEST_FILE = "manifest.json"
+BATCH_ROWS = 1024  # 1レコードバッチの最大行数。iter_rowsはこの行数ずつPythonオブジェクトに変換する
+
+
+class CatalogSnapshot:
+    """
+    DBの初期データを保存する列指向のスナップショット。テーブル毎に非圧縮のArrow IPCファイルとして保存し、
+    読み込み時はメモリマップで開くため、jsonを丸ごとパースするよりも速く、ピークメモリも小さい
+    - path: スナップショットを保存するディレクトリ
+    """
+
+    def __init__(self, path: str = DB_SNAPSHOT_PATH) -> None:
+        self.path = path
+
+    def export_json(self, json_path: str = DB_JSON_DATA_PATH, batch_rows: int = BATCH_ROWS) -> dict:
+        """
+        jsonの初期データからスナップショットを作成する。テーブル毎の行数を返す
+        - batch_rows: 1レコードバッチの最大行数。テーブルをこの行数毎のバッチに分けて保存する
+        """
+        with open(json_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        os.makedirs(self.path, exist_ok=True)
+        row_counts = {}
+        for table, records in data.items():
+            arrow_table = pa.Table.from_pylist(records)
+            with ipc.new_file(self._table_path(table), arrow_table.schema) as writer:
+                writer.write_table(arrow_table, max_chunksize=batch_rows)
+            row_counts[table] = arrow_table.num_rows
+        manifest = {
+            "tables": list(row_counts),
+            "row_counts": row_counts,
+            "source_sha256": self._sha256(json_path),
+        }
+        with open(os.path.join(self.path, MANIFEST_FILE), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        return row_counts
+
+    def is_valid(self, json_path: str = DB_JSON_DATA_PATH) -> bool:
+        """
+        スナップショットが存在し、jsonの初期データと一致しているかどうか。jsonが無い場合はスナップショットを正とする
+        """
+        manifest = self.manifest()
+        if manifest is None:
+            return False
+        if not os.path.isfile(json_path):
+            return True
+        return manifest["source_sha256"] == self._sha256(json_path)
+
+    def manifest(self) -> dict | None:
+        manifest_path = os.path.join(self.path, MANIFEST_FILE)
+        if not os.path.isfile(manifest_path):
+            return None
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def read_table(self, table: str, memory_map: bool = True) -> pa.Table:
+        """
+        テーブルを読み込む。memory_map=Trueの場合はファイルをコピーせずにメモリマップで参照する
+        """
+        path = self._table_path(table)
+        source = pa.memory_map(path, "r") if memory_map else pa.OSFile(path, "rb")
+        with source:
+            return ipc.open_file(source).read_all()
+
+    def iter_rows(self, table: str, memory_map: bool = True):
+        """
+        テーブルの列名と、レコードバッチ毎にタプルへ変換する行のイテレータを返す。
+        全行をPythonオブジェクトとして同時に保持しないので、DBへの挿入時のピークメモリを抑えられる
+        """
+        arrow_table = self.read_table(table, memory_map=memory_map)
+        rows = itertools.chain.from_iterable(
+            zip(*(column.to_pylist() for column in batch.columns))
+            for batch in arrow_table.to_batches()
+        )
+        return arrow_table.column_names, rows
+
+    def _table_path(self, table: str) -> str:
+        return os.path.join(self.path, f"{table}.arrow")
+
+    def _sha256(self, path: str) -> str:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+
+if __name__ == "__main__":
+    # python -m data_manager.snapshot でjsonからスナップショットを作り直す
+    for table, count in CatalogSnapshot().export_json().items():
+        print(f"{table}: {count} rows")
@@ -0,0 +1,7 @@
+# 見積もりAPI（api.py）の設定
+API_CACHE_SIZE = 4096  # 見積もり結果をキャッシュする件数（カタログのバージョン×検索条件）
+API_DEFAULT_LIMIT = 20  # 1回の見積もりで返すグレード数の既定値
+API_MAX_LIMIT = 100  # 1回の見積もりで返すグレード数の上限
+API_MAX_BATCH = 100  # /quotes で1回に受け付ける検索条件の数
+API_MAX_BODY_BYTES = 1_000_000  # リクエストボディの上限
+API_RETRY_AFTER_SECONDS = 1  # 予約キューが一杯のときにRetry-Afterで返す秒数
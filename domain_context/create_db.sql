@@ -114,4 +114,10 @@ CREATE TABLE Users (
     UserName TEXT,
     Email TEXT,
     Place TEXT
-);
\ No newline at end of file
+);
+
+-- 予約の書き込みキュー（ReservationQueue）のジャーナル毎のコミット済みの連番。予約と同じトランザクションで更新する
+CREATE TABLE ReservationCheckpoints (
+    Journal TEXT PRIMARY KEY,
+    CommittedSeq INTEGER NOT NULL
+);
@@ -0,0 +1,23 @@
+-- 結合キー（外部キー）のインデックス。初期データの投入後に作成する
+CREATE INDEX IF NOT EXISTS idx_carmodels_categoryid ON CarModels (CategoryID);
+
+CREATE INDEX IF NOT EXISTS idx_cargrades_modelid ON CarGrades (ModelID);
+
+CREATE INDEX IF NOT EXISTS idx_bases_gradeid ON Bases (GradeID);
+
+-- 中間テーブルはどちら向きの結合でも表を参照しないで済むようにカバリングインデックスにする
+CREATE INDEX IF NOT EXISTS idx_gradeexteriors_gradeid_exteriorid ON GradeExteriors (GradeID, ExteriorID);
+
+CREATE INDEX IF NOT EXISTS idx_gradeexteriors_exteriorid_gradeid ON GradeExteriors (ExteriorID, GradeID);
+
+CREATE INDEX IF NOT EXISTS idx_gradeinteriors_gradeid_interiorid ON GradeInteriors (GradeID, InteriorID);
+
+CREATE INDEX IF NOT EXISTS idx_gradeinteriors_interiorid_gradeid ON GradeInteriors (InteriorID, GradeID);
+
+CREATE INDEX IF NOT EXISTS idx_customizations_userid ON Customizations (UserID);
+
+CREATE INDEX IF NOT EXISTS idx_exteriorcustomizations_customizationid ON ExteriorCustomizations (CustomizationID);
+
+CREATE INDEX IF NOT EXISTS idx_colorcustomizations_customizationid ON ColorCustomizations (CustomizationID);
+
+CREATE INDEX IF NOT EXISTS idx_interiorcustomizations_customizationid ON InteriorCustomizations (CustomizationID);
@@ -0,0 +1,23 @@
+-- アプリで使うグレード一覧（df_grades）の射影。CarGrades・Bases・CarModelsを非正規化して1行1グレードにまとめる
+CREATE VIEW IF NOT EXISTS GradeCatalog AS
+SELECT
+    Bases.BasePrice AS price,
+    CarModels.ImageURL AS image_url,
+    CarModels.ModelName AS model_name,
+    CarModels.ModelID AS model_id,
+    CarGrades.GradeID AS grade_id,
+    CarGrades.GradeName AS grade_name,
+    CarGrades.Description AS grade_desc,
+    Bases.Rank AS rank,
+    Bases.BaseID AS base_id,
+    Bases.FuelEfficiency AS FuelEfficiency,
+    Bases.FuelCostPerKilo AS FuelCostPerKilo,
+    Bases.MonthlyMainteCost AS MonthlyMainteCost,
+    Bases.MonthlyInsuranceCost AS MonthlyInsuranceCost,
+    Bases.MonthlyParkingCost AS MonthlyParkingCost,
+    Bases.MonthlyPriceDropRate AS MonthlyPriceDropRate,
+    -- nameだけではユニークにならないので、説明文も追加する
+    CarModels.ModelName || ' - ' || CarGrades.GradeName || ' (' || CarGrades.Description || ')' AS name_desc
+FROM CarGrades
+JOIN Bases ON CarGrades.GradeID = Bases.GradeID
+JOIN CarModels ON CarModels.ModelID = CarGrades.ModelID;
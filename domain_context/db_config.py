@@ -1,4 +1,42 @@
 #環境情報
-DB_NAME = "car_customize.db"
+import os
+
+# CAR_CUSTOMIZE_DB で別のDBファイルを指定できる（負荷試験などで既定のDBを汚さないため）
+DB_NAME = os.environ.get("CAR_CUSTOMIZE_DB", "car_customize.db")
 CREATE_TABLES_SQL_PATH = "domain_context/create_db.sql"
-DB_JSON_DATA_PATH = "domain_context/db_sample.json"
\ No newline at end of file
+CREATE_INDEXES_SQL_PATH = "domain_context/create_indexes.sql"
+CREATE_VIEWS_SQL_PATH = "domain_context/create_views.sql"
+DB_JSON_DATA_PATH = "domain_context/db_sample.json"
+DB_SNAPSHOT_PATH = "domain_context/db_snapshot"  # python -m data_manager.snapshot で作成する初期データのスナップショット
+
+# DB接続プールの設定
+DB_POOL_SIZE = 4  # プールに保持する読み込み用接続の最大数
+# 接続を開いたときに1回だけ適用するPRAGMA
+DB_PRAGMAS = {
+    "temp_store": "MEMORY",
+    "busy_timeout": 5000,  # 他の接続が書き込み中のとき、エラーにせず最大この時間[ミリ秒]待つ
+    "mmap_size": 268435456,  # 256MBまでメモリマップで読み込み、ページキャッシュとの二重コピーを避ける
+    "cache_size": -16384,  # 接続毎のページキャッシュ。負の値はKB単位（16MB）
+    "synchronous": "NORMAL",  # WALではコミット毎のfsyncを省いてもDBは壊れない
+}
+# WAL: 予約の書き込み中もカタログの読み込みを止めない。DBファイルに保存される設定なので書き込み用の接続で適用する
+DB_JOURNAL_MODE = "WAL"
+# 読み込み用の接続を読み込み専用（mode=ro）で開く
+DB_READ_ONLY_READERS = True
+# AsyncSQliteManagerで同時にDBにアクセスする操作の最大数（スレッドプールの大きさ）
+DB_ASYNC_CONCURRENCY = 4
+# 初回起動時のDB構築の排他制御。他のプロセス・スレッドが構築中の場合、最大この秒数まで完了を待つ
+DB_BUILD_LOCK_TIMEOUT = 300
+
+# グレード毎のオプションをキャッシュするグレード数
+OPTION_CACHE_SIZE = 128
+
+# 予約の書き込みキュー（ReservationQueue）の設定
+RESERVATION_QUEUE_SIZE = 1000  # 未コミットの予約をこの件数まで受け付ける。超えるとputが空きを待つ
+RESERVATION_BATCH_SIZE = 64  # 1回のコミットにまとめる最大件数
+RESERVATION_LINGER_SECONDS = 0.005  # 後続の予約をまとめるために待つ秒数
+RESERVATION_PUT_TIMEOUT = 5.0  # キューに空きが無いときに待つ最大秒数
+RESERVATION_RETRY_SECONDS = 1.0  # 書き込みに失敗したときに書き込み直すまでの秒数。続けて失敗するたびに2倍にする
+RESERVATION_RETRY_MAX_SECONDS = 30.0  # 書き込み直すまでの最大秒数
+RESERVATION_JOURNAL_FSYNC = True  # 受け付け時にジャーナルをfsyncするか
+RESERVATION_JOURNAL_SUFFIX = ".reservations.jsonl"  # ジャーナルはDBファイル名にこの拡張子を付けたファイル（使用中なら末尾に.1, .2, ...を付ける）
@@ -9,11 +9,14 @@ DEFAULT_VALUES = {
     "chosen_grades": None,
     "chosen_index": None,
 
+    "catalog_version": None,
     "df_models": None,
-    "df_parts": None,
-    "df_parts_interior": None,
     "df_colors": None,
     "df_grades": None,
 
     "df_search_result": None,
- }
\ No newline at end of file
+ }
+
+# 入力スライダーの範囲。コストの事前計算もこの範囲で行う
+AGE_RANGE = (1, 21)  # 使用年数
+HOUR_RANGE = (1, 24)  # 1日の乗車時間[H]
@@ -0,0 +1,32 @@
+import os
+
+# 性能計測の設定
+# BaseDisplay.runで各ページ要素のpreprocess / show / postprocessの処理時間を記録するか
+STAGE_TIMING_ENABLED = True
+# 処理時間のデバッグパネルを表示するか。STAGE_TIMING_PANEL=1 で起動すると表示する
+STAGE_TIMING_PANEL = os.environ.get("STAGE_TIMING_PANEL") == "1"
+# デバッグパネルから集計結果を書き出すファイル
+STAGE_TIMING_DUMP_PATH = "stage_timings.json"
+
+# 処理時間ヒストグラムの最小バケット[秒]と、バケット毎の倍率（相対誤差の上限）
+HISTOGRAM_MIN_SECONDS = 1e-6
+HISTOGRAM_GROWTH = 1.1
+
+# SQLの実行時間の集計を行うか。QUERY_PROFILE=1 で起動すると有効になる
+QUERY_PROFILE_ENABLED = os.environ.get("QUERY_PROFILE") == "1"
+# この秒数以上かかったSQLは実行計画と一緒にスロークエリログに書き出す
+SLOW_QUERY_SECONDS = 0.05
+SLOW_QUERY_LOG_PATH = "slow_queries.log"
+
+# ベンチマーク（python -m benchmarks.run_benchmarks）の設定
+BENCHMARK_BASELINE_PATH = "benchmarks/baseline.json"
+BENCHMARK_SCALES = (1, 10)  # 初期データの何倍の規模のカタログで計測するか
+BENCHMARK_SOURCE = "synthetic"  # "synthetic": 合成カタログ、"replicate": 初期データの複製
+BENCHMARK_REPEAT = 5
+BENCHMARK_THRESHOLD = 0.2  # ベースラインの中央値から何割遅くなったら劣化とみなすか
+
+# 負荷試験（python -m benchmarks.load_test）の設定
+LOAD_TEST_USERS = 8  # 同時に操作するセッション数
+LOAD_TEST_ITERATIONS = 3  # 1セッションが入力から予約までの流れを繰り返す回数
+LOAD_TEST_PORT = 8599  # 負荷試験用に起動するstreamlitサーバーのポート
+LOAD_TEST_TIMEOUT = 60  # 1回の再実行を待つ最大秒数
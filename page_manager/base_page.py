@@ -1,15 +1,24 @@
 from abc import ABC, abstractmethod
 import streamlit as st
 
+from page_manager.stage_profiler import stage_profiler
+from domain_context.profile_config import STAGE_TIMING_DUMP_PATH
+
 class BaseDisplay(ABC):
     """
     ページの挙動を定める要素。前処理、可視化、後処理の3つで構成する
+    各段階の処理時間はクラス名毎にstage_profilerに記録される
     """
     
     def run(self):
-        self.preprocess()
-        self.show()
-        self.postprocess()
+        page = type(self).__name__
+        with stage_profiler.measure(page, "total"):
+            with stage_profiler.measure(page, "preprocess"):
+                self.preprocess()
+            with stage_profiler.measure(page, "show"):
+                self.show()
+            with stage_profiler.measure(page, "postprocess"):
+                self.postprocess()
 
     @abstractmethod
     def preprocess(self):
@@ -23,6 +32,26 @@ class BaseDisplay(ABC):
     def postprocess(self):
         pass
 
+class StageTimingPanel(BaseDisplay):
+    """
+    ページ要素毎・段階毎の処理時間（p50/p95/p99など）をサイドバーに表示するデバッグ用の要素
+    """
+
+    def preprocess(self):
+        self.rows = stage_profiler.rows()
+
+    def show(self):
+        with st.sidebar.expander("処理時間（デバッグ用）"):
+            if self.rows:
+                st.dataframe(self.rows, hide_index=True)
+            else:
+                st.write("まだ記録がありません")
+            self.dump_pushed = st.button("集計結果をファイルに書き出す")
+
+    def postprocess(self):
+        if self.dump_pushed:
+            stage_profiler.dump(STAGE_TIMING_DUMP_PATH)
+
 class UtilityElement:
     """
     汎用的に使えるエレメントを定義
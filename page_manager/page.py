@@ -1,10 +1,12 @@
+import queue
+
 import streamlit as st
-import pandas as pd
 import plotly.express as px
 
 from page_manager.base_page import BaseDisplay, UtilityElement
-from data_manager.data_manager import DataManager, ImmutableDataFrame
+from data_manager.data_manager import DataManager
 from session_manager.user_session import UserSession
+from domain_context.default_values import AGE_RANGE, HOUR_RANGE
 
 
 class UserInputDisplay(BaseDisplay, DataManager, UserSession):
@@ -13,19 +15,10 @@ class UserInputDisplay(BaseDisplay, DataManager, UserSession):
     """
 
     def preprocess(self):
-        self.init_DB()
-        df_models, df_parts, df_parts_interior, df_colors, df_grades = (
-            self.load_data_from_DB()
-        )
-        self.set_values(
-            {
-                "df_models": ImmutableDataFrame(df_models),
-                "df_parts": ImmutableDataFrame(df_parts),
-                "df_parts_interior": ImmutableDataFrame(df_parts_interior),
-                "df_colors": ImmutableDataFrame(df_colors),
-                "df_grades": ImmutableDataFrame(df_grades),
-            }
-        )
+        catalog = self.get_catalog()
+        if self.get_value("catalog_version") != catalog.version:
+            # セッションには共有カタログへの参照だけを保存する
+            self.set_values(catalog.session_values())
 
     def postprocess(self):
         self.set_value("car_category", self.car_category)
@@ -68,13 +61,13 @@ class UserInputDisplay(BaseDisplay, DataManager, UserSession):
         """
         使用時間の入力部分
         """
-        self.hour = st.slider("1日の乗車時間[H]を入力ください?", 1, 24, step=1)
+        self.hour = st.slider("1日の乗車時間[H]を入力ください?", *HOUR_RANGE, step=1)
 
     def age(self):
         """
         使用年数の入力部分
         """
-        self.age = st.slider("使用年数を入力ください?", 1, 21, step=1)
+        self.age = st.slider("使用年数を入力ください?", *AGE_RANGE, step=1)
 
 
 class SearchResultDisplay(BaseDisplay, DataManager, UserSession):
@@ -93,11 +86,8 @@ class SearchResultDisplay(BaseDisplay, DataManager, UserSession):
         df_models = self.get_value("df_models")
         car_category = self.get_value("car_category")
         user_budget = self.get_value("user_budget")
-        df_grades_with_cost = self.calculate_costs(
-            age, hour, self.get_value("df_grades").to_dataframe()
-        )
-        df_search_result = self.search_car_meet_customer_needs(
-            df_models, car_category, df_grades_with_cost, user_budget
+        df_search_result = self.search_grades(
+            df_models, car_category, self.get_value("df_grades"), user_budget, age, hour
         )
         if df_search_result is None:
             self.meets_needs = False
@@ -107,14 +97,12 @@ class SearchResultDisplay(BaseDisplay, DataManager, UserSession):
 
     def postprocess(self):
         if self.meets_needs:
-            chosen_grades = (
-                self.edited_df[self.edited_df["check"]]["name_desc"]
-                .apply(lambda x: x.split(".", 1)[1])
-                .tolist()
-            )
+            df_checked = self.edited_df[self.edited_df["check"]]
+            # 表示名ではなくグレードIDで選択結果を受け渡す
+            chosen_grades = [int(grade_id) for grade_id in df_checked["grade_id"]]
             self.set_value("chosen_grades", chosen_grades)
             print(chosen_grades)
-            chosen_index = self.edited_df[self.edited_df["check"]].index.tolist()
+            chosen_index = df_checked.index.tolist()
             self.set_value("chosen_index", chosen_index)
 
     def show(self):
@@ -137,6 +125,7 @@ class SearchResultDisplay(BaseDisplay, DataManager, UserSession):
                 .rename_axis("#")
                 .assign(name_desc=lambda df: df.index.astype(str) + "." + df.name_desc),
                 column_config={
+                    "grade_id": None,  # 選択結果の受け渡し用で表示はしない
                     "image_url": st.column_config.ImageColumn(
                         "image",
                         width="small",
@@ -180,90 +169,17 @@ class ResultComparison(BaseDisplay, UserSession, DataManager):
 
         chosen_grades = self.get_value("chosen_grades")
         chosen_index = self.get_value("chosen_index")
-        df_grades = self.get_value("df_grades").to_dataframe()
+        df_grades = self.get_value("df_grades")
         df_calculated_costs = self.calculate_costs(
             age, self.get_value("hour"), df_grades
         )
 
-        df_filtered = df_calculated_costs[
-            df_calculated_costs["name_desc"].isin(chosen_grades)
-        ]
-        df_filtered["index"] = chosen_index
-
-        data1 = {
-            "経過年数": [],
-            "グレード": [],
-            "累計出費": [],
-        }
-
-        data2 = {
-            "経過年数": [],
-            "グレード": [],
-            "単年出費": [],
-        }
-
-        data3 = {
-            "グレード": [],
-            "費用項目": [],
-            "累計出費": [],
-        }
-
-        for _, row in df_filtered.iterrows():
-            for year in range(1, age + 1):
-                data1["経過年数"].append(year)
-                data1["グレード"].append(
-                    str(row["index"]) + ". " + row["name_desc"][:10] + "..."
-                )
-                data1["累計出費"].append(
-                    row["price"]
-                    - row["ResaleValue"]
-                    * (year == age)  # 売却年にのみリセールバリューを反映する
-                    + year * row["MonthlyTotalCost"] * 12
-                )
-
-                data2["経過年数"].append(year)
-                data2["グレード"].append(
-                    str(row["index"]) + ". " + row["name_desc"][:10] + "..."
-                )
-                data2["単年出費"].append(
-                    row["MonthlyTotalCost"] * 12
-                    - row["ResaleValue"]
-                    * (year == age)  # 売却年にのみリセールバリューを反映する
-                )
-
-            data3["グレード"].append(
-                str(row["index"]) + ". " + row["name_desc"][:10] + "..."
-            )
-            data3["費用項目"].append("初期費用")
-            data3["累計出費"].append(row["price"])
-
-            data3["グレード"].append(
-                str(row["index"]) + ". " + row["name_desc"][:10] + "..."
-            )
-            data3["費用項目"].append("メンテコスト")
-            data3["累計出費"].append(row["MainteCost"])
-
-            data3["グレード"].append(
-                str(row["index"]) + ". " + row["name_desc"][:10] + "..."
-            )
-            data3["費用項目"].append("保険料")
-            data3["累計出費"].append(row["InsuranceCost"])
-
-            data3["グレード"].append(
-                str(row["index"]) + ". " + row["name_desc"][:10] + "..."
-            )
-            data3["費用項目"].append("燃料費")
-            data3["累計出費"].append(row["FuelCost"])
-
-            data3["グレード"].append(
-                str(row["index"]) + ". " + row["name_desc"][:10] + "..."
-            )
-            data3["費用項目"].append("売却益")
-            data3["累計出費"].append(-row["ResaleValue"])
-
-        self.df1 = pd.DataFrame(data1)
-        self.df2 = pd.DataFrame(data2)
-        self.df3 = pd.DataFrame(data3)
+        # 選択した順番のまま、グレードIDから行位置を引いて取り出す
+        positions = self.get_grade_lookup(df_grades).positions(chosen_grades)
+        df_filtered = df_calculated_costs.iloc[positions]
+        self.df1, self.df2, self.df3 = self.build_lifecycle_cost_tables(
+            df_filtered, chosen_index, age
+        )
 
     def postprocess(self):
         return
@@ -330,14 +246,24 @@ class BookAddOptions(BaseDisplay, UserSession, DataManager, UtilityElement):
 
     def postprocess(self):
         if self.pushed:
-            self.insert_user_customization(
-                name=self.name,
-                email=self.email,
-                prefecture=self.prefecture,
-                baseid=self.target_base_id,
-                exteriorids=self.target_parts_ids,
-                interiorids=self.target_parts_interior_ids,
-                colorids=self.target_color_ids,
+            # DBへの書き込みは書き込みキューに任せ、キューに積めた時点で受け付け完了とする
+            try:
+                self.enqueue_user_customization(
+                    name=self.name,
+                    email=self.email,
+                    prefecture=self.prefecture,
+                    baseid=self.target_base_id,
+                    exteriorids=self.target_parts_ids,
+                    interiorids=self.target_parts_interior_ids,
+                    colorids=self.target_color_ids,
+                )
+            except queue.Full:
+                self.registration_message.error(
+                    "予約が混み合っています。しばらくしてから再度送信してください。"
+                )
+                return
+            self.registration_message.write(
+                "登録が完了しました。後日ディーラーからアポイントのご連絡をいたします。"
             )
 
     def show(self):
@@ -345,18 +271,18 @@ class BookAddOptions(BaseDisplay, UserSession, DataManager, UtilityElement):
         col1, col2 = st.columns([2, 1])
         img_url = None
         with col1:
-            self.target_grade = st.radio(
+            df_grades = self.get_value("df_grades")
+            grade_lookup = self.get_grade_lookup(df_grades)
+            self.target_grade_id = st.radio(
                 label="ディーラー予約するグレードを選択してください。",
                 options=self.get_value("chosen_grades"),
+                format_func=lambda grade_id: df_grades["name_desc"].iloc[
+                    grade_lookup.position(grade_id)
+                ],
             )
-            df_grades = self.get_value("df_grades")
-            self.target_grade_id = df_grades.query(
-                "name_desc==@self.target_grade"
-            ).grade_id.iloc[0]
-            self.target_base_id = df_grades.query(
-                "name_desc==@self.target_grade"
-            ).base_id.iloc[0]
-            img_url = df_grades.query("name_desc==@self.target_grade").image_url.iloc[0]
+            target_grade = df_grades.iloc[grade_lookup.position(self.target_grade_id)]
+            self.target_base_id = target_grade["base_id"]
+            img_url = target_grade["image_url"]
         with col2:
             if img_url:
                 st.image(img_url)
@@ -443,37 +369,33 @@ class BookAddOptions(BaseDisplay, UserSession, DataManager, UtilityElement):
 
         # フォームの送信ボタン
         self.pushed = st.button("この内容でディーラーを予約する")
-        if self.pushed:
-            st.write(
-                "登録が完了しました。後日ディーラーからアポイントのご連絡をいたします。"
-            )
+        # 受け付け結果はpostprocessで書き込みキューに積んだ後に表示する
+        self.registration_message = st.empty()
 
     def parts_exterior_selection(self):
-        df_parts = self.get_value("df_parts")
-        self.df_parts_target = df_parts.query(
-            "grade_id==@self.target_grade_id"
-        )  # 実質、target_grade_idがuniqueなのでmodelidでのフィルタは解除
+        self.df_parts_target = self.get_option_repository().get_exteriors(
+            self.target_grade_id
+        )
         target_parts_ids = self._show_data_as_table_and_select(
             df=self.df_parts_target,
             key_prefix=f"parts_gradeid_{self.target_grade_id}",
             caption_column="name",
             image_column="img_url",
-            id_column="option_grade_id",
+            id_column="exterior_id",
             colum_count=4,
         )
         self.target_parts_ids = target_parts_ids if target_parts_ids else [None]
 
     def parts_interior_selection(self):
-        df_parts_interior = self.get_value("df_parts_interior")
-        self.df_parts_interior_target = df_parts_interior.query(
-            "grade_id==@self.target_grade_id"
-        )  # 実質、target_grade_idがuniqueなのでmodelidでのフィルタは解除
+        self.df_parts_interior_target = self.get_option_repository().get_interiors(
+            self.target_grade_id
+        )
         target_parts_interior_ids = self._show_data_as_table_and_select(
             df=self.df_parts_interior_target,
             key_prefix=f"parts_interior_gradeid_{self.target_grade_id}",
             caption_column="name",
             image_column="img_url",
-            id_column="option_grade_id",
+            id_column="interior_id",
             colum_count=2,
         )
         self.target_parts_interior_ids = (
@@ -0,0 +1,148 @@
+import json
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+from domain_context.profile_config import (
+    STAGE_TIMING_ENABLED,
+    HISTOGRAM_MIN_SECONDS,
+    HISTOGRAM_GROWTH,
+)
+
+
+class LatencyHistogram:
+    """
+    処理時間を対数スケールのバケットで数えるヒストグラム。
+    バケットの境界は min_seconds * growth**i で、パーセンタイルはバケットの上限で近似する（相対誤差はgrowth-1以内）
+    値そのものは保持しないので、記録回数が増えてもメモリ使用量は変わらない
+    """
+
+    def __init__(self, min_seconds=HISTOGRAM_MIN_SECONDS, growth=HISTOGRAM_GROWTH):
+        self.min_seconds = min_seconds
+        self.growth = growth
+        self._log_growth = math.log(growth)
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        if seconds <= self.min_seconds:
+            bucket = 0
+        else:
+            bucket = math.ceil(math.log(seconds / self.min_seconds) / self._log_growth)
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, q):
+        """
+        q（0〜100）パーセンタイルの処理時間[秒]。記録が無い場合は0
+        """
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(self.count * q / 100))
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                # バケットの上限が実測の最大値を超える場合は最大値を返す
+                return min(self.min_seconds * self.growth**bucket, self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "total": self.total,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "max": self.max,
+        }
+
+
+class StageProfiler:
+    """
+    ページ要素（BaseDisplayの派生クラス）毎・段階（preprocess / show / postprocess）毎の処理時間を集計するクラス。
+    プロセス内の全セッションで共有し、ページ毎のヒストグラムからp50/p95/p99を求める
+    """
+
+    def __init__(self, enabled=STAGE_TIMING_ENABLED):
+        self.enabled = enabled
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def measure(self, page, stage):
+        """
+        with文の中の処理時間を記録する。例外が発生した場合も記録する
+        """
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(page, stage, time.perf_counter() - start)
+
+    def record(self, page, stage, seconds):
+        key = (page, stage)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = LatencyHistogram()
+            histogram.record(seconds)
+
+    def summary(self):
+        """
+        {ページ名: {段階名: {"count", "total", "mean", "p50", "p95", "p99", "max"}}}の形で集計結果を返す。時間の単位は秒
+        """
+        with self._lock:
+            items = sorted(self._histograms.items())
+            result = {}
+            for (page, stage), histogram in items:
+                result.setdefault(page, {})[stage] = histogram.summary()
+        return result
+
+    def rows(self):
+        """
+        デバッグ表示用に、集計結果を1行1段階のリストにして返す。時間の単位はミリ秒
+        """
+        return [
+            {
+                "page": page,
+                "stage": stage,
+                "count": stats["count"],
+                **{
+                    f"{name}_ms": stats[name] * 1000
+                    for name in ("mean", "p50", "p95", "p99", "max")
+                },
+            }
+            for page, stages in self.summary().items()
+            for stage, stats in stages.items()
+        ]
+
+    def dump(self, path):
+        """
+        集計結果をjsonファイルに書き出す
+        """
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(
+                {"dumped_at": time.time(), "pages": self.summary()},
+                f,
+                ensure_ascii=False,
+                indent=2,
+            )
+        print(f"stage timings were written to {path}")
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+
+
+# BaseDisplay.runが記録に使う、プロセス共有のプロファイラ
+stage_profiler = StageProfiler()
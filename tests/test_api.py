@@ -0,0 +1,150 @@
+import asyncio
+import json
+import pytest
+
+from api import QuoteAPI, QuoteService
+from benchmarks.load_test import copy_database
+from domain_context.db_config import DB_NAME
+
+
+@pytest.fixture
+def api(tmp_path):
+    # 予約を書き込むので、DBのコピーを使う
+    dbname = str(tmp_path / "api.db")
+    copy_database(DB_NAME, dbname)
+    service = QuoteService(dbname=dbname)
+    yield QuoteAPI(service)
+    service.close_reservation_queue()
+
+
+def call(app, method, path, body=None):
+    """
+    ASGIアプリを1回呼び出して(ステータス, ヘッダー, JSON)を返す
+    """
+    messages = []
+    request = json.dumps(body).encode("utf-8") if body is not None else b""
+
+    async def receive():
+        return {"type": "http.request", "body": request, "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    async def run():
+        await app({"type": "http", "method": method, "path": path, "headers": []}, receive, send)
+
+    asyncio.run(run())
+    start, response = messages
+    return start["status"], dict(start["headers"]), json.loads(response["body"])
+
+
+def profile(**overrides):
+    values = {"category": "SUV", "budget": 5000000, "hour": 2, "age": 5, "limit": 5}
+    values.update(overrides)
+    return values
+
+
+def test_quote(api):
+    status, headers, body = call(api, "POST", "/quote", profile())
+    assert status == 200
+    assert headers[b"content-type"] == b"application/json"
+
+    # 画面の検索と同じ結果を、実質月額の安い順に返す
+    service = api.service
+    catalog = service.get_catalog()
+    expected = service.search_grades(catalog.df_models, "SUV", catalog.df_grades, 5000000, 5, 2, limit=5)
+    assert [grade["grade_id"] for grade in body["grades"]] == expected["grade_id"].tolist()
+    costs = [grade["monthly_real_cost"] for grade in body["grades"]]
+    assert costs == sorted(costs)
+    assert body["catalog_version"] == catalog.version
+
+    # 同じ条件はキャッシュから返す
+    assert call(api, "POST", "/quote", profile())[2] == body
+    assert service.cache_stats()["hits"] == 1
+
+
+def test_quote_singleflight(api):
+    app = api
+
+    async def quote_many():
+        profile_key = api.service.parse_profile(profile(budget=6000000))
+        return await asyncio.gather(*(api.service.quote(profile_key) for _ in range(5)))
+
+    results = asyncio.run(quote_many())
+    # 同時に来た同じ条件の見積もりは1回だけ計算する
+    assert all(result is results[0] for result in results)
+    stats = app.service.cache_stats()
+    assert stats["misses"] == 1
+    assert stats["coalesced"] == 4
+
+
+def test_quotes_batch(api):
+    status, _, body = call(api, "POST", "/quotes", {"profiles": [profile(), profile(category="セダン")]})
+    assert status == 200
+    assert len(body["results"]) == 2
+    assert body["results"][0] == call(api, "POST", "/quote", profile())[2]
+
+
+@pytest.mark.parametrize(
+    "method, path, body, expected_status",
+    [
+        ("POST", "/quote", profile(hour=100), 400),
+        ("POST", "/quote", profile(budget="many"), 400),
+        ("POST", "/quote", None, 400),
+        ("POST", "/quotes", {"profiles": []}, 400),
+        ("GET", "/quote", None, 405),
+        ("GET", "/unknown", None, 404),
+    ],
+)
+def test_errors(api, method, path, body, expected_status):
+    status, _, response = call(api, method, path, body)
+    assert status == expected_status
+    assert "error" in response
+
+
+def test_reservations(api):
+    reservation = {
+        "name": "api user",
+        "email": "api@example.com",
+        "prefecture": "東京都",
+        "grade_id": 2,
+        "color_ids": [1],
+        "exterior_ids": [1, 2],
+    }
+    status, _, body = call(api, "POST", "/reservations", reservation)
+    assert status == 202
+    assert body["reservation_id"] == 1
+    assert call(api, "POST", "/reservations", dict(reservation, grade_id=999999))[0] == 404
+    assert call(api, "POST", "/reservations", dict(reservation, name=""))[0] == 400
+    # グレードで選択できない外装は受け付けない
+    status, _, body = call(api, "POST", "/reservations", dict(reservation, exterior_ids=[1, 29]))
+    assert status == 400 and "[29]" in body["error"]
+
+    api.service.get_reservation_queue().flush(timeout=5)
+    db_manager = api.service._get_db_manager()
+    assert db_manager.get_data("SELECT COUNT(*) FROM Users WHERE username = 'api user'")[0][0] == 1
+
+    status, _, metrics = call(api, "GET", "/metrics")
+    assert status == 200
+    assert metrics["reservation_queue"]["committed"] == 1
+    assert metrics["responses"]["/reservations 202"] == 1
+    # カタログの変換前後のメモリ使用量も返す
+    assert metrics["catalog_memory"]["df_grades"]["after"] < metrics["catalog_memory"]["df_grades"]["before"]
+    # 予約で引いたグレードのオプションはキャッシュされている
+    assert metrics["option_cache"]["size"] >= 2
+
+
+def test_health(api):
+    status, _, body = call(api, "GET", "/health")
+    assert status == 200
+    assert body["status"] == "ok"
+
+
+def test_metrics_does_not_start_reservation_queue(api):
+    from data_manager.data_manager import _reservation_queues
+
+    status, _, metrics = call(api, "GET", "/metrics")
+    assert status == 200
+    # 予約を受け付けるまでは書き込みキューを起動しない
+    assert metrics["reservation_queue"] is None
+    assert api.service.dbname not in _reservation_queues
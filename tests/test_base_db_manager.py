@@ -1,7 +1,11 @@
 import pytest
 import sqlite3
 import os
-from data_manager.base_db_manager import SQliteManager, BasicDataObject
+import json
+import asyncio
+import threading
+import time
+from data_manager.base_db_manager import BaseDBManager, SQliteManager, AsyncSQliteManager, BasicDataObject, remove_sqlite_files
 
 # テスト用のSQLiteデータベースファイルのパス
 TEST_DB_PATH = 'test_db.sqlite'
@@ -11,9 +15,8 @@ def db_manager():
     # テストDBを作成
     manager = SQliteManager(TEST_DB_PATH)
     yield manager
-    # テストが終わった後にDBファイルを削除
-    if os.path.exists(TEST_DB_PATH):
-        os.remove(TEST_DB_PATH)
+    # テストが終わった後に接続を閉じて、DBファイルをWALなどと一緒に削除
+    remove_sqlite_files(TEST_DB_PATH)
 
 @pytest.fixture(scope="function")
 def setup_db(db_manager):
@@ -89,3 +92,228 @@ def test_basic_data_object_insert_db(db_manager, setup_db):
     assert len(result) == 1
     assert result[0][1] == "David"
     assert result[0][2] == 40
+
+def test_connection_pool_reuses_connections(db_manager, setup_db):
+    db_manager.insert_data("test_table", [{"name": "Alice", "age": 30}])
+    before = db_manager.pool_stats()
+
+    # 同じDBファイルを扱う別インスタンスでもプールを共有する
+    other_manager = SQliteManager(TEST_DB_PATH)
+    assert other_manager.pool is db_manager.pool
+
+    other_manager.get_data("SELECT * FROM test_table")
+    other_manager.get_data("SELECT * FROM test_table")
+    after = db_manager.pool_stats()
+    assert after["hits"] > before["hits"]
+    assert after["idle"] >= 1
+
+def test_connection_pool_stats_under_concurrency(tmp_path):
+    manager = SQliteManager(str(tmp_path / "stats.db"), pool_size=2)
+    manager.execute_script("CREATE TABLE test_table (id INTEGER PRIMARY KEY, name TEXT);")
+    before = manager.pool_stats()
+
+    def borrow():
+        for i in range(50):
+            manager.get_data("SELECT COUNT(*) FROM test_table")
+            manager.insert_rows("test_table", ("name",), [(f"user{i}",)])
+
+    try:
+        threads = [threading.Thread(target=borrow) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # 読み込み・書き込みの接続を同時に借りても、貸し出しの回数を数え漏らさない
+        after = manager.pool_stats()
+        borrowed = (after["hits"] + after["misses"]) - (before["hits"] + before["misses"])
+        assert borrowed == 8 * 50 * 2
+    finally:
+        manager.discard()
+
+def test_connection_pool_applies_pragmas():
+    manager = SQliteManager(TEST_DB_PATH, pool_size=1, pragmas={"user_version": 7})
+    try:
+        assert manager.get_data("PRAGMA user_version")[0][0] == 7
+    finally:
+        remove_sqlite_files(TEST_DB_PATH)
+
+def test_connection_profile_wal_and_read_only_readers(tmp_path):
+    path = str(tmp_path / "profile.db")
+    writer = SQliteManager(path)
+    writer.execute_script("CREATE TABLE test_table (id INTEGER PRIMARY KEY, name TEXT);")
+    manager = SQliteManager(
+        path,
+        pragmas={"busy_timeout": 3000, "mmap_size": 1048576, "cache_size": -1024},
+        journal_mode="WAL",
+        read_only_readers=True,
+    )
+    try:
+        # 読み込み用の接続を開く前にWALへ切り替え、PRAGMAは読み込み用の接続にも適用する
+        assert manager.get_data("PRAGMA journal_mode")[0][0] == "wal"
+        assert manager.get_data("PRAGMA busy_timeout")[0][0] == 3000
+        assert manager.get_data("PRAGMA cache_size")[0][0] == -1024
+        # 読み込み用の接続では書き込めない
+        with pytest.raises(sqlite3.OperationalError):
+            manager.get_data("INSERT INTO test_table (name) VALUES ('Alice')")
+
+        # 書き込みのトランザクション中でも、読み込みはコミット済みの内容で止まらずに返る
+        with manager.transaction() as uow:
+            uow.insert_record("test_table", {"name": "Alice"})
+            assert manager.get_data("SELECT COUNT(*) FROM test_table")[0][0] == 0
+        assert manager.get_data("SELECT COUNT(*) FROM test_table")[0][0] == 1
+        stats = manager.pool_stats()
+        assert stats["journal_mode"] == "WAL"
+        assert stats["read_only_readers"] is True
+    finally:
+        manager.discard()
+        writer.discard()
+
+def test_connection_pool_reconnects_when_file_replaced(db_manager, setup_db, tmp_path):
+    db_manager.insert_data("test_table", [{"name": "Alice", "age": 30}])
+    assert len(db_manager.get_data("SELECT * FROM test_table")) == 1
+    # init_DBと同じく、別に作ったDBファイルをos.replaceで置き換える
+    new_db_path = str(tmp_path / "new.sqlite")
+    new_manager = SQliteManager(new_db_path)
+    new_manager.execute_script("CREATE TABLE test_table (id INTEGER PRIMARY KEY, name TEXT, age INTEGER);")
+    new_manager.discard()
+    os.replace(new_db_path, TEST_DB_PATH)
+
+    # ファイルが置き換わった場合は古い接続を使わない
+    assert db_manager.get_data("SELECT * FROM test_table") == []
+    assert db_manager.pool_stats()["stale"] >= 1
+
+def test_transaction_commits_once(db_manager, setup_db):
+    with db_manager.transaction() as uow:
+        last_id = uow.insert_record("test_table", {"name": "Alice", "age": 30})
+        uow.insert_many("test_table", ("name", "age"), [("Bob", 25), ("Charlie", 35)])
+
+    result = db_manager.get_data("SELECT name FROM test_table ORDER BY id")
+    assert last_id == 1
+    assert [row[0] for row in result] == ["Alice", "Bob", "Charlie"]
+
+def test_transaction_rolls_back_on_error(db_manager, setup_db):
+    with pytest.raises(sqlite3.OperationalError):
+        with db_manager.transaction() as uow:
+            uow.insert_record("test_table", {"name": "Alice", "age": 30})
+            uow.insert_many("missing_table", ("name",), [("Bob",)])
+
+    # 途中で失敗した場合は何も書き込まれない
+    assert db_manager.get_data("SELECT * FROM test_table") == []
+
+def test_bulk_load(tmp_path):
+    manager = SQliteManager(str(tmp_path / "bulk.sqlite"))
+    manager.execute_script("CREATE TABLE test_table (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, age INTEGER);")
+    rows = ((f"user{i}", i) for i in range(1000))
+    report = manager.bulk_load(
+        [("test_table", (("name", "age"), rows))],
+        post_load_sql="CREATE INDEX idx_test_table_age ON test_table (age);",
+    )
+
+    assert report["test_table"]["rows"] == 1000
+    assert report["test_table"]["rows_per_sec"] > 0
+    assert manager.get_data("SELECT COUNT(*) FROM test_table")[0][0] == 1000
+    assert manager.get_data("SELECT name FROM sqlite_master WHERE type = 'index'") == [("idx_test_table_age",)]
+    # 投入後はWALモードに切り替わり、同期設定は元に戻る
+    assert manager.get_data("PRAGMA journal_mode")[0][0] == "wal"
+    with manager.pool.writer() as conn:
+        assert conn.execute("PRAGMA synchronous").fetchone()[0] == 2
+    manager.close()
+
+def test_bulk_load_rolls_back_on_error(tmp_path):
+    manager = SQliteManager(str(tmp_path / "bulk.sqlite"))
+    manager.execute_script("CREATE TABLE test_table (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, age INTEGER);")
+    with pytest.raises(sqlite3.OperationalError):
+        manager.bulk_load(
+            [
+                ("test_table", (("name", "age"), [("Alice", 30)])),
+                ("missing_table", (("name",), [("Bob",)])),
+            ]
+        )
+    assert manager.get_data("SELECT * FROM test_table") == []
+    manager.close()
+
+def test_query_profiler(tmp_path):
+    manager = SQliteManager(str(tmp_path / "profile.sqlite"))
+    manager.execute_script("CREATE TABLE test_table (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, age INTEGER);")
+    assert manager.query_stats() == {}
+
+    # 閾値0秒ですべてのSQLをスロークエリとして記録する
+    log_path = tmp_path / "slow_queries.log"
+    profiler = manager.enable_profiler(slow_seconds=0, log_path=str(log_path))
+    # 同じDBファイルを扱う別のインスタンスでも同じプロファイラを使う
+    assert SQliteManager(str(tmp_path / "profile.sqlite")).enable_profiler() is profiler
+
+    manager.insert_rows("test_table", ("name", "age"), [("Alice", 30), ("Bob", 25)])
+    with manager.transaction() as uow:
+        uow.insert_record("test_table", {"name": "Carol", "age": 40})
+    for _ in range(3):
+        manager.get_data("SELECT name FROM test_table WHERE age > ?", (20,))
+    manager.get_df("SELECT * FROM test_table")
+
+    stats = manager.query_stats()
+    select_stats = stats["SELECT name FROM test_table WHERE age > ?"]
+    assert select_stats["count"] == 3
+    assert select_stats["rows"] == 9
+    assert select_stats["max"] >= select_stats["mean"] > 0
+    assert select_stats["full_scan"]
+    # executemanyの2行とUnitOfWork経由の1行
+    insert_stats = stats["INSERT INTO test_table (name, age) VALUES (?, ?)"]
+    assert insert_stats["count"] == 2
+    assert insert_stats["rows"] == 3
+
+    # スロークエリは実行計画と一緒にjson形式で書き出される
+    for handler in profiler.logger.handlers:
+        handler.flush()
+    with open(log_path, encoding="utf-8") as f:
+        entries = [json.loads(line) for line in f]
+    scans = [entry for entry in entries if entry["sql"] == "SELECT * FROM test_table"]
+    assert scans and scans[0]["full_scan"] and scans[0]["plan"]
+
+    manager.disable_profiler()
+    assert manager.query_stats() == {}
+    manager.close()
+
+def test_async_sqlite_manager(tmp_path):
+    manager = AsyncSQliteManager(str(tmp_path / "async.db"), max_concurrency=2)
+    # 他のマネージャーと同じインターフェースを持ち、同じ設定のSQliteManagerと接続プールを共有する
+    assert isinstance(manager, BaseDBManager)
+    assert manager.db_manager.pool is SQliteManager(str(tmp_path / "async.db")).pool
+    running = []
+    peak = []
+    lock = threading.Lock()
+
+    def slow_query():
+        with lock:
+            running.append(1)
+            peak.append(len(running))
+        time.sleep(0.05)
+        with lock:
+            running.pop()
+        return manager.db_manager.get_data("SELECT COUNT(*) FROM test_table")[0][0]
+
+    async def scenario():
+        await manager.execute_script("CREATE TABLE test_table (id INTEGER PRIMARY KEY, name TEXT);")
+        ids = await asyncio.gather(*(manager.insert_record("test_table", {"name": f"user{i}"}) for i in range(5)))
+        df = await manager.get_df("SELECT name FROM test_table ORDER BY id")
+        counts = await asyncio.gather(*(manager.run(slow_query) for _ in range(6)))
+        return ids, df, counts
+
+    try:
+        ids, df, counts = asyncio.run(scenario())
+        assert sorted(ids) == [1, 2, 3, 4, 5]
+        assert len(df) == 5
+        assert counts == [5] * 6
+        # 同時に実行するのはmax_concurrency件まで
+        assert max(peak) == 2
+
+        # トランザクション内で例外が起きた場合はすべてロールバックする
+        def failing(uow):
+            uow.insert_record("test_table", {"name": "rollback"})
+            raise ValueError("boom")
+
+        with pytest.raises(ValueError):
+            asyncio.run(manager.run_in_transaction(failing))
+        assert asyncio.run(manager.get_data("SELECT COUNT(*) FROM test_table"))[0][0] == 5
+    finally:
+        manager.close()
+        manager.db_manager.discard()
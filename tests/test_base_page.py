@@ -1,6 +1,7 @@
 import pytest
 import pandas as pd
 from page_manager.base_page import BaseDisplay, UtilityElement
+from page_manager.stage_profiler import stage_profiler
 
 # テスト用の BaseDisplay のモック実装
 class MockDisplay(BaseDisplay):
@@ -39,6 +40,15 @@ def test_base_display(mock_display):
     assert mock_display.shown         # show が呼び出されたことを確認
     assert mock_display.postprocessed # postprocess が呼び出されたことを確認
 
+# BaseDisplay.run が各段階の処理時間をクラス名毎に記録することを確認するテスト
+def test_base_display_records_stage_timings(mock_display):
+    stage_profiler.reset()
+    mock_display.run()
+    mock_display.run()
+    stages = stage_profiler.summary()["MockDisplay"]
+    assert set(stages) == {"preprocess", "show", "postprocess", "total"}
+    assert all(stats["count"] == 2 for stats in stages.values())
+
 # UtilityElement クラスのインスタンスを作成するフィクスチャ
 @pytest.fixture(scope="function")
 def utility_element():
@@ -0,0 +1,126 @@
+import csv
+import json
+
+import pytest
+
+from batch_quote import CatalogQuoter, main, parse_profile
+from benchmarks.load_test import copy_database
+from data_manager.base_db_manager import remove_sqlite_files
+from data_manager.data_manager import DataManager
+from domain_context.db_config import DB_NAME
+
+
+@pytest.fixture
+def dbname(tmp_path):
+    # カタログの読み込みでDBの移行やWALの書き込みが起きるので、リポジトリのDBではなくコピーを使う
+    dbname = str(tmp_path / "catalog.db")
+    copy_database(DB_NAME, dbname)
+    yield dbname
+    remove_sqlite_files(dbname)
+
+
+def test_catalog_quoter_matches_search_grades(dbname):
+    data_manager = DataManager()
+    data_manager.dbname = dbname
+    catalog = data_manager.get_catalog()
+    quoter = CatalogQuoter(catalog)
+    for category, budget, hour, age in [("SUV", 5000000, 2, 5), ("セダン", 3000000, 8, 10), ("SUV", 0, 1, 1)]:
+        expected = data_manager.search_grades(
+            catalog.df_models, category, catalog.df_grades, budget, age, hour, limit=5
+        )
+        matches = quoter.quote(category, budget, hour, age, limit=5)
+        assert [match["grade_id"] for match in matches] == expected["grade_id"].tolist()
+        assert [match["monthly_real_cost"] for match in matches] == expected["MonthlyRealCost"].tolist()
+        assert [match["match_rank"] for match in matches] == list(range(1, len(matches) + 1))
+
+
+def test_parse_profile():
+    assert parse_profile({"category": "SUV", "budget": "5000000", "hour": "2", "age": 5}) == ("SUV", 5000000, 2, 5)
+    for profile in ({"category": "SUV", "budget": "x", "hour": 2, "age": 5}, {"category": "SUV", "budget": 1, "hour": 2, "age": 100}):
+        try:
+            parse_profile(profile)
+        except ValueError:
+            continue
+        raise AssertionError(f"{profile} should be rejected")
+
+
+def test_batch_quote_cli(tmp_path, dbname, capsys):
+    input_path = tmp_path / "profiles.csv"
+    with open(input_path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["id", "category", "budget", "hour", "age"])
+        for i in range(25):
+            writer.writerow([i, "SUV", 3000000 + i * 100000, 2, 5])
+        writer.writerow([25, "SUV", "unknown", 2, 5])
+
+    output_path = tmp_path / "quotes.jsonl"
+    exit_code = main([str(input_path), "--output", str(output_path), "--db", dbname, "--workers", "2", "--chunk-size", "4", "--limit", "3"])
+
+    # 不正な行があれば終了コード1で、その行にはエラーを出力する
+    assert exit_code == 1
+    records = [json.loads(line) for line in output_path.read_text(encoding="utf-8").splitlines()]
+    # チャンクに分けて並列に計算しても、入力の順番どおりに出力する
+    assert [record["id"] for record in records] == [str(i) for i in range(26)]
+    assert all(len(record["matches"]) <= 3 for record in records)
+    assert records[-1]["error"] is not None and records[-1]["matches"] == []
+    assert "26 profiles" in capsys.readouterr().err
+
+    csv_path = tmp_path / "quotes.csv"
+    main([str(input_path), "--output", str(csv_path), "--db", dbname, "--workers", "1", "--limit", "2"])
+    with open(csv_path, encoding="utf-8", newline="") as f:
+        rows = list(csv.DictReader(f))
+    # CSVは1グレード1行。該当なし・エラーのプロファイルも1行出力する
+    assert rows[0]["match_rank"] == "1"
+    assert sum(row["id"] == "0" for row in rows) == max(1, len(records[0]["matches"][:2]))
+    assert rows[-1]["error"]
+
+
+def test_batch_quote_cli_reports_bad_jsonl_lines(tmp_path, dbname, capsys):
+    input_path = tmp_path / "profiles.jsonl"
+    input_path.write_text(
+        "\n".join(
+            [
+                json.dumps({"id": 1, "category": "SUV", "budget": 5000000, "hour": 2, "age": 5}),
+                "[1, 2]",
+                '{"id": 3, "category": ',
+                json.dumps({"id": 4, "category": "SUV", "budget": 5000000, "hour": 2, "age": 5}),
+            ]
+        ),
+        encoding="utf-8",
+    )
+    for output_name in ("quotes.jsonl", "quotes.csv"):
+        output_path = tmp_path / output_name
+        assert main([str(input_path), "--output", str(output_path), "--db", dbname, "--workers", "1"]) == 1
+        assert "4 profiles (2 matched, 2 errors)" in capsys.readouterr().err
+
+    # 不正な行は入力を"input"に入れたエラーの行になり、他の行の見積もりは続ける
+    records = [json.loads(line) for line in (tmp_path / "quotes.jsonl").read_text(encoding="utf-8").splitlines()]
+    assert [record.get("id") for record in records] == [1, None, None, 4]
+    assert records[1]["input"] == [1, 2] and records[1]["error"]
+    assert records[2]["input"] == '{"id": 3, "category": ' and records[2]["error"]
+    assert records[3]["matches"]
+
+
+def test_batch_quote_csv_header_does_not_depend_on_first_row(tmp_path, dbname, capsys):
+    input_path = tmp_path / "profiles.jsonl"
+    input_path.write_text(
+        "\n".join(["not json", json.dumps({"id": 2, "category": "SUV", "budget": 5000000, "hour": 2, "age": 5})]),
+        encoding="utf-8",
+    )
+    output_path = tmp_path / "quotes.csv"
+    assert main([str(input_path), "--output", str(output_path), "--db", dbname, "--workers", "1", "--limit", "1"]) == 1
+    with open(output_path, encoding="utf-8", newline="") as f:
+        reader = csv.DictReader(f)
+        rows = list(reader)
+    # 先頭の行が不正でも、列は固定なので後の行の値は欠けない
+    assert reader.fieldnames == ["id", "category", "budget", "hour", "age", "input", "match_rank", "grade_id", "name", "monthly_real_cost", "monthly_total_cost", "resale_value", "error"]
+    assert rows[0]["input"] == "not json" and rows[0]["error"]
+    assert rows[1]["id"] == "2" and rows[1]["category"] == "SUV" and rows[1]["match_rank"] == "1"
+
+
+@pytest.mark.parametrize("option", ["--limit", "--workers", "--chunk-size"])
+def test_batch_quote_cli_rejects_non_positive_numbers(tmp_path, option, capsys):
+    with pytest.raises(SystemExit) as e:
+        main([str(tmp_path / "profiles.csv"), option, "0"])
+    assert e.value.code == 2
+    assert "must be at least 1" in capsys.readouterr().err
@@ -0,0 +1,56 @@
+import os
+
+from benchmarks.catalog_scaling import replicate_seed_data, count_rows
+from benchmarks.run_benchmarks import CatalogBenchmark, compare, run_benchmarks
+
+
+def seed_data():
+    # DataManager._read_seed_dataと同じ形式の小さな初期データ
+    return [
+        ("CarCategories", (("CategoryName",), [("SUV",)])),
+        ("CarModels", (("ModelName", "CategoryID", "ImageURL"), [("RAV4", 1, "url1"), ("ハリアー", 1, "url2")])),
+        ("CarGrades", (("GradeName", "Description", "ModelID"), [("X", "desc", 1), ("Z", "desc", 2)])),
+        ("Exteriors", (("Item", "ImageURL", "AdditionalCost"), [("ルーフ", "url", 1000)])),
+        ("GradeExteriors", (("GradeID", "ExteriorID"), [(2, 1)])),
+    ]
+
+
+def test_replicate_seed_data():
+    tables = dict(replicate_seed_data(seed_data(), 3))
+    counts = count_rows(replicate_seed_data(seed_data(), 3))
+    # カテゴリは共通なので複製しない
+    assert counts == {"CarCategories": 1, "CarModels": 6, "CarGrades": 6, "Exteriors": 3, "GradeExteriors": 3}
+
+    # 複製した行の外部キーは複製元の行数×複製番号だけずれる
+    _, grades = tables["CarGrades"]
+    assert [row[2] for row in grades] == [1, 2, 3, 4, 5, 6]
+    _, models = tables["CarModels"]
+    assert [row[0] for row in models][2:4] == ["RAV4 #2", "ハリアー #2"]
+    _, grade_exteriors = tables["GradeExteriors"]
+    assert list(grade_exteriors) == [(2, 1), (4, 2), (6, 3)]
+
+
+def test_compare_detects_regressions():
+    baseline = {"calculate_costs[x1]": {"median": 1.0}, "init_DB[x1]": {"median": 1.0}}
+    results = {
+        "calculate_costs[x1]": {"median": 1.1},
+        "init_DB[x1]": {"median": 1.3},
+        "search_grades[x1]": {"median": 5.0},  # ベースラインに無い処理は比較しない
+    }
+    assert compare(results, baseline, threshold=0.2) == [("init_DB[x1]", 1.0, 1.3)]
+
+
+def test_run_benchmarks():
+    results = run_benchmarks([1], repeat=1, cases=["calculate_costs", "search_grades"])
+    assert set(results) == {"calculate_costs[x1]", "search_grades[x1]"}
+    assert results["search_grades[x1]"]["median"] > 0
+
+
+def test_remove_db_removes_wal_files(tmp_path):
+    benchmark = CatalogBenchmark(1, str(tmp_path))
+    dbname = benchmark.data_manager.dbname
+    # カタログの読み込みでWALのファイルができている
+    assert os.path.exists(dbname + "-wal")
+    benchmark._remove_db()
+    assert [name for name in os.listdir(tmp_path) if name.startswith(os.path.basename(dbname) + "-")] == []
+    assert not os.path.exists(dbname)
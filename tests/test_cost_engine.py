@@ -0,0 +1,110 @@
+import numpy as np
+import pandas as pd
+import pytest
+from data_manager.cost_engine import CostEngine, COST_COLUMNS
+from data_manager.data_manager import DataManager, ImmutableDataFrame
+from domain_context.default_values import AGE_RANGE, HOUR_RANGE
+
+
+@pytest.fixture(scope="module")
+def df_grades():
+    # 実データに近い値の範囲でグレードを生成
+    rng = np.random.default_rng(0)
+    size = 50
+    return pd.DataFrame(
+        {
+            "price": rng.integers(1_000_000, 8_000_000, size),
+            "FuelCostPerKilo": rng.uniform(3, 20, size).round(2),
+            "MonthlyMainteCost": rng.uniform(3000, 20000, size).round(1),
+            "MonthlyInsuranceCost": rng.uniform(3000, 15000, size).round(1),
+            "MonthlyPriceDropRate": rng.uniform(0.005, 0.03, size).round(4),
+        }
+    )
+
+
+def test_cost_engine_matches_calculate_costs(df_grades):
+    # すべての(使用年数, 乗車時間)で、逐次計算した結果と一致することを確認
+    engine = CostEngine(df_grades)
+    data_manager = DataManager()
+    for age in range(AGE_RANGE[0], AGE_RANGE[1] + 1):
+        for hour in range(HOUR_RANGE[0], HOUR_RANGE[1] + 1):
+            expected = data_manager.calculate_costs(age, hour, df_grades.copy())
+            costs = engine.costs(age, hour)
+            for column in COST_COLUMNS:
+                np.testing.assert_array_equal(costs[column], expected[column].to_numpy())
+
+
+def test_cost_engine_stores_int32(df_grades):
+    engine = CostEngine(df_grades)
+    assert all(values.dtype == np.int32 for values in engine.tensors.values())
+    # 使用年数・乗車時間の全組み合わせ分の実体を持つのは燃料費・月額・実質月額の3つだけ
+    shape = engine.tensors["FuelCost"].shape
+    assert engine.nbytes() < 4 * len(df_grades) * shape[1] * shape[2] * 4
+    # int32に収まらない値はint64のまま保持する
+    assert CostEngine._narrow(np.array([2**40])).dtype == np.int64
+
+
+def test_cost_engine_is_read_only(df_grades):
+    engine = CostEngine(df_grades)
+    with pytest.raises(ValueError):
+        engine.costs(1, 1)["FuelCost"][0] = 0
+
+
+def test_calculate_costs_uses_cost_engine(df_grades):
+    data_manager = DataManager()
+    immutable_df = ImmutableDataFrame(df_grades)
+
+    df = data_manager.calculate_costs(3, 5, immutable_df)
+    expected = data_manager.calculate_costs(3, 5, df_grades.copy())
+    pd.testing.assert_frame_equal(df, expected)
+    # 事前計算はデータフレーム毎に1回だけ行われる
+    assert immutable_df.get_derived(CostEngine) is immutable_df.get_derived(CostEngine)
+
+    # 範囲外の組み合わせは逐次計算にフォールバックする
+    df = data_manager.calculate_costs(30, 5, immutable_df)
+    expected = data_manager.calculate_costs(30, 5, df_grades.copy())
+    pd.testing.assert_frame_equal(df, expected)
+
+
+def test_budget_index_matches_mask_search(df_grades):
+    # 3カテゴリに分けたグレードで、インデックス検索とマスク検索の結果が一致することを確認
+    df_grades = df_grades.assign(model_id=np.arange(len(df_grades)) % 5)
+    df_models = pd.DataFrame(
+        {"model_id": [0, 1, 2, 3, 4], "category_name": ["SUV", "SUV", "セダン", "ミニバン", "セダン"]}
+    )
+    data_manager = DataManager()
+    immutable_grades = ImmutableDataFrame(df_grades)
+    immutable_models = ImmutableDataFrame(df_models)
+    for age, hour in [(1, 1), (5, 3), (21, 24)]:
+        df_with_cost = data_manager.calculate_costs(age, hour, df_grades.copy())
+        for category in ["SUV", "セダン", "ミニバン", "ワゴン"]:
+            for budget in [0, 600_000, 1_200_000, 5_000_000]:
+                expected = data_manager.search_car_meet_customer_needs(
+                    df_models, category, df_with_cost, budget
+                ).sort_values("MonthlyRealCost", kind="stable")
+                result = data_manager.search_grades(
+                    immutable_models, category, immutable_grades, budget, age, hour
+                )
+                pd.testing.assert_frame_equal(result, expected)
+
+
+def test_budget_index_pagination(df_grades):
+    df_grades = df_grades.assign(model_id=1)
+    df_models = pd.DataFrame({"model_id": [1], "category_name": ["SUV"]})
+    data_manager = DataManager()
+    immutable_grades = ImmutableDataFrame(df_grades)
+    immutable_models = ImmutableDataFrame(df_models)
+
+    full = data_manager.search_grades(immutable_models, "SUV", immutable_grades, 10_000_000, 3, 2)
+    page = data_manager.search_grades(
+        immutable_models, "SUV", immutable_grades, 10_000_000, 3, 2, limit=10, offset=5
+    )
+    pd.testing.assert_frame_equal(page, full.iloc[5:15])
+    assert full["MonthlyRealCost"].is_monotonic_increasing
+
+    # 通常のデータフレームでも同じ結果になる
+    fallback = data_manager.search_grades(df_models, "SUV", df_grades, 10_000_000, 3, 2, limit=10, offset=5)
+    pd.testing.assert_frame_equal(fallback, page)
+
+    # 予算が数値でない場合はNoneを返す
+    assert data_manager.search_grades(immutable_models, "SUV", immutable_grades, "", 3, 2) is None
@@ -2,10 +2,11 @@ import pytest
 import sqlite3
 import os
 import pandas as pd
+import numpy as np
 import json
-from data_manager.data_manager import DataManager, ImmutableDataFrame
-from data_manager.base_db_manager import SQliteManager
-from domain_context.db_config import CREATE_TABLES_SQL_PATH
+from data_manager.data_manager import DataManager, ImmutableDataFrame, OptionRepository, GradeLookup, compact_frame
+from data_manager.base_db_manager import SQliteManager, remove_sqlite_files
+from domain_context.db_config import CREATE_TABLES_SQL_PATH, CREATE_VIEWS_SQL_PATH
 
 # SQLスクリプトのパス
 TEST_DB_PATH = 'test_db.sqlite'
@@ -19,19 +20,28 @@ def data_manager():
     manager.dbname = TEST_DB_PATH
 
     # テストDBファイルが存在する場合は削除
-    if os.path.exists(TEST_DB_PATH):
-        os.remove(TEST_DB_PATH)
+    remove_test_db()
     
     # 外部ファイルからSQLスクリプトを読み込む
     with open(CREATE_TABLES_SQL_PATH, 'r', encoding='utf-8') as f:
         create_tables_sql = f.read()
-    # テスト用のテーブルを作成
+    with open(CREATE_VIEWS_SQL_PATH, 'r', encoding='utf-8') as f:
+        create_views_sql = f.read()
+    # テスト用のテーブルとビューを作成
     DB_MANAGER.execute_script(create_tables_sql)
+    DB_MANAGER.execute_script(create_views_sql)
     
     yield manager
-    # テストが終わった後にDBファイルを削除
-    if os.path.exists(TEST_DB_PATH):
-        os.remove(TEST_DB_PATH)
+    # テストが終わった後に予約キューと接続を閉じて、DBファイルを関連するファイルと一緒に削除
+    manager.close_reservation_queue()
+    remove_test_db()
+
+
+def remove_test_db():
+    remove_sqlite_files(TEST_DB_PATH)
+    for suffix in (".lock", ".reservations.jsonl", ".reservations.jsonl.lock"):
+        if os.path.exists(TEST_DB_PATH + suffix):
+            os.remove(TEST_DB_PATH + suffix)
 
 def test_insert_user_customization(data_manager):
     # ユーザーとカスタマイゼーションを挿入
@@ -157,6 +167,7 @@ def test_search_car_meet_customer_needs(data_manager):
 
     df_grades_with_cost = pd.DataFrame({
         "model_id": [1, 2, 1, 1],
+        "grade_id": [11, 12, 13, 14],
         "image_url": ["url1", "url2", "url3", "url4"],
         "name_desc": ["ミニバン", "ワゴン", "ミニバン", "ミニバン"],
         "MonthlyRealCost": [8000, 10000, 9000, 100000],
@@ -172,6 +183,7 @@ def test_search_car_meet_customer_needs(data_manager):
 
     # 期待される出力
     expected_data = {
+        "grade_id": [11, 13],
         "image_url": ["url1", "url3"],
         "name_desc": ["ミニバン", "ミニバン"],
         "MonthlyRealCost": [8000, 9000],
@@ -183,4 +195,299 @@ def test_search_car_meet_customer_needs(data_manager):
     expected_df = pd.DataFrame(expected_data)
 
     # 変換後のdataframeが期待と一致するか確認
-    pd.testing.assert_frame_equal(df_search_result.reset_index(drop=True), expected_df)
\ No newline at end of file
+    pd.testing.assert_frame_equal(df_search_result.reset_index(drop=True), expected_df)
+
+def test_get_catalog_is_shared(data_manager):
+    # 読み直してから取得し、同じオブジェクトが共有されることを確認
+    catalog = data_manager.reload_catalog()
+    other_manager = DataManager()
+    other_manager.dbname = TEST_DB_PATH
+    assert other_manager.get_catalog() is catalog
+    assert catalog.session_values()["df_grades"] is catalog.df_grades
+
+    # 読み直すとバージョンが更新される
+    reloaded = data_manager.reload_catalog()
+    assert reloaded is not catalog
+    assert reloaded.version > catalog.version
+    assert data_manager.get_catalog() is reloaded
+
+def test_insert_user_customization_is_atomic(data_manager):
+    # 子テーブルの挿入に失敗した場合、ユーザーとカスタマイズも登録されない
+    DB_MANAGER.execute_script("DROP TABLE ExteriorCustomizations;")
+    with pytest.raises(sqlite3.OperationalError):
+        data_manager.insert_user_customization("John Doe", "john@example.com", "Tokyo", 1, [1], [1], [1, 2, 3])
+
+    assert DB_MANAGER.get_data("SELECT * FROM Users") == []
+    assert DB_MANAGER.get_data("SELECT * FROM Customizations") == []
+
+def test_build_lifecycle_cost_tables(data_manager):
+    df = data_manager.calculate_costs(
+        3,
+        2,
+        pd.DataFrame(
+            {
+                "name_desc": ["アクア - Z (ハイブリッド)", "ヤリス - X"],
+                "price": [2_400_000, 1_500_000],
+                "FuelCostPerKilo": [5.5, 8.0],
+                "MonthlyMainteCost": [5000, 4000],
+                "MonthlyInsuranceCost": [6000, 5500],
+                "MonthlyPriceDropRate": [0.01, 0.015],
+            }
+        ),
+    )
+    df_cumulative, df_annual, df_cost_items = data_manager.build_lifecycle_cost_tables(df, [4, 1], 3)
+
+    # 経過年数毎の行がグレード順に並ぶ
+    assert df_cumulative["グレード"].tolist() == ["4. アクア - Z (ハ..."] * 3 + ["1. ヤリス - X..."] * 3
+    assert df_cumulative["経過年数"].tolist() == [1, 2, 3, 1, 2, 3]
+    row = df.iloc[0]
+    expected_cumulative = [
+        row["price"] + year * row["MonthlyTotalCost"] * 12 - row["ResaleValue"] * (year == 3)
+        for year in [1, 2, 3]
+    ]
+    assert df_cumulative["累計出費"].tolist()[:3] == expected_cumulative
+    expected_annual = [row["MonthlyTotalCost"] * 12 - row["ResaleValue"] * (year == 3) for year in [1, 2, 3]]
+    assert df_annual["単年出費"].tolist()[:3] == expected_annual
+
+    # 費用項目はグレード毎に5行
+    assert df_cost_items["費用項目"].tolist()[:5] == ["初期費用", "メンテコスト", "保険料", "燃料費", "売却益"]
+    assert df_cost_items["累計出費"].tolist()[5:] == [
+        df.iloc[1]["price"],
+        df.iloc[1]["MainteCost"],
+        df.iloc[1]["InsuranceCost"],
+        df.iloc[1]["FuelCost"],
+        -df.iloc[1]["ResaleValue"],
+    ]
+
+def test_init_db_upgrades_existing_db(data_manager):
+    # ビューやインデックスが無い既存のDBには、init_DBで追加する
+    DB_MANAGER.execute_script("DROP VIEW GradeCatalog;")
+    data_manager.init_DB()
+
+    names = [row[0] for row in DB_MANAGER.get_data("SELECT name FROM sqlite_master WHERE type IN ('view', 'index')")]
+    assert "GradeCatalog" in names
+    assert "idx_gradeexteriors_gradeid_exteriorid" in names
+
+def test_init_db_adds_missing_tables(data_manager):
+    # 後からcreate_db.sqlに追加したテーブルが無い既存のDBには、init_DBで追加する
+    DB_MANAGER.execute_script("DROP TABLE ReservationCheckpoints;")
+    data_manager.init_DB()
+
+    tables = [row[0] for row in DB_MANAGER.get_data("SELECT name FROM sqlite_master WHERE type = 'table'")]
+    assert "ReservationCheckpoints" in tables
+    assert data_manager._missing_tables_sql() == []
+
+def test_immutable_dataframe_is_read_only_view():
+    df = pd.DataFrame({'col1': [1, 2, 3], 'col2': ['a', 'b', 'a']})
+    immutable_df = ImmutableDataFrame(df)
+
+    # 元データを変更しても影響を受けない
+    df.loc[0, 'col1'] = 100
+    assert immutable_df['col1'].tolist() == [1, 2, 3]
+
+    # to_dataframeはコピーせずに同じバッファを参照する
+    view = immutable_df.to_dataframe()
+    assert np.shares_memory(view['col1'].to_numpy(), immutable_df.to_dataframe()['col1'].to_numpy())
+
+    # バッファは書き込み不可
+    with pytest.raises(ValueError):
+        view.loc[0, 'col1'] = 10
+    with pytest.raises(ValueError):
+        immutable_df['col1'].to_numpy()[0] = 10
+
+    # 列の追加やinplace操作は共有データに影響しない
+    view['col3'] = [7, 8, 9]
+    immutable_df.drop(columns=['col1'], inplace=True)
+    immutable_df.sort_values('col1', ascending=False, inplace=True)
+    assert list(immutable_df.columns) == ['col1', 'col2']
+    assert immutable_df['col1'].tolist() == [1, 2, 3]
+
+def test_compact_frame():
+    df = pd.DataFrame(
+        {
+            "category_name": ["SUV", "セダン"] * 50,
+            "name_desc": [f"grade {i}" for i in range(100)],
+            "model_id": list(range(100)),
+            "price": [3_000_000] * 100,
+            "MonthlyPriceDropRate": [0.01] * 100,
+        }
+    )
+    compacted, report = compact_frame(df)
+
+    # 重複の多い文字列はカテゴリ型、整数は最小の型、浮動小数点はそのまま
+    assert isinstance(compacted["category_name"].dtype, pd.CategoricalDtype)
+    assert compacted["name_desc"].dtype == object
+    assert compacted["model_id"].dtype == np.int8
+    assert compacted["price"].dtype == np.int32
+    assert compacted["MonthlyPriceDropRate"].dtype == np.float64
+    assert report["after"] < report["before"]
+    # 値は変わらない
+    pd.testing.assert_frame_equal(compacted, df, check_dtype=False, check_categorical=False)
+
+
+def test_calculate_costs_on_compacted_frame():
+    # int32に縮めた価格でも、コスト計算はint64で行い結果が変わらない
+    df = pd.DataFrame(
+        {
+            "price": [2_000_000_000, 3_000_000],
+            "FuelCostPerKilo": [10.0, 10.0],
+            "MonthlyMainteCost": [5000.0, 5000.0],
+            "MonthlyInsuranceCost": [5000.0, 5000.0],
+            "MonthlyPriceDropRate": [0.001, 0.01],
+        }
+    )
+    compacted, _ = compact_frame(df)
+    assert compacted["price"].dtype == np.int32
+    manager = DataManager()
+    expected = manager.calculate_costs(30, 2, df.copy())
+    actual = manager.calculate_costs(30, 2, compacted.copy())
+    for column in ("FuelCost", "ResaleValue", "MonthlyTotalCost", "MonthlyRealCost"):
+        assert actual[column].tolist() == expected[column].tolist()
+
+
+def test_grade_lookup(data_manager):
+    df_grades = ImmutableDataFrame(pd.DataFrame({
+        "grade_id": [30, 10, 20],
+        "name_desc": ["アクア - Z", "ヤリス - X", "アクア - Z"],
+    }))
+    grade_lookup = data_manager.get_grade_lookup(df_grades)
+    # 派生データとしてキャッシュされ、同じものが返る
+    assert grade_lookup is data_manager.get_grade_lookup(df_grades)
+
+    assert grade_lookup.position(10) == 1
+    assert 20 in grade_lookup
+    assert 40 not in grade_lookup
+    # 渡した順番のまま行位置を返す
+    assert grade_lookup.positions([20, 30]) == [2, 0]
+    # 表示名が重複する場合は先頭のグレード
+    assert grade_lookup.grade_id("アクア - Z") == 30
+    assert grade_lookup.grade_id("ヤリス - X") == 10
+
+
+def test_option_repository(data_manager):
+    DB_MANAGER.execute_script("""
+    INSERT INTO CarCategories (CategoryName) VALUES ('SUV');
+    INSERT INTO CarModels (ModelName, CategoryID, ImageURL) VALUES ('Model X', 1, 'url1');
+    INSERT INTO CarGrades (GradeName, Description, ModelID) VALUES ('Grade A', 'Description A', 1);
+    INSERT INTO CarGrades (GradeName, Description, ModelID) VALUES ('Grade B', 'Description B', 1);
+    INSERT INTO Exteriors (Item, ImageURL, AdditionalCost) VALUES ('Sunroof', 'exterior_url1', 1500);
+    INSERT INTO Exteriors (Item, ImageURL, AdditionalCost) VALUES ('Spoiler', 'exterior_url2', 2500);
+    INSERT INTO Interiors (Item, ImageURL, AdditionalCost) VALUES ('Leather', 'interior_url', 2000);
+    INSERT INTO GradeExteriors (GradeID, ExteriorID) VALUES (1, 1);
+    INSERT INTO GradeExteriors (GradeID, ExteriorID) VALUES (2, 2);
+    INSERT INTO GradeExteriors (GradeID, ExteriorID) VALUES (2, 1);
+    INSERT INTO GradeInteriors (GradeID, InteriorID) VALUES (2, 1);
+    """)
+    repository = OptionRepository(DB_MANAGER, maxsize=2)
+
+    # 指定したグレードのオプションだけをオプションID順に取得する
+    assert repository.get_exteriors(2)["name"].tolist() == ["Sunroof", "Spoiler"]
+    assert repository.get_exteriors(1)["exterior_id"].tolist() == [1]
+    assert repository.get_interiors(2)["name"].tolist() == ["Leather"]
+    assert repository.get_interiors(1).empty
+    stats = repository.stats()
+    assert stats["misses"] == 4
+    assert stats["evictions"] == 2  # 最大2件を超えたので古いものから破棄
+    assert stats["size"] == 2
+
+    # 2回目以降はキャッシュした行位置の配列から返す
+    assert repository.positions("interior", 2) is repository.positions("interior", 2)
+    assert repository.ids("interior", 2).tolist() == [1]
+    assert repository.stats()["hits"] == 3
+    assert 0 < repository.stats()["hit_rate"] < 1
+    # 破棄したグレードは取得し直す
+    assert repository.ids("exterior", 2).tolist() == [1, 2]
+    assert repository.stats()["misses"] == 5
+
+    # オプション本体は種類毎に1回だけ読み込み、グレード毎には行位置だけを保持する
+    assert len(repository._get_option_table("exterior")[0]) == 2
+    assert all(positions.dtype == np.int32 for positions in repository._cache.values())
+
+    # プロセス共有のリポジトリは同じオブジェクトで、カタログを読み直すとキャッシュを捨てる
+    assert data_manager.get_option_repository() is data_manager.get_option_repository()
+    data_manager.get_option_repository().get_exteriors(2)
+    data_manager.reload_catalog()
+    assert data_manager.get_option_repository().stats()["size"] == 0
+
+def test_init_db_builds_once_under_concurrency(tmp_path):
+    # 同時に初期化しても構築は1回だけで、構築途中のファイルがDBファイルとして見えることは無い
+    import threading
+    import time
+
+    dbname = str(tmp_path / "catalog.db")
+    builds = []
+    seen_during_build = []
+
+    class SlowDataManager(DataManager):
+        def _read_seed_data(self):
+            builds.append(threading.get_ident())
+            time.sleep(0.2)
+            seen_during_build.append(os.path.exists(dbname))
+            yield from super()._read_seed_data()
+
+    def init():
+        manager = SlowDataManager()
+        manager.dbname = dbname
+        manager.init_DB()
+
+    threads = [threading.Thread(target=init) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(builds) == 1
+    assert seen_during_build == [False]
+    # 一時ファイルは残らない
+    assert [path.name for path in tmp_path.iterdir() if ".tmp" in path.name] == []
+    assert SQliteManager(dbname).get_data("SELECT COUNT(*) FROM CarGrades")[0][0] > 0
+
+def test_init_db_removes_temp_file_on_failure(tmp_path):
+    dbname = str(tmp_path / "catalog.db")
+
+    class BrokenDataManager(DataManager):
+        def _read_seed_data(self):
+            yield "CarCategories", (("NoSuchColumn",), [("SUV",)])
+
+    manager = BrokenDataManager()
+    manager.dbname = dbname
+    with pytest.raises(sqlite3.OperationalError):
+        manager.init_DB()
+    assert not os.path.exists(dbname)
+    assert [path.name for path in tmp_path.iterdir() if ".tmp" in path.name] == []
+
+def test_enqueue_user_customization(data_manager):
+    # 書き込みキューに積んだ予約は、キューを閉じるまでにすべてDBに書き込まれる
+    seqs = [
+        data_manager.enqueue_user_customization(f"user{i}", "john@example.com", "Tokyo", np.int64(1), [1], [None], [1, 2])
+        for i in range(3)
+    ]
+    data_manager.close_reservation_queue()
+
+    assert seqs == [1, 2, 3]
+    assert [row[0] for row in DB_MANAGER.get_data("SELECT username FROM Users ORDER BY userid")] == ["user0", "user1", "user2"]
+    assert len(DB_MANAGER.get_data("SELECT * FROM ExteriorCustomizations")) == 6
+    assert DB_MANAGER.get_data("SELECT CommittedSeq FROM ReservationCheckpoints") == [(3,)]
+
+def test_async_data_manager(data_manager):
+    import asyncio
+
+    async def book():
+        return await asyncio.gather(
+            *(
+                data_manager.insert_user_customization_async(f"user{i}", "john@example.com", "Tokyo", 1, [1], [1], [1, 2])
+                for i in range(4)
+            )
+        )
+
+    customization_ids = asyncio.run(book())
+    assert sorted(customization_ids) == [1, 2, 3, 4]
+    assert len(DB_MANAGER.get_data("SELECT * FROM ExteriorCustomizations")) == 8
+
+    # 非同期版の読み込み結果は同期版と同じ
+    expected = data_manager.load_data_from_DB()
+    actual = asyncio.run(data_manager.load_data_from_DB_async())
+    for expected_df, actual_df in zip(expected, actual):
+        pd.testing.assert_frame_equal(actual_df, expected_df)
+    actual = asyncio.run(data_manager.load_data_from_DB_async(include_options=False))
+    assert actual[1] is None and actual[2] is None
@@ -0,0 +1,94 @@
+import json
+import sqlite3
+
+import pyarrow as pa
+from streamlit.proto.Element_pb2 import Element
+
+from benchmarks.load_test import (
+    LoadTestStats,
+    RerunResult,
+    copy_database,
+    data_editor_state,
+    read_arrow_table,
+    slider_state,
+)
+
+
+def test_data_editor_state():
+    state = data_editor_state("editor", [2, 0])
+    # ブラウザが送るのと同じ形式で、チェックした行だけが編集されている
+    assert json.loads(state.string_value) == {
+        "edited_rows": {"2": {"check": True}, "0": {"check": True}},
+        "added_rows": [],
+        "deleted_rows": [],
+    }
+    assert list(slider_state("budget", 3000000.0).double_array_value.data) == [3000000.0]
+
+
+def test_rerun_result_collects_widgets():
+    table = pa.table({"grade_id": [3, 1]})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+
+    result = RerunResult()
+    editor = Element()
+    editor.arrow_data_frame.id = "editor"
+    editor.arrow_data_frame.data = sink.getvalue().to_pybytes()
+    result.add_element(editor)
+    dataframe = Element()
+    dataframe.arrow_data_frame.data = b""  # idが無いのは表示だけのst.dataframe
+    result.add_element(dataframe)
+    selectbox = Element()
+    selectbox.selectbox.id = "category"
+    selectbox.selectbox.label = "カテゴリー"
+    result.add_element(selectbox)
+    error = Element()
+    error.exception.message = "boom"
+    result.add_element(error)
+
+    assert result.widget("selectbox", "カテゴリー").id == "category"
+    assert result.widget("data_editor").id == "editor"
+    assert read_arrow_table(result.widget("data_editor").data).column("grade_id").to_pylist() == [3, 1]
+    assert result.exceptions == ["boom"]
+
+
+def test_load_test_report():
+    stats = LoadTestStats()
+    failed = RerunResult()
+    failed.exceptions.append("boom")
+    stats.record("initial", 0.1, RerunResult())
+    stats.record("category", 0.2, failed)
+    report = stats.report(
+        wall_seconds=2.0,
+        users=2,
+        rss={"start_kb": 1000, "warm_kb": 5000, "peak_kb": 7000, "end_kb": 6000},
+    )
+    assert report["reruns"] == 2
+    assert report["throughput_reruns_per_second"] == 1.0
+    assert report["errors"] == ["category: boom"]
+    # 記録の無い段階は出力しない。処理時間はミリ秒
+    assert set(report["steps"]) == {"initial", "category"}
+    assert abs(report["steps"]["category"]["max"] - 200.0) < 1e-9
+    assert report["rss_per_session_kb"] == 500
+
+
+def test_copy_database_includes_wal(tmp_path):
+    source = str(tmp_path / "source.db")
+    conn = sqlite3.connect(source)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("CREATE TABLE t (id INTEGER)")
+    conn.executemany("INSERT INTO t VALUES (?)", [(i,) for i in range(100)])
+    conn.commit()
+    try:
+        # 接続を開いたままなので、コミット済みの内容はまだWALにだけある
+        assert (tmp_path / "source.db-wal").stat().st_size > 0
+        destination = str(tmp_path / "copy.db")
+        copy_database(source, destination)
+    finally:
+        conn.close()
+    copied = sqlite3.connect(destination)
+    try:
+        assert copied.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 100
+    finally:
+        copied.close()
@@ -1,11 +1,25 @@
 import pytest
 import streamlit as st
-from page_manager.page import UserInputDisplay, SearchResultDisplay, ResultComparison
+from page_manager.page import UserInputDisplay, SearchResultDisplay, ResultComparison, BookAddOptions
 from session_manager.user_session import UserSession
+import data_manager.data_manager as data_manager_module
 from data_manager.data_manager import ImmutableDataFrame
+from data_manager.base_db_manager import remove_sqlite_files
+from benchmarks.load_test import copy_database
+from domain_context.db_config import DB_NAME
 import pandas as pd
 
 
+@pytest.fixture(autouse=True)
+def catalog_db(tmp_path, monkeypatch):
+    # カタログの読み込みでDBの移行やWALの書き込みが起きるので、リポジトリのDBではなくコピーを使う
+    dbname = str(tmp_path / "page.db")
+    copy_database(DB_NAME, dbname)
+    monkeypatch.setattr(data_manager_module, "DB_NAME", dbname)
+    yield dbname
+    remove_sqlite_files(dbname)
+
+
 @pytest.fixture(scope="function")
 def user_session():
     # Streamlitのセッションステートをクリアして初期状態にする
@@ -18,6 +32,7 @@ def user_session():
         "age": None,
         "chosen_grades": None,
         "chosen_index": None,
+        "catalog_version": None,
         "df_models": ImmutableDataFrame(
             pd.DataFrame({"category_name": ["SUV", "Sedan"], "model_id": [1, 2]})
         ),
@@ -90,12 +105,15 @@ def test_search_result_display_postprocess(user_session):
     display.meets_needs = True
     display.edited_df = pd.DataFrame(
         {
-            "check": [True, False],
-            "name_desc": ["1.Model1 - Grade1", "2.Model1 - Grade2"],
+            "check": [False, True, True],
+            "grade_id": [11, 12, 13],
+            "name_desc": ["0.Model1 - Grade1", "1.Model1 - Grade2", "2.Model1 - Grade2"],
         }
     )
     display.postprocess()
-    assert st.session_state["chosen_grades"] == ["Model1 - Grade1"]
+    # 表示名が重複していてもグレードIDで区別できる
+    assert st.session_state["chosen_grades"] == [12, 13]
+    assert st.session_state["chosen_index"] == [1, 2]
 
 
 def test_search_result_display_show(user_session):
@@ -122,12 +140,14 @@ def test_result_comparison_preprocess(user_session):
     # ageとchosen_gradesを設定
     user_session.set_value("age", 5)
     user_session.set_value("hour", 3)
-    user_session.set_value("chosen_grades", ["Grade A", "Grade B"])
+    user_session.set_value("chosen_grades", [2, 1])
+    user_session.set_value("chosen_index", [0, 1])
     user_session.set_value(
         "df_grades",
         ImmutableDataFrame(
             pd.DataFrame(
                 {
+                    "grade_id": [1, 2],
                     "name_desc": ["Grade A", "Grade B"],
                     "price": [1000000, 1200000],
                     "ResaleValue": [800000, 900000],
@@ -145,6 +165,11 @@ def test_result_comparison_preprocess(user_session):
     display = ResultComparison()
     display.preprocess()
     assert not display.df1.empty
+    # 選択した順番（Grade B, Grade A）のまま並ぶ
+    assert display.df3["グレード"].drop_duplicates().tolist() == [
+        "0. Grade B...",
+        "1. Grade A...",
+    ]
     assert not display.df2.empty
     assert not display.df3.empty
 
@@ -153,12 +178,14 @@ def test_result_comparison_show(user_session):
     # ageとchosen_gradesを設定
     user_session.set_value("age", 5)
     user_session.set_value("hour", 3)
-    user_session.set_value("chosen_grades", ["Grade A", "Grade B"])
+    user_session.set_value("chosen_grades", [2, 1])
+    user_session.set_value("chosen_index", [0, 1])
     user_session.set_value(
         "df_grades",
         ImmutableDataFrame(
             pd.DataFrame(
                 {
+                    "grade_id": [1, 2],
                     "name_desc": ["Grade A", "Grade B"],
                     "price": [1000000, 1200000],
                     "ResaleValue": [800000, 900000],
@@ -178,3 +205,18 @@ def test_result_comparison_show(user_session):
     display.show()
     # テストはStreamlitのUIコンポーネントの表示を確認するのが難しいため、ここではエラーが出ないかを確認
     assert True
+
+
+def test_book_add_options_parts_selection(user_session, catalog_db):
+    # グレードのオプションはプロセス共有のOptionRepositoryから引く
+    display = BookAddOptions()
+    assert display.dbname == catalog_db
+    display.target_grade_id = 2
+    display.parts_exterior_selection()
+    display.parts_interior_selection()
+    assert display.df_parts_target["exterior_id"].tolist() == display.get_option_repository().ids("exterior", 2).tolist()
+    assert len(display.df_parts_target) > 0
+    assert len(display.df_parts_interior_target) > 0
+    # 何も選択しなかった場合はNoneを1件登録する
+    assert display.target_parts_ids == [None]
+    assert display.target_parts_interior_ids == [None]
@@ -0,0 +1,241 @@
+import json
+import queue
+import sqlite3
+import threading
+
+import pytest
+
+from data_manager.base_db_manager import SQliteManager
+from data_manager.reservation_queue import ReservationQueue
+from domain_context.db_config import CREATE_TABLES_SQL_PATH
+
+
+@pytest.fixture
+def db_manager(tmp_path):
+    manager = SQliteManager(str(tmp_path / "reservations.db"))
+    # ReservationCheckpointsはアプリのテーブルと一緒にcreate_db.sqlで作成する
+    with open(CREATE_TABLES_SQL_PATH, "r", encoding="utf-8") as f:
+        manager.execute_script(f.read())
+    manager.execute_script("CREATE TABLE Reservations (Name TEXT NOT NULL);")
+    yield manager
+    manager.discard()
+
+
+def write(uow, record):
+    uow.insert_record("Reservations", {"Name": record["name"]})
+
+
+def names(db_manager):
+    return [row[0] for row in db_manager.get_data("SELECT Name FROM Reservations ORDER BY rowid")]
+
+
+def checkpoints(db_manager):
+    return dict(db_manager.get_data("SELECT Journal, CommittedSeq FROM ReservationCheckpoints"))
+
+
+def test_group_commit(db_manager, tmp_path):
+    reservation_queue = ReservationQueue(
+        db_manager, write, str(tmp_path / "journal.jsonl"), batch_size=8, linger_seconds=0.05, fsync=False
+    ).start()
+    seqs = [reservation_queue.put({"name": f"user{i}"}) for i in range(20)]
+    assert seqs == list(range(1, 21))
+    assert reservation_queue.flush(timeout=5)
+
+    assert names(db_manager) == [f"user{i}" for i in range(20)]
+    metrics = reservation_queue.metrics()
+    assert metrics["committed"] == 20
+    assert metrics["depth"] == 0
+    # 複数件を1回のコミットにまとめる
+    assert metrics["batches"] < 20
+    assert metrics["max_batch_size"] <= 8
+    # すべてコミットしたらジャーナルは空になり、DBに最後の連番が残る
+    assert (tmp_path / "journal.jsonl").read_text() == ""
+    assert checkpoints(db_manager) == {"journal.jsonl": 20}
+    reservation_queue.close()
+
+
+def test_recovers_uncommitted_records(db_manager, tmp_path):
+    # DBに記録したコミット済みの連番より後のレコードだけを再投入し、書きかけの最後の行は捨てる
+    journal_path = tmp_path / "journal.jsonl"
+    journal_path.write_text(
+        "".join(json.dumps({"seq": seq, "record": {"name": f"user{seq}"}}) + "\n" for seq in (1, 2, 3))
+        + '{"seq": 4, "rec'
+    )
+    with db_manager.transaction() as uow:
+        uow.execute("INSERT INTO ReservationCheckpoints (Journal, CommittedSeq) VALUES ('journal.jsonl', 1)")
+
+    reservation_queue = ReservationQueue(db_manager, write, str(journal_path), fsync=False).start()
+    assert reservation_queue.flush(timeout=5)
+    assert names(db_manager) == ["user2", "user3"]
+    # 連番は続きから振る
+    assert reservation_queue.put({"name": "user4"}) == 4
+    reservation_queue.close()
+    assert names(db_manager) == ["user2", "user3", "user4"]
+
+
+def test_backpressure(db_manager, tmp_path):
+    blocker = threading.Event()
+
+    def blocking_write(uow, record):
+        blocker.wait(5)
+        write(uow, record)
+
+    reservation_queue = ReservationQueue(
+        db_manager,
+        blocking_write,
+        str(tmp_path / "journal.jsonl"),
+        maxsize=2,
+        batch_size=1,
+        linger_seconds=0,
+        put_timeout=0.1,
+        fsync=False,
+    ).start()
+    # 1件目は書き込み中、2・3件目で一杯になり、4件目は空きを待ちきれずに拒否される
+    reservation_queue.put({"name": "user1"})
+    assert reservation_queue.flush(timeout=0.1) is False
+    reservation_queue.put({"name": "user2"})
+    reservation_queue.put({"name": "user3"})
+    with pytest.raises(queue.Full):
+        reservation_queue.put({"name": "user4"})
+
+    blocker.set()
+    assert reservation_queue.flush(timeout=5)
+    metrics = reservation_queue.metrics()
+    assert metrics["rejected"] == 1
+    assert metrics["blocked"] == 1
+    assert metrics["max_depth"] == 3
+    assert names(db_manager) == ["user1", "user2", "user3"]
+    reservation_queue.close()
+
+
+def test_failed_record_is_set_aside(db_manager, tmp_path):
+    reservation_queue = ReservationQueue(
+        db_manager, write, str(tmp_path / "journal.jsonl"), batch_size=8, linger_seconds=0.05, fsync=False
+    ).start()
+    reservation_queue.put({"name": "user1"})
+    reservation_queue.put({"name": None})  # NOT NULL制約違反
+    reservation_queue.put({"name": "user3"})
+    reservation_queue.close()
+
+    # 失敗したレコードだけを退避し、他のレコードは書き込む
+    assert names(db_manager) == ["user1", "user3"]
+    assert reservation_queue.metrics()["failed"] == 1
+    failed = [json.loads(line) for line in (tmp_path / "journal.jsonl.failed").read_text().splitlines()]
+    assert [entry["seq"] for entry in failed] == [2]
+
+
+def test_replay_after_crash_does_not_duplicate(db_manager, tmp_path):
+    journal_path = str(tmp_path / "journal.jsonl")
+    reservation_queue = ReservationQueue(db_manager, write, journal_path, fsync=False).start()
+    reservation_queue.put({"name": "user1"})
+    reservation_queue.put({"name": "user2"})
+    assert reservation_queue.flush(timeout=5)
+    reservation_queue.close()
+
+    # コミット後、ジャーナルを空にする前に落ちた状態を再現する
+    (tmp_path / "journal.jsonl").write_text(
+        "".join(json.dumps({"seq": seq, "record": {"name": f"user{seq}"}}) + "\n" for seq in (1, 2))
+    )
+    reservation_queue = ReservationQueue(db_manager, write, journal_path, fsync=False).start()
+    assert reservation_queue.depth() == 0
+    assert reservation_queue.put({"name": "user3"}) == 3
+    reservation_queue.close()
+    assert names(db_manager) == ["user1", "user2", "user3"]
+
+
+def test_each_process_uses_its_own_journal(db_manager, tmp_path):
+    # ロックされているジャーナルは使わず、別のジャーナルと連番を使う
+    journal_path = str(tmp_path / "journal.jsonl")
+    first = ReservationQueue(db_manager, write, journal_path, fsync=False).start()
+    second = ReservationQueue(db_manager, write, journal_path, fsync=False).start()
+    assert first.journal_path == journal_path
+    assert second.journal_path == journal_path + ".1"
+
+    first.put({"name": "first1"})
+    second.put({"name": "second1"})
+    assert first.flush(timeout=5) and second.flush(timeout=5)
+    first.close()
+    second.close()
+    assert sorted(names(db_manager)) == ["first1", "second1"]
+    assert checkpoints(db_manager) == {"journal.jsonl": 1, "journal.jsonl.1": 1}
+
+    # 閉じたジャーナルは再び使える
+    reservation_queue = ReservationQueue(db_manager, write, journal_path, fsync=False).start()
+    assert reservation_queue.journal_path == journal_path
+    reservation_queue.close()
+
+
+def test_writer_retries_after_error(db_manager, tmp_path):
+    reservation_queue = ReservationQueue(
+        db_manager, write, str(tmp_path / "journal.jsonl"), retry_seconds=0.01, fsync=False
+    )
+    write_failed = reservation_queue._write_failed
+    calls = []
+
+    def flaky_write_failed(seq, record, error):
+        calls.append(seq)
+        if len(calls) == 1:
+            raise OSError("disk full")
+        write_failed(seq, record, error)
+
+    reservation_queue._write_failed = flaky_write_failed
+    reservation_queue.start()
+    reservation_queue.put({"name": "user1"})
+    reservation_queue.put({"name": None})  # NOT NULL制約違反
+    reservation_queue.put({"name": "user3"})
+    assert reservation_queue.flush(timeout=5)
+
+    # 書き込みスレッドは止まらず、失敗したバッチの未コミットのレコードだけを書き込み直す
+    metrics = reservation_queue.metrics()
+    assert metrics["writer_alive"]
+    assert metrics["errors"] == 1
+    assert metrics["failed"] == 1
+    assert names(db_manager) == ["user1", "user3"]
+    reservation_queue.put({"name": "user4"})
+    reservation_queue.close()
+    assert names(db_manager) == ["user1", "user3", "user4"]
+
+
+def test_locked_database_is_retried_not_set_aside(db_manager, tmp_path):
+    attempts = []
+
+    def locked_write(uow, record):
+        attempts.append(record["name"])
+        if len(attempts) <= 3:
+            raise sqlite3.OperationalError("database is locked")
+        write(uow, record)
+
+    reservation_queue = ReservationQueue(
+        db_manager,
+        locked_write,
+        str(tmp_path / "journal.jsonl"),
+        batch_size=8,
+        linger_seconds=0.05,
+        retry_seconds=0.01,
+        retry_max_seconds=0.02,
+        fsync=False,
+    ).start()
+    reservation_queue.put({"name": "user1"})
+    reservation_queue.put({"name": "user2"})
+    assert reservation_queue.flush(timeout=5)
+
+    # ロックなどの一時的なエラーは退避せず、待つ時間を延ばしながらバッチごと書き込み直す
+    metrics = reservation_queue.metrics()
+    assert metrics["errors"] == 3
+    assert metrics["failed"] == 0
+    assert "database is locked" in metrics["last_error"]
+    assert not (tmp_path / "journal.jsonl.failed").exists()
+    assert names(db_manager) == ["user1", "user2"]
+    assert reservation_queue._consecutive_errors == 0
+    reservation_queue.close()
+
+
+def test_retry_delay_backs_off(db_manager, tmp_path, capsys):
+    reservation_queue = ReservationQueue(
+        db_manager, write, str(tmp_path / "journal.jsonl"), retry_seconds=1.0, retry_max_seconds=3.0
+    )
+    reservation_queue._closed = True  # close済みなので待たずに戻る
+    for _ in range(4):
+        assert reservation_queue._retry_later([], sqlite3.OperationalError("database is locked")) is False
+    # 続けて失敗するたびに待つ時間を2倍にし、retry_max_secondsで止める
+    assert [line.split("retrying in ")[1].split("s:")[0] for line in capsys.readouterr().out.splitlines()] == ["1.0", "2.0", "3.0", "3.0"]
@@ -0,0 +1,100 @@
+import json
+import os
+import pytest
+from data_manager.snapshot import CatalogSnapshot
+from data_manager.data_manager import DataManager, SEED_TABLES
+from data_manager.base_db_manager import SQliteManager
+
+
+@pytest.fixture(scope="function")
+def seed_json(tmp_path):
+    # 全テーブルに1行ずつ入った初期データ
+    data = {
+        "CarCategories": [{"CategoryName": "SUV"}],
+        "CarModels": [{"ModelName": "Model X", "CategoryID": 1, "ImageURL": "url1"}],
+        "CarGrades": [{"GradeName": "Grade A", "Description": "Description A", "ModelID": 1}],
+        "Engines": [{"EngineType": "V8"}],
+        "Bases": [
+            {
+                "GradeID": 1,
+                "EngineID": 1,
+                "BasePrice": 50000,
+                "Rank": 1,
+                "FuelEfficiency": 15.0,
+                "FuelCostPerKilo": 0.1,
+                "MonthlyMainteCost": 100.0,
+                "MonthlyInsuranceCost": 200.0,
+                "MonthlyParkingCost": 300.0,
+                "MonthlyPriceDropRate": 0.05,
+            }
+        ],
+        "Colors": [{"ColorName": "Red", "ImageURL": "color_url", "AdditionalCost": 1000}],
+        "Exteriors": [{"Item": "Sunroof", "ImageURL": "exterior_url", "AdditionalCost": 1500}],
+        "GradeExteriors": [{"GradeID": 1, "ExteriorID": 1}],
+        "Interiors": [{"Item": "Leather", "ImageURL": "interior_url", "AdditionalCost": 2000}],
+        "GradeInteriors": [{"GradeID": 1, "InteriorID": 1}],
+    }
+    path = tmp_path / "seed.json"
+    path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+    return str(path), data
+
+
+def test_export_and_read_snapshot(tmp_path, seed_json):
+    json_path, data = seed_json
+    snapshot = CatalogSnapshot(str(tmp_path / "snapshot"))
+    assert not snapshot.is_valid(json_path)
+
+    row_counts = snapshot.export_json(json_path)
+    assert row_counts["Bases"] == 1
+    assert snapshot.is_valid(json_path)
+
+    columns, rows = snapshot.iter_rows("Bases")
+    assert columns == list(data["Bases"][0].keys())
+    assert list(rows) == [tuple(data["Bases"][0].values())]
+    assert snapshot.read_table("CarModels", memory_map=False).to_pylist() == data["CarModels"]
+
+    # jsonが更新された場合はスナップショットを使わない
+    with open(json_path, "a", encoding="utf-8") as f:
+        f.write("\n")
+    assert not snapshot.is_valid(json_path)
+
+
+def test_snapshot_is_split_into_batches(tmp_path):
+    json_path = tmp_path / "seed.json"
+    records = [{"Item": f"item{i}", "AdditionalCost": i} for i in range(2500)]
+    json_path.write_text(json.dumps({"Exteriors": records}), encoding="utf-8")
+    snapshot = CatalogSnapshot(str(tmp_path / "snapshot"))
+    snapshot.export_json(str(json_path), batch_rows=1000)
+
+    # テーブルを複数のレコードバッチに分けて保存し、iter_rowsはバッチ毎に変換する
+    assert [batch.num_rows for batch in snapshot.read_table("Exteriors").to_batches()] == [1000, 1000, 500]
+    columns, rows = snapshot.iter_rows("Exteriors")
+    assert columns == ["Item", "AdditionalCost"]
+    assert list(rows) == [(record["Item"], record["AdditionalCost"]) for record in records]
+
+
+def test_shipped_snapshot_uses_small_batches():
+    snapshot = CatalogSnapshot()
+    for table in SEED_TABLES:
+        assert max(batch.num_rows for batch in snapshot.read_table(table).to_batches()) <= 1024
+
+
+def test_init_db_from_snapshot(tmp_path, seed_json):
+    json_path, _ = seed_json
+    snapshot_path = str(tmp_path / "snapshot")
+    CatalogSnapshot(snapshot_path).export_json(json_path)
+
+    def build(dbname, db_snapshot_path):
+        manager = DataManager()
+        manager.dbname = dbname
+        manager.db_json_data_path = json_path
+        manager.db_snapshot_path = db_snapshot_path
+        manager.init_DB()
+        return SQliteManager(dbname)
+
+    from_snapshot = build(str(tmp_path / "snapshot.db"), snapshot_path)
+    from_json = build(str(tmp_path / "json.db"), str(tmp_path / "missing"))
+    for table in SEED_TABLES:
+        assert from_snapshot.get_data(f"SELECT * FROM {table}") == from_json.get_data(f"SELECT * FROM {table}")
+    from_snapshot.close()
+    from_json.close()
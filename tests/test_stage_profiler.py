@@ -0,0 +1,52 @@
+import json
+import pytest
+from page_manager.stage_profiler import LatencyHistogram, StageProfiler
+
+
+def test_latency_histogram_percentiles():
+    histogram = LatencyHistogram(min_seconds=1e-6, growth=1.1)
+    # 1ms〜100msを1msずつ記録
+    for i in range(1, 101):
+        histogram.record(i / 1000)
+
+    summary = histogram.summary()
+    assert summary["count"] == 100
+    assert summary["max"] == pytest.approx(0.1)
+    # バケットの上限で近似するので、相対誤差は倍率(1.1)以内
+    assert 0.050 <= summary["p50"] <= 0.050 * 1.1
+    assert 0.095 <= summary["p95"] <= 0.095 * 1.1
+    assert 0.099 <= summary["p99"] <= 0.1
+
+
+def test_latency_histogram_empty():
+    assert LatencyHistogram().percentile(99) == 0.0
+
+
+def test_stage_profiler_measure_and_dump(tmp_path):
+    profiler = StageProfiler(enabled=True)
+    with profiler.measure("SearchResultDisplay", "show"):
+        pass
+    # 例外が発生した場合も記録する
+    with pytest.raises(ValueError):
+        with profiler.measure("SearchResultDisplay", "preprocess"):
+            raise ValueError()
+
+    summary = profiler.summary()
+    assert summary["SearchResultDisplay"]["show"]["count"] == 1
+    assert summary["SearchResultDisplay"]["preprocess"]["count"] == 1
+    assert {row["stage"] for row in profiler.rows()} == {"show", "preprocess"}
+
+    path = tmp_path / "stage_timings.json"
+    profiler.dump(path)
+    with open(path, encoding="utf-8") as f:
+        assert json.load(f)["pages"] == summary
+
+    profiler.reset()
+    assert profiler.summary() == {}
+
+
+def test_stage_profiler_disabled():
+    profiler = StageProfiler(enabled=False)
+    with profiler.measure("UserInputDisplay", "show"):
+        pass
+    assert profiler.summary() == {}
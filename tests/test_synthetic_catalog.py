@@ -0,0 +1,51 @@
+import sqlite3
+from benchmarks.synthetic_catalog import SyntheticCatalog
+from benchmarks.catalog_scaling import count_rows
+from data_manager.snapshot import CatalogSnapshot
+
+
+def test_row_counts_match_generated_rows():
+    catalog = SyntheticCatalog(scale=2, chunk_size=100)
+    assert count_rows(catalog.tables()) == catalog.row_counts()
+    # 外装はグレード毎に平均40件程度
+    counts = catalog.row_counts()
+    assert 20 < counts["Exteriors"] / counts["CarGrades"] < 60
+
+
+def test_same_seed_generates_same_rows():
+    first = dict(SyntheticCatalog(scale=1, seed=1).tables())
+    second = dict(SyntheticCatalog(scale=1, seed=1).tables())
+    assert list(first["Bases"][1]) == list(second["Bases"][1])
+
+
+def test_write_sqlite(tmp_path):
+    path = str(tmp_path / "synthetic.db")
+    catalog = SyntheticCatalog(scale=2, chunk_size=100)
+    row_counts = catalog.write_sqlite(path)
+
+    conn = sqlite3.connect(path)
+    for table, count in row_counts.items():
+        assert conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] == count
+    # 外部キーがすべて存在する行を参照している
+    assert conn.execute("PRAGMA foreign_key_check").fetchall() == []
+    # グレードの説明文とベースのエンジンが一致する
+    mismatched = conn.execute("""
+        SELECT COUNT(*) FROM CarGrades JOIN Bases ON Bases.GradeID = CarGrades.GradeID
+        JOIN Engines ON Engines.EngineID = Bases.EngineID
+        WHERE CarGrades.Description NOT LIKE Engines.EngineType || '／%'
+    """).fetchone()[0]
+    assert mismatched == 0
+    assert conn.execute("SELECT COUNT(*) FROM GradeCatalog").fetchone()[0] == row_counts["CarGrades"]
+    conn.close()
+
+
+def test_write_arrow(tmp_path):
+    catalog = SyntheticCatalog(scale=1, chunk_size=1000)
+    row_counts = catalog.write_arrow(str(tmp_path))
+    assert row_counts == catalog.row_counts()
+
+    snapshot = CatalogSnapshot(str(tmp_path))
+    assert snapshot.manifest()["row_counts"] == row_counts
+    columns, rows = snapshot.iter_rows("GradeExteriors")
+    assert list(columns) == ["GradeID", "ExteriorID"]
+    assert sum(1 for _ in rows) == row_counts["GradeExteriors"]